@@ -1,23 +1,48 @@
-import json  # Сериализация объектов в JSON для шаблона
+import atexit  # Сброс очереди событий при завершении процесса
+import functools  # Кэширование результатов небольших чистых функций
+import hashlib  # Короткие хэши готовых JSON-ответов для ETag
+import itertools  # Потокобезопасные счетчики опросов для выборочного логирования
 import logging  # Настройка логирования событий приложения
 import os  # Работа с переменными окружения
+import queue  # Очередь записей сервисного лога между запросами и потоком записи в файл
+import random  # Случайный разброс пауз переподключения
 import sqlite3  # Работа с базой SQLite для логов
 import threading  # Запуск фонового потока лонгпулла
+import time  # Монотонные часы для коротких кэшей ответов
+from concurrent.futures import ThreadPoolExecutor  # Параллельные стартовые запросы к VK API
+from collections import OrderedDict, defaultdict, deque  # Ограниченные кэши профилей, счетчики опросов и очередь строк для пакетной записи в базу
+from contextlib import contextmanager  # Выдача соединений чтения из пула через with
 from pathlib import Path  # Удобная работа с путями и иерархией директорий
+from types import MappingProxyType  # Неизменяемое представление справочников
 from urllib.parse import urlparse  # Разбор URL для выбора имени файла
 from dataclasses import dataclass, field  # Упрощенное объявление классов состояния
 from datetime import datetime, timedelta  # Фиксация времени событий и диапазонов
-from typing import Dict, List, Optional  # Подсказки типов для словарей и списков
+from typing import Deque, Dict, Iterator, List, Optional  # Подсказки типов для словарей, списков, очередей и генераторов
 
-from logging.handlers import RotatingFileHandler  # Обработчик логов с ротацией файлов
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler  # Обработчик логов с ротацией файлов и вынос записи в фоновый поток
 
 from dotenv import load_dotenv  # Загрузка переменных окружения из .env
-from flask import Flask, jsonify, render_template, request, send_from_directory  # Веб-сервер, рендер, разбор запросов и отдача файлов
+from flask import Flask, Response, render_template, request, send_from_directory  # Веб-сервер, рендер, разбор запросов и отдача файлов
+from flask.json.provider import DefaultJSONProvider  # Базовый JSON-провайдер Flask для jsonify и фильтра tojson
+from markupsafe import Markup  # Безопасная вставка готового JSON в шаблон без повторного экранирования
+import orjson  # Быстрая сериализация JSON на горячих путях записи и чтения логов
 import requests  # Загрузка файлов вложений по URL
 try:  # Пробуем подключить дополнительный загрузчик видео
     import yt_dlp as ytdlp  # yt-dlp позволяет скачивать видео по ссылке на плеер VK
 except Exception:  # Отлавливаем любую ошибку импорта
     ytdlp = None  # Сохраняем None, чтобы код знал об отсутствии зависимости
+try:  # Пробуем подключить сжатие больших JSON-колонок
+    import zstandard  # zstd сжимает payload и вложения в 4-6 раз
+except Exception:  # Отлавливаем любую ошибку импорта
+    zstandard = None  # Без модуля JSON хранится обычным текстом
+try:  # Пробуем подключить боевой WSGI-сервер
+    from gunicorn.app.base import BaseApplication as GunicornApplication  # gunicorn есть только на Linux и в Docker
+except Exception:  # На Windows gunicorn не ставится
+    GunicornApplication = None  # Тогда пробуем waitress
+try:  # Пробуем подключить WSGI-сервер для Windows
+    import waitress  # waitress работает без fork и ставится на Windows
+except Exception:  # Отлавливаем любую ошибку импорта
+    waitress = None  # Без обоих серверов запускаем встроенный сервер Flask
 import vk_api  # Клиент VK API
 from vk_api.bot_longpoll import VkBotEventType, VkBotLongPoll  # Лонгпулл сообщества для чтения событий
 
@@ -27,7 +52,7 @@ logging.basicConfig(level=logging.INFO, format="[%(asctime)s] %(levelname)s: %(m
 logger = logging.getLogger(__name__)  # Получаем логгер для текущего модуля
 service_event_logger = None  # Плейсхолдер для логгера сервисных событий в базе
 
-SERVICE_STATUS_EXPLANATIONS = {  # Справочник кодов статусов с пояснениями
+SERVICE_STATUS_EXPLANATIONS = MappingProxyType({  # Справочник кодов статусов с пояснениями, защищенный от изменения
     200: "Успех: запрос обработан корректно",  # Человекочитаемое описание коду 200
     201: "Создано: добавлен новый ресурс",  # Пояснение для кода 201
     204: "Нет контента: тело ответа пустое",  # Пояснение для кода 204
@@ -46,7 +71,78 @@ SERVICE_STATUS_EXPLANATIONS = {  # Справочник кодов статус
     502: "Плохой шлюз: ошибка на промежуточном сервере",  # Описание для кода 502
     503: "Сервис недоступен: попробуйте позже",  # Описание для кода 503
     504: "Гейтвей не дождался ответа: истёк таймаут",  # Описание для кода 504
-}  # Справочник кодов и русских пояснений для сервисных логов
+})  # Справочник кодов и русских пояснений для сервисных логов
+
+def dump_json(value: object) -> str:  # Быстрая сериализация объекта в JSON-строку для хранения в базе
+    return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")  # orjson не экранирует кириллицу, как json.dumps(ensure_ascii=False)
+
+
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"  # Первые байты любого zstd-кадра
+ZSTD_MIN_SIZE = 512  # JSON короче этого порога не сжимаем: выигрыш меньше накладных расходов
+_zstd_local = threading.local()  # Компрессор и декомпрессор zstd нельзя делить между потоками
+
+
+def pack_json(value: object):  # Сериализация больших JSON-колонок с необязательным сжатием
+    """Возвращает JSON-текст или сжатый zstd BLOB, если модуль доступен и данные достаточно большие."""
+
+    encoded = orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)  # Сериализуем сразу в байты
+    if zstandard is None or len(encoded) < ZSTD_MIN_SIZE:  # Без модуля или для маленьких значений
+        return encoded.decode("utf-8")  # Храним обычный текст
+    compressor = getattr(_zstd_local, "compressor", None)  # Компрессор текущего потока
+    if compressor is None:  # Первый вызов в этом потоке
+        compressor = _zstd_local.compressor = zstandard.ZstdCompressor(level=3)  # Создаем и запоминаем
+    return compressor.compress(encoded)  # SQLite сохранит bytes как BLOB
+
+
+def unpack_json(stored: object):  # Чтение JSON-колонки, записанной текстом или сжатым BLOB
+    """Возвращает JSON-текст или байты, пригодные для orjson.loads; сжатые значения распаковываются."""
+
+    if isinstance(stored, bytes) and stored[:4] == ZSTD_MAGIC:  # Значение сжато zstd
+        if zstandard is None:  # Модуль пропал после записи
+            raise RuntimeError("Для чтения сжатых логов нужен модуль zstandard")  # Явно сообщаем о причине
+        decompressor = getattr(_zstd_local, "decompressor", None)  # Декомпрессор текущего потока
+        if decompressor is None:  # Первый вызов в этом потоке
+            decompressor = _zstd_local.decompressor = zstandard.ZstdDecompressor()  # Создаем и запоминаем
+        return decompressor.decompress(stored)  # Возвращаем JSON в байтах
+    return stored  # Старые строки хранятся текстом и отдаются как есть
+
+
+def json_bytes(value: object) -> bytes:  # Сериализация тела JSON-ответа
+    """Сериализует объект сразу в байты с теми же опциями, что у OrjsonProvider."""
+
+    return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)  # Байты без промежуточной строки
+
+
+def json_response(value: object = None, body: object = None) -> Response:  # Единый JSON-ответ для всех API
+    """Отдает объект, сериализованный orjson, или уже готовое тело: байты, строку или поток частей."""
+
+    return Response(json_bytes(value) if body is None else body, mimetype="application/json")  # Одинаковый mimetype у всех JSON-ответов
+
+
+def embed_json(text: str) -> Markup:  # Готовый JSON для вставки в <script>
+    """Экранирует уже сериализованный JSON так же, как фильтр |tojson, чтобы не сериализовать данные повторно."""
+
+    return Markup(text.replace("<", "\\u003c").replace(">", "\\u003e").replace("&", "\\u0026").replace("'", "\\u0027"))  # Те же замены, что в htmlsafe_json_dumps
+
+
+class OrjsonProvider(DefaultJSONProvider):  # JSON-провайдер Flask на orjson для jsonify и |tojson в шаблонах
+    sort_keys = False  # Порядок ключей фронтенду не важен, сортировка только тратит время
+
+    def dumps(self, obj: object, **kwargs: object) -> str:  # Сериализация для ответов и встраивания данных в шаблоны
+        return orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")  # Неизвестные типы отдаем стандартному обработчику Flask
+
+    def loads(self, s: object, **kwargs: object) -> object:  # Разбор JSON из тела запросов
+        return orjson.loads(s)  # orjson принимает и str, и bytes
+
+
+@functools.lru_cache(maxsize=64)  # Пачка событий обычно приходит в пределах одной секунды, строку достаточно собрать один раз
+def format_local_timestamp(epoch_seconds: int) -> str:  # Переводит UNIX-время в локальную ISO-строку с таймзоной
+    return datetime.fromtimestamp(epoch_seconds).astimezone().isoformat()  # Смещение берется на момент события, поэтому переход на летнее время учитывается
+
+
+def now_local_timestamp() -> str:  # Текущее локальное время в ISO с точностью до секунды
+    return format_local_timestamp(int(time.time()))  # Переиспользуем строку, уже собранную в эту секунду
+
 
 def safe_int_env(value: Optional[str], fallback: int) -> int:  # Функция безопасного приведения переменных окружения к int
     try:  # Пробуем выполнить приведение типов
@@ -55,20 +151,88 @@ def safe_int_env(value: Optional[str], fallback: int) -> int:  # Функция
         return fallback  # Возвращаем запасной вариант
 
 
+def parse_optional_int(raw: Optional[str]) -> Optional[int]:  # Разбор необязательного числового параметра запроса
+    try:  # Пробуем выполнить приведение типов
+        return int(raw) if raw else None  # Пустой параметр означает отсутствие фильтра
+    except ValueError:  # Нечисловое значение из адресной строки
+        return None  # Считаем фильтр не заданным вместо ошибки 500
+
+
+def parse_bounded_int(raw: Optional[str], default: int, low: int, high: int) -> int:  # Разбор лимитов и смещений из запроса
+    value = parse_optional_int(raw)  # Число или None для пустого и некорректного значения
+    if value is None:  # Параметр не передан или не число
+        return default  # Берем значение по умолчанию
+    return low if value < low else high if value > high else value  # Зажимаем значение в допустимые границы
+
+
 DEFAULT_TIMELINE_MINUTES = safe_int_env(os.getenv("TIMELINE_DEFAULT_MINUTES"), 1440)  # Диапазон минут по умолчанию для графика
+EVENT_DB_KEEP = safe_int_env(os.getenv("EVENT_DB_KEEP"), 0)  # Сколько последних строк событий хранить в базе; 0 — хранить всё
+EVENT_RETENTION_INTERVAL = 3600.0  # Как часто фоновый поток обрезает старые события, секунды
+SERVICE_LOG_SAMPLE = max(1, safe_int_env(os.getenv("SERVICE_LOG_SAMPLE"), 100))  # Каждый какой успешный опрос API попадает в сервисный лог
 ATTACHMENTS_ROOT = Path(os.getenv("ATTACHMENTS_DIR") or os.path.join(os.getcwd(), "data", "attachments")).resolve()  # Базовая папка для вложений, доступная через веб
 ATTACHMENTS_ROOT.mkdir(parents=True, exist_ok=True)  # Создаем директорию вложений, если её нет
 STICKER_CACHE_DIR = ATTACHMENTS_ROOT / "stickers"  # Отдельная папка для кэширования стикеров по их ID
 STICKER_CACHE_DIR.mkdir(parents=True, exist_ok=True)  # Создаем папку кэша стикеров, чтобы можно было сохранять старые наклейки
 MESSAGES_PAGE_SIZE = 50  # Размер страницы для постраничной подгрузки сообщений
+EVENT_FLUSH_INTERVAL = 0.1  # Период фонового сброса накопленных событий в базу, секунды
+EVENT_FLUSH_BATCH = 200  # Размер пачки, при котором сброс запускается досрочно
+STORAGE_CACHE_TTL = 2.0  # Время жизни кэша описания файла базы, секунды
+STATS_CACHE_TTL = 1.0  # Время жизни кэша статистики дашборда, секунды
+OVERVIEW_CACHE_TTL = 0.5  # Время жизни кэша обзора сообщества и диалогов, секунды
+LOGS_CACHE_TTL = 5.0  # Сколько живет готовая первая страница /api/logs, если база не менялась, секунды
+EVENTS_SCHEMA_VERSION = 2  # Версия схемы таблицы events в PRAGMA user_version; повышать при каждой новой колонке или индексе
+SQLITE_MMAP_SIZE = 256 * 1024 * 1024  # Сколько байт файла базы SQLite читает через mmap вместо read()
+READ_POOL_SIZE = 4  # Сколько свободных соединений чтения держим открытыми
+MEMBER_EVENT_TYPES = tuple(  # Типы событий участников, которые есть в установленной версии vk_api
+    VkBotEventType[name] for name in ("CHAT_INVITE_USER", "CHAT_KICK_USER") if name in VkBotEventType.__members__
+)
+LONGPOLL_BACKOFF_MAX = 30.0  # Максимальная пауза между попытками переподключения лонгпулла, секунды
+PROFILE_CACHE_LIMIT = 5000  # Максимум профилей в каждом кэше монитора, давно не встречавшиеся вытесняются
+MESSAGE_COLUMNS = (  # Колонки ленты сообщений; порядок важен для распаковки в serialize_log, reply_to устарел и не читается
+    "id, created_at, event_type, peer_id, peer_title, peer_avatar, from_id, from_name, from_avatar, message_id, "
+    "reply_message_id, reply_message_text, reply_message_attachments, reply_message_from_id, reply_message_from_name, "
+    "reply_message_from_avatar, is_bot, text, payload"
+)
+PEERS_SELECT_SQL = "SELECT DISTINCT peer_id, peer_title, peer_avatar FROM events WHERE peer_id IS NOT NULL ORDER BY peer_id"  # Запрос уникальных чатов с названиями и аватарами
+REPLY_BACKFILL_SQL = """
+    UPDATE events
+    SET reply_message_id = COALESCE(reply_message_id, json_extract(payload, '$.reply_message.id')),
+        reply_message_text = COALESCE(reply_message_text, json_extract(payload, '$.reply_message.text')),
+        reply_message_attachments = COALESCE(
+            reply_message_attachments,
+            CASE json_type(payload, '$.reply_message.attachments') WHEN 'array' THEN json_extract(payload, '$.reply_message.attachments') ELSE '[]' END
+        ),
+        reply_message_from_id = COALESCE(reply_message_from_id, json_extract(payload, '$.reply_message.from_id')),
+        reply_message_from_name = COALESCE(reply_message_from_name, json_extract(payload, '$.reply_message.from_name')),
+        reply_message_from_avatar = COALESCE(reply_message_from_avatar, json_extract(payload, '$.reply_message.from_avatar'))
+    WHERE event_type = 'message'
+      AND (reply_message_id IS NULL OR reply_message_text IS NULL OR reply_message_attachments IS NULL)
+      AND json_type(CASE WHEN typeof(payload) <> 'text' THEN NULL WHEN json_valid(payload) THEN payload END, '$.reply_message') = 'object'
+"""  # Перенос полей ответа из payload в колонки одним запросом; сжатые BLOB и битый JSON пропускаются, их новые строки и так пишут с колонками
+TIMELINE_BUCKETS_SQL = """
+    SELECT (unix_time - ?) / ? AS bucket, COUNT(*) AS cnt
+    FROM (
+        SELECT CAST(strftime('%s', created_at) AS INTEGER) AS unix_time
+        FROM events
+        WHERE event_type = ? AND created_at >= ?
+    )
+    WHERE unix_time >= ?
+    GROUP BY bucket
+"""  # Количество сообщений по корзинам графика; strftime учитывает смещение таймзоны в ISO-строке, нераспознанное время отсекается
+EVENT_INSERT_SQL = """
+    INSERT INTO events (created_at, event_type, peer_id, peer_title, peer_avatar, from_id, from_name, from_avatar, message_id, reply_to, reply_message_id, reply_message_text, reply_message_attachments, reply_message_from_id, reply_message_from_name, reply_message_from_avatar, is_bot, text, payload)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""  # SQL вставки события, общий для одиночной и пакетной записи; вложения берутся из payload, колонка attachments осталась только у старых строк
+SERVICE_EVENT_INSERT_SQL = "INSERT INTO service_events (created_at, event_type, status_code, description, message) VALUES (?, ?, ?, ?, ?)"  # SQL пакетной вставки сервисных событий
 
 
 class ServiceContextFilter(logging.Filter):  # Фильтр для добавления обязательных полей
     """Гарантирует наличие полей статуса в каждой записи сервисного логгера."""
 
     def filter(self, record: logging.LogRecord) -> bool:  # Вызывается для каждой записи перед обработкой
-        record.status_code = getattr(record, "status_code", 0)  # Подставляем код ответа по умолчанию
-        record.status_description = getattr(record, "status_description", "Сервисное сообщение")  # Добавляем пояснение
+        if "status_description" not in record.__dict__:  # log_service_event передает оба поля, сюда попадают только прямые вызовы логгера
+            record.status_code = getattr(record, "status_code", 0)  # Подставляем код ответа по умолчанию
+            record.status_description = "Сервисное сообщение"  # Добавляем пояснение
         return True  # Запись пропускаем дальше
 
 
@@ -87,7 +251,21 @@ def build_service_logger() -> logging.Logger:  # Конструирует сер
     formatter = logging.Formatter("[%(asctime)s] %(levelname)s %(status_code)s (%(status_description)s): %(message)s")  # Формат с кодом и пояснением
     handler.setFormatter(formatter)  # Назначаем форматтер обработчику
     handler.addFilter(ServiceContextFilter())  # Добавляем фильтр для обязательных полей
-    service_logger.addHandler(handler)  # Подключаем обработчик к логгеру
+    queue_handler = QueueHandler(queue.SimpleQueue())  # Поток запроса только кладет запись в очередь, файл пишет фоновый поток
+
+    def start_listener() -> None:  # Запускает фоновую запись файла из текущей очереди
+        service_logger.listener = QueueListener(queue_handler.queue, handler)  # Храним слушателя на логгере, чтобы остановить его при выходе
+        service_logger.listener.start()  # Поток сам проверяет ротацию и пишет файл
+
+    def restart_listener_in_child() -> None:  # Поток записи не переживает fork, поэтому воркер gunicorn поднимает свой
+        queue_handler.queue = queue.SimpleQueue()  # Новая очередь: записи родителя не дублируются, а блокировки очереди не унаследованы занятыми
+        start_listener()  # Запускаем поток записи в дочернем процессе
+
+    start_listener()  # Запускаем поток записи файла
+    if hasattr(os, "register_at_fork"):  # На Windows fork нет
+        os.register_at_fork(after_in_child=restart_listener_in_child)  # gunicorn импортирует модуль в мастере и форкает воркер
+    atexit.register(lambda: service_logger.listener.stop())  # При выходе дописываем очередь в файл
+    service_logger.addHandler(queue_handler)  # Подключаем обработчик к логгеру
     return service_logger  # Возвращаем готовый логгер
 
 
@@ -101,10 +279,44 @@ def log_service_event(status_code: int, message: str, persist_success: bool = Fa
         service_event_logger.log_event(status_code, description, message)  # Дублируем событие в базу с локальным временем
 
 
+poll_log_counters: defaultdict = defaultdict(itertools.count)  # Счетчики успешных опросов по маршрутам; next() у count атомарен под GIL
+
+
+def log_polled_event(route: str, message: str) -> None:  # Выборочная запись успешных опросов дашборда
+    """Пишет в сервисный лог только каждый SERVICE_LOG_SAMPLE-й успешный опрос маршрута."""
+
+    if next(poll_log_counters[route]) % SERVICE_LOG_SAMPLE == 0:  # Первый опрос и далее каждый N-й
+        log_service_event(200, f"{message} (1 из {SERVICE_LOG_SAMPLE})")  # Отмечаем в сообщении, что запись выборочная
+
+
 service_logger = build_service_logger()  # Создаем отдельный сервисный логгер
 logging.getLogger("werkzeug").setLevel(logging.WARNING)  # Поднимаем уровень werkzeug, чтобы скрыть GET/200 шум
 
 
+@dataclass(slots=True)
+class MessagePreview:
+    """Краткие данные нового сообщения для блока последних сообщений."""
+
+    id: Optional[int] = None  # ID сообщения
+    from_id: Optional[int] = None  # ID отправителя
+    from_name: Optional[str] = None  # Имя отправителя
+    from_avatar: Optional[str] = None  # Аватар отправителя
+    peer_id: Optional[int] = None  # Диалог или чат
+    peer_title: Optional[str] = None  # Название чата
+    peer_avatar: Optional[str] = None  # Аватар чата
+    text: Optional[str] = None  # Текст сообщения
+    attachments: List[Dict] = field(default_factory=list)  # Список вложений
+    copy_history: List[Dict] = field(default_factory=list)  # Репосты с вложениями
+    reply_message: Optional[Dict] = None  # Ответ, если есть
+
+    @classmethod
+    def from_message(cls, message: Dict) -> "MessagePreview":
+        return cls(**{name: message[name] for name in cls.__slots__ if name in message})  # Берем только известные поля сообщения
+
+    def to_dict(self) -> Dict[str, object]:
+        return {name: getattr(self, name) for name in self.__slots__}  # Плоская копия полей без глубокого копирования asdict
+
+
 @dataclass
 class BotState:
     """Состояние бота и накопленные метрики."""
@@ -113,148 +325,294 @@ class BotState:
     new_messages: int = 0  # Количество входящих сообщений
     invites: int = 0  # Количество действий с участниками чата
     errors: int = 0  # Количество ошибок лонгпулла
-    last_messages: List[Dict] = field(default_factory=list)  # История последних сообщений
-    events_timeline: List[Dict] = field(default_factory=list)  # История точек для графика
+    reconnects: int = 0  # Количество переподключений лонгпулла после сетевых сбоев
+    last_messages: Deque[MessagePreview] = field(default_factory=lambda: deque(maxlen=10))  # История последних сообщений, старые вытесняются автоматически
+    events_timeline: Deque[tuple] = field(default_factory=lambda: deque(maxlen=50))  # Точки графика кортежами (UNIX-время, события, сообщения, участники), не длиннее 50
+    version: int = 0  # Номер версии состояния, растет при каждом изменении метрик
 
-    def mark_event(self, payload: Dict, event_kind: str, keep: int = 10) -> None:
+    def mark_event(self, payload: MessagePreview, event_kind: str) -> None:
         """Фиксируем событие, обновляем счетчики и истории."""
 
-        self.total_events += 1  # Увеличиваем общий счетчик событий
         if event_kind == "message":  # Если пришло новое сообщение
-            self.new_messages += 1  # Увеличиваем счетчик сообщений
-            self.last_messages.append(payload)  # Сохраняем содержимое сообщения
-            if len(self.last_messages) > keep:  # Проверяем длину истории сообщений
-                self.last_messages.pop(0)  # Удаляем самое старое сообщение при переполнении
+            self.mark_events([payload])  # Учитываем как пачку из одного сообщения
         elif event_kind == "invite":  # Если событие связано с участниками
-            self.invites += 1  # Увеличиваем счетчик приглашений/удалений
-        current_time = datetime.now().astimezone()  # Фиксируем локальное время с таймзоной
-        timestamp = current_time.isoformat()  # Сохраняем ISO-строку с информацией о зоне
-        self.events_timeline.append(  # Добавляем точку для графика
-            {
-                "time": timestamp,  # Время точки
-                "events": self.total_events,  # Общее количество событий
-                "messages": self.new_messages,  # Количество сообщений
-                "invites": self.invites,  # Количество событий с участниками
-            }
-        )
-        if len(self.events_timeline) > 50:  # Обрезаем историю графика до 50 точек
-            self.events_timeline.pop(0)  # Удаляем самую старую точку
-
-
-class EventLogger:
+            self.mark_events([], invites=1)  # Учитываем одно событие участников
+        else:  # Остальные события
+            self.mark_events([], others=1)  # Учитываем только в общем счетчике
+
+    def mark_events(self, messages: List[MessagePreview], invites: int = 0, others: int = 0) -> None:
+        """Фиксируем пачку событий одного ответа лонгпулла одним обновлением."""
+
+        total = len(messages) + invites + others  # Сколько событий пришло в пачке
+        if not total:  # Пустую пачку не учитываем
+            return  # Состояние не меняется
+        self.total_events += total  # Увеличиваем общий счетчик событий
+        self.new_messages += len(messages)  # Увеличиваем счетчик сообщений
+        self.invites += invites  # Увеличиваем счетчик приглашений/удалений
+        self.last_messages.extend(messages)  # Сохраняем сообщения, самые старые уходят сами
+        self.version += 1  # Сообщаем кэшам, что состояние изменилось
+        self.events_timeline.append((int(time.time()), self.total_events, self.new_messages, self.invites))  # Одна точка графика на пачку кортежем, старая точка вытесняется maxlen
+
+    def mark_error(self) -> None:
+        """Фиксируем ошибку лонгпулла."""
+
+        self.errors += 1  # Увеличиваем счетчик ошибок
+        self.version += 1  # Сообщаем кэшам, что состояние изменилось
+
+    def mark_reconnect(self) -> None:
+        """Фиксируем переподключение лонгпулла после потери связи."""
+
+        self.reconnects += 1  # Увеличиваем счетчик переподключений
+        self.version += 1  # Сообщаем кэшам, что состояние изменилось
+
+
+class ReadPoolMixin:  # Общий пул соединений чтения для логгеров в SQLite
+    """Читает базу через отдельные соединения, которые в WAL не ждут блокировку записи."""
+
+    db_path: str  # Путь до файла базы задает наследник
+    _read_pool: List[sqlite3.Connection]  # Свободные соединения чтения создает наследник
+    _pending: Deque[tuple]  # Очередь строк, ожидающих записи, создает наследник
+    _lock: threading.Lock  # Блокировка соединения записи задает наследник
+
+    def flush_if_idle(self) -> None:
+        """Перед чтением дописывает очередь, только если запись свободна; занятую запись не ждет."""
+
+        if not self._pending:  # Дописывать нечего
+            return  # Читаем сразу
+        if not self._lock.acquire(blocking=False):  # Поток записи сейчас пишет пачку, чистит или сжимает базу
+            self._wake_flusher()  # Просим его дописать очередь следом, а сами читаем уже записанное
+            return  # Чтение не ждет блокировку записи
+        try:  # Запись свободна: дописываем очередь, чтобы чтение увидело свежие события
+            self._write_pending()  # Пишем пачку под уже взятой блокировкой
+        finally:  # Блокировку отпускаем при любом исходе
+            self._lock.release()  # Освобождаем запись для потока сброса
+
+    def _open_reader(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.db_path, check_same_thread=False, timeout=5.0, cached_statements=128)  # Отдельное соединение, которое не делит блокировку с записью
+        connection.row_factory = sqlite3.Row  # Включаем доступ к полям по имени
+        connection.execute("PRAGMA query_only=1")  # Запрещаем запись через это соединение
+        connection.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")  # Ленты и сводки читаем через mmap
+        return connection  # Возвращаем готовое соединение
+
+    @contextmanager
+    def _reader(self) -> Iterator[sqlite3.Connection]:
+        """Выдает соединение чтения из пула; в WAL оно читает снимок параллельно с записью."""
+
+        try:  # Пробуем взять свободное соединение
+            connection = self._read_pool.pop()  # list.pop атомарен, отдельная блокировка не нужна
+        except IndexError:  # Свободных соединений нет
+            connection = self._open_reader()  # Открываем новое
+        try:  # Отдаем соединение вызывающему коду
+            yield connection
+        finally:  # После чтения возвращаем соединение в пул
+            if len(self._read_pool) < READ_POOL_SIZE:  # Если в пуле есть место
+                self._read_pool.append(connection)  # Оставляем соединение для следующих запросов
+            else:  # Пул уже полон
+                connection.close()  # Лишнее соединение закрываем
+
+    def _close_readers(self) -> None:
+        while self._read_pool:  # Закрываем все свободные соединения чтения
+            self._read_pool.pop().close()  # Освобождаем файл базы
+
+
+class EventLogger(ReadPoolMixin):
     """Простой логгер событий в SQLite."""
 
-    def __init__(self, db_path: str):
+    def __init__(self, db_path: str, keep_rows: int = EVENT_DB_KEEP):
         self.db_path = db_path  # Путь до файла базы
+        self.keep_rows = keep_rows  # Лимит хранимых строк событий, 0 отключает обрезку
         db_dir = os.path.dirname(self.db_path)  # Вычисляем директорию файла базы
         if db_dir:  # Если путь включает директорию
             os.makedirs(db_dir, exist_ok=True)  # Создаем директорию при необходимости
-        self._connection = sqlite3.connect(self.db_path, check_same_thread=False)  # Открываем соединение с разрешением мультипоточности
+        self._connection = sqlite3.connect(  # Открываем соединение с разрешением мультипоточности
+            self.db_path,
+            check_same_thread=False,  # Соединение используют поток лонгпулла и потоки Flask
+            timeout=5.0,  # busy_timeout 5 секунд: при занятой базе ждем, а не падаем с "database is locked"
+            cached_statements=128,  # Держим подготовленные запросы в кэше драйвера, чтобы не разбирать SQL заново
+            isolation_level=None,  # Транзакции открываем явно, драйвер не вставляет неявный BEGIN
+        )
         self._connection.row_factory = sqlite3.Row  # Включаем доступ к полям по имени
+        self._connection.execute("PRAGMA auto_vacuum=INCREMENTAL")  # Действует для новой базы: освобожденные при обрезке страницы можно вернуть без полного VACUUM
+        self._connection.execute("PRAGMA journal_mode=WAL")  # Включаем WAL, чтобы чтение дашборда не блокировало запись лонгпулла
+        self._connection.execute("PRAGMA synchronous=NORMAL")  # В режиме WAL fsync нужен только на чекпоинтах, а не на каждый коммит
+        self._connection.execute("PRAGMA temp_store=MEMORY")  # Временные структуры сортировок держим в памяти
+        self._connection.execute("PRAGMA cache_size=-64000")  # Увеличиваем страничный кэш до ~64 МБ
+        self._connection.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")  # Страницы читаем через mmap без лишнего копирования в буфер
+        self._connection.execute("PRAGMA wal_autocheckpoint=1000")  # Чекпоинт каждые ~1000 страниц, чтобы WAL-файл не разрастался
         self._lock = threading.Lock()  # Создаем блокировку для потокобезопасных операций
+        self._pending: Deque[tuple] = deque()  # Очередь подготовленных строк, ожидающих пакетной вставки
+        self._flush_wakeup = threading.Event()  # Сигнал досрочного сброса при накоплении большой пачки
+        self._stop_event = threading.Event()  # Флаг остановки фонового потока записи
+        self._peer_keys: Optional[set] = None  # Известные тройки (peer_id, название, аватар); None — нужно перечитать из базы
+        self._peers_list: Optional[List[Dict[str, object]]] = None  # Отсортированный список чатов, собранный из _peer_keys
+        self._peers_lock = threading.Lock()  # Защищает набор чатов между потоком лонгпулла и потоками Flask
+        self._storage_cache: tuple = (0.0, {})  # Кэш описания файла базы: момент заполнения и словарь
+        self._read_pool: List[sqlite3.Connection] = []  # Свободные соединения только для чтения
+        self._closed = False  # Признак закрытого логгера
+        self.data_version = 0  # Растет после каждой записи или удаления, по нему кэши ответов понимают, что данные устарели
+        self.service_log: Optional["ServiceEventLogger"] = None  # Логгер сервисных событий, пишущий через это же соединение
         self._ensure_schema()  # Инициализируем таблицу при старте
+        self.prune()  # Сразу обрезаем историю сверх лимита
+        self._next_prune = time.monotonic() + EVENT_RETENTION_INTERVAL  # Следующая обрезка в фоновом потоке
+        self._flusher = threading.Thread(target=self._flush_loop, daemon=True)  # Фоновый поток пакетной записи событий
+        self._flusher.start()  # Запускаем поток записи
+        atexit.register(self.close)  # При выходе процесса дописываем очередь, иначе последние события потеряются
+
+    def _flush_loop(self) -> None:
+        while not self._stop_event.is_set():  # Работаем до сигнала остановки
+            self._flush_wakeup.wait(EVENT_FLUSH_INTERVAL)  # Ждем таймаут или сигнал о заполненной пачке
+            self._flush_wakeup.clear()  # Сбрасываем сигнал перед записью
+            try:  # Пробуем записать накопленные строки
+                self.flush()  # Сбрасываем очередь одной транзакцией
+                if self.service_log is not None:  # К соединению подключен логгер сервисных событий
+                    self.service_log.flush()  # Его очередь пишет этот же поток
+                if self.keep_rows > 0 and time.monotonic() >= self._next_prune:  # Подошло время плановой обрезки
+                    self._next_prune = time.monotonic() + EVENT_RETENTION_INTERVAL  # Планируем следующую
+                    self.prune()  # Удаляем строки сверх лимита
+            except sqlite3.ProgrammingError:  # Соединение уже закрыто
+                break  # Завершаем поток, писать больше некуда
+            except Exception as exc:  # Любая другая ошибка записи
+                logger.exception("Не удалось записать пачку событий в базу: %s", exc)  # Логируем сбой и продолжаем работу
+
+    def flush(self) -> None:
+        """Записывает накопленные события одной транзакцией."""
+
+        if not self._pending:  # Если очередь пуста
+            return  # Не трогаем соединение
+        with self._lock:  # Берем блокировку записи
+            self._write_pending()  # Пишем пачку
+
+    def _wake_flusher(self) -> None:
+        self._flush_wakeup.set()  # Будим поток записи досрочно
+
+    def _write_pending(self) -> None:
+        """Пишет очередь одной транзакцией; вызывается под блокировкой записи."""
+
+        batch = []  # Готовим пачку строк
+        while self._pending:  # Забираем всё, что накопилось к этому моменту
+            batch.append(self._pending.popleft())  # Переносим строку из очереди в пачку
+        if not batch:  # Другой поток мог успеть забрать очередь
+            return  # Писать нечего
+        self._connection.execute("BEGIN IMMEDIATE")  # Сразу берем блокировку записи на всю пачку: занятая база ждет busy_timeout, а не падает при повышении блокировки
+        try:  # Пишем пачку целиком
+            self._connection.executemany(EVENT_INSERT_SQL, batch)  # Вставляем все строки одним вызовом
+            self._connection.commit()  # Фиксируем транзакцию одним коммитом
+        except Exception:  # При ошибке вставки
+            self._connection.rollback()  # Откатываем незавершенную транзакцию
+            raise  # Пробрасываем ошибку вызывающему коду
+        self.data_version += 1  # Новые строки уже видны читателям
+
+    def close(self) -> None:
+        """Останавливает фоновую запись, сбрасывает очередь и закрывает соединение."""
+
+        if self._closed:  # Повторный вызов, например из atexit после явного закрытия
+            return  # Соединение уже закрыто
+        self._closed = True  # Запоминаем, что логгер закрыт
+        atexit.unregister(self.close)  # Снимаем обработчик выхода, он больше не нужен
+        self._stop_event.set()  # Просим поток записи завершиться
+        self._flush_wakeup.set()  # Будим поток, чтобы он не ждал таймаут
+        self._flusher.join(timeout=1)  # Ждем завершения потока
+        self.flush()  # Дописываем остатки очереди
+        if self.service_log is not None:  # Соединение делит логгер сервисных событий
+            self.service_log.close()  # Дописываем и его очередь, пока соединение открыто
+        self._close_readers()  # Закрываем соединения чтения
+        self._connection.close()  # Закрываем соединение с базой
 
     def _ensure_schema(self) -> None:
         with self._lock:  # Закрываем блокировку
             cursor = self._connection.cursor()  # Берем курсор
-            schema_sql = """
-                CREATE TABLE IF NOT EXISTS events (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    created_at TEXT NOT NULL,
-                    event_type TEXT NOT NULL,
-                    peer_id INTEGER,
-                    peer_title TEXT,
-                    peer_avatar TEXT,
-                    from_id INTEGER,
-                    from_name TEXT,
-                    from_avatar TEXT,
-                    message_id INTEGER,
-                    reply_to INTEGER,
-                    reply_message_id INTEGER,
-                    reply_message_text TEXT,
-                    reply_message_attachments TEXT,
-                    reply_message_from_id INTEGER,
-                    reply_message_from_name TEXT,
-                    reply_message_from_avatar TEXT,
-                    is_bot INTEGER DEFAULT 0,
-                    text TEXT,
-                    attachments TEXT,
-                    payload TEXT
-                )
-            """  # SQL-скрипт создания таблицы без комментариев внутри текста
-            cursor.execute(schema_sql)  # Создаем таблицу при отсутствии
-            cursor.execute("PRAGMA table_info(events)")  # Читаем описание колонок для миграции
-            columns = {row[1] for row in cursor.fetchall()}  # Собираем имена колонок в множество
-            if "is_bot" not in columns:  # Если колонки для флага бота нет
-                cursor.execute("ALTER TABLE events ADD COLUMN is_bot INTEGER DEFAULT 0")  # Добавляем колонку миграцией
-            if "peer_title" not in columns:  # Если нет колонки для названия чата
-                cursor.execute("ALTER TABLE events ADD COLUMN peer_title TEXT")  # Добавляем поле для названия чата
-            if "from_name" not in columns:  # Если нет колонки для имени автора
-                cursor.execute("ALTER TABLE events ADD COLUMN from_name TEXT")  # Добавляем поле для имени отправителя
-            if "peer_avatar" not in columns:  # Если нет колонки для аватара чата
-                cursor.execute("ALTER TABLE events ADD COLUMN peer_avatar TEXT")  # Добавляем поле для аватара чата
-            if "from_avatar" not in columns:  # Если нет колонки для аватара отправителя
-                cursor.execute("ALTER TABLE events ADD COLUMN from_avatar TEXT")  # Добавляем поле для аватара отправителя
-            if "reply_message_id" not in columns:  # Если нет колонки ID исходного сообщения
-                cursor.execute("ALTER TABLE events ADD COLUMN reply_message_id INTEGER")  # Добавляем колонку для ID ответа
-            if "reply_message_text" not in columns:  # Если нет колонки текста исходного сообщения
-                cursor.execute("ALTER TABLE events ADD COLUMN reply_message_text TEXT")  # Добавляем колонку для текста ответа
-            if "reply_message_attachments" not in columns:  # Если нет колонки вложений исходного сообщения
-                cursor.execute("ALTER TABLE events ADD COLUMN reply_message_attachments TEXT")  # Добавляем колонку для вложений ответа
-            if "reply_message_from_id" not in columns:  # Если нет колонки автора исходного сообщения
-                cursor.execute("ALTER TABLE events ADD COLUMN reply_message_from_id INTEGER")  # Добавляем колонку ID автора исходного сообщения
-            if "reply_message_from_name" not in columns:  # Если нет колонки имени автора исходного сообщения
-                cursor.execute("ALTER TABLE events ADD COLUMN reply_message_from_name TEXT")  # Добавляем колонку имени автора исходного сообщения
-            if "reply_message_from_avatar" not in columns:  # Если нет колонки аватара автора исходного сообщения
-                cursor.execute("ALTER TABLE events ADD COLUMN reply_message_from_avatar TEXT")  # Добавляем колонку аватара автора исходного сообщения
-            self._connection.commit()  # Сохраняем изменения
-            cursor.execute(  # Запрашиваем строки с reply_message для нормализации
-                "SELECT id, payload, reply_message_id, reply_message_text, reply_message_attachments, reply_message_from_id FROM events WHERE event_type = 'message'"
+            if cursor.execute("PRAGMA user_version").fetchone()[0] < EVENTS_SCHEMA_VERSION:  # База старее текущей схемы или только создана
+                self._migrate_schema(cursor)  # Создаем таблицу, колонки и индексы, переносим поля ответа
+            cursor.execute("PRAGMA analysis_limit=1000")  # Ограничиваем выборку ANALYZE, чтобы старт не зависел от размера базы
+            cursor.execute("ANALYZE")  # Обновляем статистику, чтобы планировщик выбирал новые индексы
+
+    def _migrate_schema(self, cursor: sqlite3.Cursor) -> None:
+        """Приводит таблицу событий к текущей схеме; вызывается под блокировкой записи."""
+
+        cursor.execute("BEGIN")  # Создание таблицы, миграция колонок и индексы идут одной транзакцией
+        schema_sql = """
+            CREATE TABLE IF NOT EXISTS events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                created_at TEXT NOT NULL,
+                event_type TEXT NOT NULL,
+                peer_id INTEGER,
+                peer_title TEXT,
+                peer_avatar TEXT,
+                from_id INTEGER,
+                from_name TEXT,
+                from_avatar TEXT,
+                message_id INTEGER,
+                reply_to INTEGER,
+                reply_message_id INTEGER,
+                reply_message_text TEXT,
+                reply_message_attachments TEXT,
+                reply_message_from_id INTEGER,
+                reply_message_from_name TEXT,
+                reply_message_from_avatar TEXT,
+                is_bot INTEGER DEFAULT 0,
+                text TEXT,
+                attachments TEXT,
+                payload TEXT
             )
-            rows = cursor.fetchall()  # Читаем строки для миграции
-            for row in rows:  # Перебираем строки с потенциальным ответом
-                try:  # Пробуем распарсить payload
-                    payload = json.loads(row["payload"] or "{}") if isinstance(row, sqlite3.Row) else {}  # Достаем payload в виде словаря
-                except Exception:  # Если JSON некорректный
-                    continue  # Пропускаем запись
-                reply_block = payload.get("reply_message") if isinstance(payload, dict) else None  # Получаем вложенный блок ответа
-                if not isinstance(reply_block, dict):  # Если ответа нет или формат неверный
-                    continue  # Пропускаем запись
-                has_id = row["reply_message_id"] is not None  # Проверяем, заполнен ли ID ответа
-                has_text = row["reply_message_text"] is not None  # Проверяем, заполнен ли текст ответа
-                has_attachments = row["reply_message_attachments"] is not None  # Проверяем, заполнены ли вложения ответа
-                if has_id and has_text and has_attachments:  # Если все поля уже заполнены
-                    continue  # Пропускаем миграцию для этой строки
-                reply_id = reply_block.get("id")  # Получаем ID исходного сообщения
-                reply_text = reply_block.get("text")  # Получаем текст исходного сообщения
-                reply_attachments = reply_block.get("attachments", []) if isinstance(reply_block.get("attachments"), list) else []  # Получаем вложения исходного сообщения
-                reply_from_id = reply_block.get("from_id")  # Получаем автора исходного сообщения
-                reply_from_name = reply_block.get("from_name")  # Получаем имя автора исходного сообщения
-                reply_from_avatar = reply_block.get("from_avatar")  # Получаем аватар автора исходного сообщения
-                cursor.execute(  # Обновляем строку новыми полями ответа
-                    """
-                    UPDATE events
-                    SET reply_message_id = ?, reply_message_text = ?, reply_message_attachments = ?, reply_message_from_id = ?, reply_message_from_name = ?, reply_message_from_avatar = ?
-                    WHERE id = ?
-                    """,
-                    (
-                        reply_id,  # ID исходного сообщения
-                        reply_text,  # Текст исходного сообщения
-                        json.dumps(reply_attachments, ensure_ascii=False),  # Вложения исходного сообщения в JSON
-                        reply_from_id,  # Автор исходного сообщения
-                        reply_from_name,  # Имя автора исходного сообщения
-                        reply_from_avatar,  # Аватар автора исходного сообщения
-                        row["id"],  # ID строки для обновления
-                    ),
-                )
-            self._connection.commit()  # Фиксируем результаты миграции
+        """  # SQL-скрипт создания таблицы без комментариев внутри текста
+        cursor.execute(schema_sql)  # Создаем таблицу при отсутствии
+        cursor.execute("PRAGMA table_info(events)")  # Читаем описание колонок для миграции
+        columns = {row[1] for row in cursor.fetchall()}  # Собираем имена колонок в множество
+        if "is_bot" not in columns:  # Если колонки для флага бота нет
+            cursor.execute("ALTER TABLE events ADD COLUMN is_bot INTEGER DEFAULT 0")  # Добавляем колонку миграцией
+        if "peer_title" not in columns:  # Если нет колонки для названия чата
+            cursor.execute("ALTER TABLE events ADD COLUMN peer_title TEXT")  # Добавляем поле для названия чата
+        if "from_name" not in columns:  # Если нет колонки для имени автора
+            cursor.execute("ALTER TABLE events ADD COLUMN from_name TEXT")  # Добавляем поле для имени отправителя
+        if "peer_avatar" not in columns:  # Если нет колонки для аватара чата
+            cursor.execute("ALTER TABLE events ADD COLUMN peer_avatar TEXT")  # Добавляем поле для аватара чата
+        if "from_avatar" not in columns:  # Если нет колонки для аватара отправителя
+            cursor.execute("ALTER TABLE events ADD COLUMN from_avatar TEXT")  # Добавляем поле для аватара отправителя
+        if "reply_message_id" not in columns:  # Если нет колонки ID исходного сообщения
+            cursor.execute("ALTER TABLE events ADD COLUMN reply_message_id INTEGER")  # Добавляем колонку для ID ответа
+        if "reply_message_text" not in columns:  # Если нет колонки текста исходного сообщения
+            cursor.execute("ALTER TABLE events ADD COLUMN reply_message_text TEXT")  # Добавляем колонку для текста ответа
+        if "reply_message_attachments" not in columns:  # Если нет колонки вложений исходного сообщения
+            cursor.execute("ALTER TABLE events ADD COLUMN reply_message_attachments TEXT")  # Добавляем колонку для вложений ответа
+        if "reply_message_from_id" not in columns:  # Если нет колонки автора исходного сообщения
+            cursor.execute("ALTER TABLE events ADD COLUMN reply_message_from_id INTEGER")  # Добавляем колонку ID автора исходного сообщения
+        if "reply_message_from_name" not in columns:  # Если нет колонки имени автора исходного сообщения
+            cursor.execute("ALTER TABLE events ADD COLUMN reply_message_from_name TEXT")  # Добавляем колонку имени автора исходного сообщения
+        if "reply_message_from_avatar" not in columns:  # Если нет колонки аватара автора исходного сообщения
+            cursor.execute("ALTER TABLE events ADD COLUMN reply_message_from_avatar TEXT")  # Добавляем колонку аватара автора исходного сообщения
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_events_type_id ON events(event_type, id DESC)")  # Индекс для ленты сообщений без фильтра: LIMIT читается обратным проходом
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_events_type_peer_id ON events(event_type, peer_id, id DESC)")  # Индекс для ленты конкретного чата и подсчета по peer_id
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_events_type_created ON events(event_type, created_at)")  # Индекс для счетчика и графика сообщений за диапазон времени
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_events_type_from_id ON events(event_type, from_id, id DESC)")  # Индекс для ленты и сводки конкретного отправителя
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_events_peer_title ON events(peer_id, peer_title, peer_avatar) WHERE peer_id IS NOT NULL")  # Частичный покрывающий индекс для списка уникальных чатов
+        self._connection.commit()  # Сохраняем изменения
+        cursor.execute("BEGIN")  # Все обновления миграции пишем одной транзакцией
+        cursor.execute(REPLY_BACKFILL_SQL)  # Заполняем колонки ответа прямо в SQLite, без чтения строк в Python
+        cursor.execute(f"PRAGMA user_version={EVENTS_SCHEMA_VERSION}")  # Версия пишется в той же транзакции: следующий старт пропустит миграцию
+        self._connection.commit()  # Фиксируем результаты миграции
 
     def describe_storage(self) -> Dict[str, object]:
-        return {
+        cached_at, cached = self._storage_cache  # Читаем кэш одной парой, чтобы не зависеть от гонок
+        if cached and time.monotonic() - cached_at < STORAGE_CACHE_TTL:  # Если кэш еще свежий
+            return dict(cached)  # Возвращаем копию без обращений к файловой системе
+        try:  # Один вызов stat дает и существование, и размер файла
+            db_stat = os.stat(self.db_path)  # Читаем метаданные файла базы
+        except OSError:  # Файла нет или он недоступен
+            db_stat = None  # Считаем базу отсутствующей
+        description = {
             "path": self.db_path,  # Путь до файла базы
-            "exists": os.path.exists(self.db_path),  # Флаг существования файла
-            "size_bytes": os.path.getsize(self.db_path) if os.path.exists(self.db_path) else 0,  # Размер файла в байтах
+            "exists": db_stat is not None,  # Флаг существования файла
+            "size_bytes": db_stat.st_size if db_stat is not None else 0,  # Размер файла в байтах
         }  # Словарь с описанием хранилища
+        self._storage_cache = (time.monotonic(), description)  # Запоминаем описание вместе с моментом заполнения
+        return dict(description)  # Возвращаем копию, чтобы вызывающий код не испортил кэш
+
+    def _invalidate_caches(self) -> None:
+        self.data_version += 1  # Строки удалены, готовые ответы устарели
+        with self._peers_lock:  # Сбрасываем набор чатов атомарно
+            self._peer_keys = None  # После удаления строк чаты перечитываются из базы
+            self._peers_list = None  # Собранный список тоже устарел
+        self._storage_cache = (0.0, {})  # Сбрасываем кэш описания файла базы
 
     def log_event(
         self,
@@ -265,12 +623,52 @@ class EventLogger:
         peer_avatar: Optional[str] = None,
         from_avatar: Optional[str] = None,
     ) -> None:
+        self.log_many([self.build_event_row(event_type, payload, peer_title, from_name, peer_avatar, from_avatar)])  # Передаем строку фоновой записи
+
+    def log_message(
+        self,
+        message: Dict,
+        peer_title: Optional[str] = None,
+        from_name: Optional[str] = None,
+        peer_avatar: Optional[str] = None,
+        from_avatar: Optional[str] = None,
+    ) -> None:
+        self.log_many([self.build_message_row(message, peer_title, from_name, peer_avatar, from_avatar)])  # Передаем строку фоновой записи
+
+    def log_many(self, rows: List[tuple]) -> None:
+        """Ставит в очередь записи сразу пачку готовых строк."""
+
+        if not rows:  # Пустую пачку не обрабатываем
+            return  # Ничего не делаем
+        self._pending.extend(rows)  # Кладем все строки в очередь одним вызовом
+        with self._peers_lock:  # Обновляем набор чатов без запроса к базе
+            if self._peer_keys is not None:  # Если набор уже загружен
+                for row in rows:  # Проверяем чат каждой строки
+                    key = (row[2], row[3], row[4])  # peer_id, название и аватар из строки вставки
+                    if key[0] is not None and key not in self._peer_keys:  # Новый чат или новое название
+                        self._peer_keys.add(key)  # Запоминаем тройку
+                        self._peers_list = None  # Список нужно пересобрать
+        if len(self._pending) >= EVENT_FLUSH_BATCH:  # Если пачка уже большая
+            self._flush_wakeup.set()  # Будим поток записи досрочно
+
+    def build_event_row(
+        self,
+        event_type: str,
+        payload: Dict,
+        peer_title: Optional[str] = None,
+        from_name: Optional[str] = None,
+        peer_avatar: Optional[str] = None,
+        from_avatar: Optional[str] = None,
+    ) -> tuple:
         message_unix_time = payload.get("date")  # Берем исходный таймштамп сообщения из VK, если он передан
-        local_tz = datetime.now().astimezone().tzinfo  # Запоминаем локальную таймзону для перевода времени
         created_at_dt = None  # Инициализируем переменную времени создания сообщения
+        created_at = None  # Готовая ISO-строка, если время удалось взять из кэша
         if isinstance(message_unix_time, str) and message_unix_time.isdigit():  # Проверяем, что таймштамп пришел строкой с цифрами
             message_unix_time = int(message_unix_time)  # Переводим строковое число в int, чтобы сохранить точное время отправки
-        if isinstance(message_unix_time, (int, float)):  # Если таймштамп является числом в секундах
+        if isinstance(message_unix_time, int):  # Обычный случай VK: целые секунды
+            created_at = format_local_timestamp(message_unix_time)  # Берем строку из посекундного кэша без пересчета таймзоны
+        local_tz = datetime.now().astimezone().tzinfo if created_at is None else None  # Локальная таймзона нужна только для дробных и строковых меток
+        if isinstance(message_unix_time, float):  # Если таймштамп дробный
             created_at_dt = datetime.fromtimestamp(message_unix_time, tz=local_tz)  # Конвертируем UNIX-время в локальный datetime
         elif isinstance(message_unix_time, str):  # Если таймштамп передан строкой другого формата
             try:  # Пробуем распарсить ISO-строку времени
@@ -280,119 +678,183 @@ class EventLogger:
                     created_at_dt = created_at_dt.replace(tzinfo=local_tz)  # Добавляем локальную таймзону, чтобы избежать смещения
             except Exception:  # Если парсинг ISO не удался
                 created_at_dt = None  # Оставляем None и перейдем к запасному варианту
-        if created_at_dt is None:  # Если не удалось определить время отправки из payload
-            created_at_dt = datetime.now().astimezone()  # Фиксируем момент вставки как запасной вариант, чтобы не терять данные
-        created_at = created_at_dt.isoformat()  # Сериализуем выбранное время в ISO-строку для базы
+        if created_at is None:  # Если строку еще не собрали
+            created_at = created_at_dt.isoformat() if created_at_dt is not None else now_local_timestamp()  # Сериализуем время отправки или берем момент вставки как запасной вариант
         peer_id = payload.get("peer_id")  # Берем ID чата
         from_id = payload.get("from_id")  # Берем автора
         message_id = payload.get("id")  # Берем ID сообщения
-        reply_block = payload.get("reply_message") if isinstance(payload.get("reply_message"), dict) else None  # Получаем блок исходного сообщения
-        reply_to = reply_block.get("from_id") if isinstance(reply_block, dict) else None  # Берем ID адресата ответа для обратной совместимости
-        reply_message_id = reply_block.get("id") if isinstance(reply_block, dict) else None  # Берем ID исходного сообщения
-        reply_message_text = reply_block.get("text") if isinstance(reply_block, dict) else None  # Берем текст исходного сообщения
-        reply_message_attachments = (
-            reply_block.get("attachments", []) if isinstance(reply_block, dict) and isinstance(reply_block.get("attachments"), list) else []
-        )  # Берем вложения исходного сообщения
-        reply_message_from_id = reply_block.get("from_id") if isinstance(reply_block, dict) else None  # Берем автора исходного сообщения
-        reply_message_from_name = reply_block.get("from_name") if isinstance(reply_block, dict) else None  # Берем имя автора исходного сообщения
-        reply_message_from_avatar = reply_block.get("from_avatar") if isinstance(reply_block, dict) else None  # Берем аватар автора исходного сообщения
+        reply_block = payload.get("reply_message")  # Блок исходного сообщения берем одним обращением
+        if isinstance(reply_block, dict):  # Если это ответ
+            reply_to = reply_message_from_id = reply_block.get("from_id")  # Автор исходного сообщения, он же адресат ответа для обратной совместимости
+            reply_message_id = reply_block.get("id")  # Берем ID исходного сообщения
+            reply_message_text = reply_block.get("text")  # Берем текст исходного сообщения
+            reply_message_attachments = reply_block.get("attachments")  # Берем вложения исходного сообщения
+            if not isinstance(reply_message_attachments, list):  # Некорректные вложения не сохраняем
+                reply_message_attachments = []  # Пишем пустой список
+            reply_message_from_name = reply_block.get("from_name")  # Берем имя автора исходного сообщения
+            reply_message_from_avatar = reply_block.get("from_avatar")  # Берем аватар автора исходного сообщения
+        else:  # Обычное сообщение без ответа
+            reply_to = reply_message_from_id = reply_message_id = reply_message_text = None  # Полей ответа нет
+            reply_message_from_name = reply_message_from_avatar = None  # Имени и аватара автора ответа тоже нет
+            reply_message_attachments = []  # Вложений исходного сообщения нет
         text = payload.get("text")  # Берем текст
-        attachments = payload.get("attachments", [])  # Берем вложения
         is_bot = 1 if isinstance(from_id, int) and from_id < 0 else 0  # Фиксируем, что автор — бот или сообщество
-        with self._lock:  # Начинаем потокобезопасную запись
-            cursor = self._connection.cursor()  # Получаем курсор
-            cursor.execute(  # Выполняем вставку строки
-                """
-                INSERT INTO events (created_at, event_type, peer_id, peer_title, peer_avatar, from_id, from_name, from_avatar, message_id, reply_to, reply_message_id, reply_message_text, reply_message_attachments, reply_message_from_id, reply_message_from_name, reply_message_from_avatar, is_bot, text, attachments, payload)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """,
-                (
-                    created_at,  # Время вставки
-                    event_type,  # Тип события
-                    peer_id,  # Чат
-                    peer_title,  # Название чата
-                    peer_avatar,  # Аватар чата
-                    from_id,  # Автор
-                    from_name,  # Имя автора
-                    from_avatar,  # Аватар автора
-                    message_id,  # ID сообщения
-                    reply_to,  # Кому отвечали
-                    reply_message_id,  # ID исходного сообщения
-                    reply_message_text,  # Текст исходного сообщения
-                    json.dumps(reply_message_attachments, ensure_ascii=False),  # Вложения исходного сообщения
-                    reply_message_from_id,  # ID автора исходного сообщения
-                    reply_message_from_name,  # Имя автора исходного сообщения
-                    reply_message_from_avatar,  # Аватар автора исходного сообщения
-                    is_bot,  # Флаг автора-бота
-                    text,  # Текст
-                    json.dumps(attachments, ensure_ascii=False),  # Сериализуем вложения
-                    json.dumps(payload, ensure_ascii=False),  # Сохраняем сырой payload
-                ),
+        row = (  # Готовим строку для пакетной вставки вне блокировки
+            created_at,  # Время вставки
+            event_type,  # Тип события
+            peer_id,  # Чат
+            peer_title,  # Название чата
+            peer_avatar,  # Аватар чата
+            from_id,  # Автор
+            from_name,  # Имя автора
+            from_avatar,  # Аватар автора
+            message_id,  # ID сообщения
+            reply_to,  # Кому отвечали
+            reply_message_id,  # ID исходного сообщения
+            reply_message_text,  # Текст исходного сообщения
+            dump_json(reply_message_attachments) if reply_message_attachments else "[]",  # Вложения исходного сообщения; пустой список не сериализуем
+            reply_message_from_id,  # ID автора исходного сообщения
+            reply_message_from_name,  # Имя автора исходного сообщения
+            reply_message_from_avatar,  # Аватар автора исходного сообщения
+            is_bot,  # Флаг автора-бота
+            text,  # Текст
+            pack_json(payload),  # Сохраняем сырой payload, большой сжимаем
+        )  # Конец строки для вставки
+        return row  # Возвращаем строку в порядке колонок EVENT_INSERT_SQL
+
+    def build_message_row(
+        self,
+        message: Dict,
+        peer_title: Optional[str] = None,
+        from_name: Optional[str] = None,
+        peer_avatar: Optional[str] = None,
+        from_avatar: Optional[str] = None,
+    ) -> tuple:
+        """Быстро собирает строку нового сообщения VK: без разбора строковых дат и лишних проверок."""
+
+        created_unix = message.get("date")  # VK присылает время отправки целым числом секунд
+        if not isinstance(created_unix, int):  # Нестандартное время разбирает общий путь
+            return self.build_event_row("message", message, peer_title, from_name, peer_avatar, from_avatar)  # Нестандартное время разбирает общий путь
+        from_id = message.get("from_id")  # Берем автора
+        reply_block = message.get("reply_message")  # Блок исходного сообщения, в большинстве сообщений его нет
+        if isinstance(reply_block, dict):  # Если это ответ
+            reply_from_id = reply_block.get("from_id")  # Автор исходного сообщения
+            reply_attachments = reply_block.get("attachments")  # Вложения исходного сообщения
+            reply_fields = (  # Поля ответа в порядке колонок
+                reply_from_id,  # Кому отвечали
+                reply_block.get("id"),  # ID исходного сообщения
+                reply_block.get("text"),  # Текст исходного сообщения
+                dump_json(reply_attachments) if isinstance(reply_attachments, list) and reply_attachments else "[]",  # Вложения исходного сообщения
+                reply_from_id,  # ID автора исходного сообщения
+                reply_block.get("from_name"),  # Имя автора исходного сообщения
+                reply_block.get("from_avatar"),  # Аватар автора исходного сообщения
             )
-            self._connection.commit()  # Сохраняем изменения
+        else:  # Обычное сообщение без ответа
+            reply_fields = (None, None, None, "[]", None, None, None)  # Пустые поля ответа без сериализации
+        return (  # Строка в порядке колонок EVENT_INSERT_SQL
+            format_local_timestamp(created_unix),  # Время отправки из посекундного кэша
+            "message",  # Тип события
+            message.get("peer_id"),  # Чат
+            peer_title,  # Название чата
+            peer_avatar,  # Аватар чата
+            from_id,  # Автор
+            from_name,  # Имя автора
+            from_avatar,  # Аватар автора
+            message.get("id"),  # ID сообщения
+            *reply_fields,  # Поля исходного сообщения
+            1 if isinstance(from_id, int) and from_id < 0 else 0,  # Флаг автора-бота
+            message.get("text"),  # Текст
+            pack_json(message),  # Сырой payload, большой сжимаем
+        )  # Конец строки для вставки
 
     def mark_message_deleted(self, message_id: Optional[int]) -> bool:
         """Помечает записанное сообщение как удалённое по его VK ID."""
 
         if not isinstance(message_id, int):  # Проверяем, что передан корректный числовой ID
             return False  # Возвращаем, что обновление не выполнено
+        self.flush()  # Дописываем очередь, чтобы пометка нашла свежие сообщения
         with self._lock:  # Оборачиваем обновление в блокировку для потокобезопасности
-            cursor = self._connection.cursor()  # Берём курсор для выполнения запросов
-            cursor.execute(  # Выбираем строки с указанным message_id только для событий типа message
+            rows = self._connection.execute(  # Выбираем строки с указанным message_id только для событий типа message
                 "SELECT id, payload FROM events WHERE message_id = ? AND event_type = ?",
                 (message_id, "message"),
-            )
-            rows = cursor.fetchall()  # Читаем найденные записи
+            ).fetchall()  # Читаем найденные записи
             if not rows:  # Проверяем, есть ли что обновлять
                 return False  # Возвращаем отсутствие обновлений
+            updates = []  # Новые payload для одной пакетной записи
             for row in rows:  # Перебираем каждую подходящую запись
                 try:  # Пробуем распарсить payload строки
-                    payload = json.loads(row["payload"] or "{}") if isinstance(row, sqlite3.Row) else {}
+                    payload = orjson.loads(unpack_json(row["payload"]) or "{}")  # Разбираем payload, сжатый предварительно распаковываем
                 except Exception:  # Если JSON некорректен
                     payload = {}  # Используем пустой словарь, чтобы не падать
                 payload["deleted"] = True  # Сохраняем признак удаления
                 payload["was_deleted"] = True  # Дублируем признак для альтернативных проверок
                 payload["is_deleted"] = True  # Ставим явный флаг удаления
-                cursor.execute(  # Обновляем payload в базе для конкретной строки
-                    "UPDATE events SET payload = ? WHERE id = ?",
-                    (json.dumps(payload, ensure_ascii=False), row["id"]),
-                )
-            self._connection.commit()  # Фиксируем обновлённые данные
+                updates.append((pack_json(payload), row["id"]))  # Копим обновление для строки
+            self._connection.execute("BEGIN")  # Обновляем все найденные строки одной транзакцией
+            try:  # Пишем обновления одним подготовленным запросом
+                self._connection.executemany("UPDATE events SET payload = ? WHERE id = ?", updates)  # Запрос разбирается один раз на всю пачку
+                self._connection.commit()  # Фиксируем обновлённые данные
+            except Exception:  # При ошибке обновления
+                self._connection.rollback()  # Откатываем незавершенную транзакцию
+                raise  # Пробрасываем ошибку вызывающему коду
+            self.data_version += 1  # Пометка удаления меняет выдачу логов
             return True  # Сообщаем, что хотя бы одна запись была обновлена
 
     def clear_messages(self) -> None:
+        self.flush()  # Дописываем очередь, чтобы очистка не оставила хвост из неё
         with self._lock:  # Начинаем потокобезопасную операцию
-            cursor = self._connection.cursor()  # Получаем курсор
-            cursor.execute("DELETE FROM events")  # Удаляем все строки таблицы событий
-            self._connection.commit()  # Фиксируем изменения после удаления
+            self._connection.execute("DELETE FROM events")  # Удаляем все строки таблицы событий, соединение в автокоммите
+        self._invalidate_caches()  # Список чатов и размер базы изменились
         self._vacuum()  # Запускаем VACUUM вне блокировки, чтобы освободить место и уменьшить файл
 
     def delete_message(self, record_id: int) -> bool:
+        self.flush()  # Дописываем очередь, чтобы удаляемая запись уже была в базе
         with self._lock:  # Начинаем потокобезопасную операцию
-            cursor = self._connection.cursor()  # Получаем курсор
-            cursor.execute(  # Выполняем удаление только для событий типа message по ID записи
+            cursor = self._connection.execute(  # Выполняем удаление только для событий типа message по ID записи, соединение в автокоммите
                 "DELETE FROM events WHERE id = ? AND event_type = ?",
                 (int(record_id), "message"),
             )
             deleted = cursor.rowcount > 0  # Фиксируем, была ли удалена хотя бы одна строка
-            self._connection.commit()  # Фиксируем изменения после удаления
+        if deleted:  # Если запись действительно удалена
+            self._invalidate_caches()  # Чат мог исчезнуть из списка
         return deleted  # Возвращаем результат удаления
 
+    def prune(self) -> int:
+        """Удаляет самые старые события сверх лимита keep_rows и возвращает число удаленных строк."""
+
+        if self.keep_rows <= 0:  # Обрезка выключена
+            return 0  # Ничего не удаляем
+        self.flush()  # Дописываем очередь, чтобы лимит считался по актуальным данным
+        with self._lock:  # Начинаем потокобезопасную операцию
+            cursor = self._connection.execute(  # Удаляем по первичному ключу, без сортировки таблицы
+                "DELETE FROM events WHERE id <= (SELECT MAX(id) FROM events) - ?",
+                (self.keep_rows,),
+            )
+            deleted = cursor.rowcount  # Сколько строк удалено
+            if deleted > 0:  # Если место освободилось
+                self._connection.execute("PRAGMA incremental_vacuum").fetchall()  # Прагма освобождает страницы по шагам, поэтому дочитываем её до конца
+        if deleted > 0:  # Если история изменилась
+            self._invalidate_caches()  # Чаты и размер базы могли измениться
+            logger.info("Удалено %s старых событий сверх лимита EVENT_DB_KEEP=%s", deleted, self.keep_rows)  # Пишем итог обрезки
+        return deleted  # Возвращаем количество удаленных строк
+
     def _vacuum(self) -> None:
         with self._lock:  # Начинаем потокобезопасную операцию
-            original_isolation = self._connection.isolation_level  # Запоминаем исходный режим автокоммита
-            self._connection.isolation_level = None  # Переводим соединение в автокоммит для VACUUM
-            try:  # Оборачиваем в try/finally, чтобы вернуть режим даже при ошибке
-                self._connection.execute("VACUUM")  # Запускаем VACUUM для сжатия файла базы
-            finally:  # Гарантируем возврат исходных настроек
-                self._connection.isolation_level = original_isolation  # Восстанавливаем режим автокоммита
+            self._connection.execute("VACUUM")  # Соединение уже в автокоммите, VACUUM можно запускать напрямую
 
     def fetch_messages(
         self, peer_id: Optional[int] = None, limit: int = 50, offset: int = 0, from_id: Optional[int] = None
-    ) -> List[Dict]:
-        with self._lock:  # Начинаем безопасное чтение
-            cursor = self._connection.cursor()  # Берем курсор
-            base_query = "SELECT * FROM events WHERE event_type = ?"  # Базовый запрос выборки
+    ) -> List[sqlite3.Row]:
+        return list(self.iter_messages(peer_id=peer_id, limit=limit, offset=offset, from_id=from_id))  # Собираем поток строк в список
+
+    def iter_messages(
+        self, peer_id: Optional[int] = None, limit: int = 50, offset: int = 0, from_id: Optional[int] = None
+    ) -> Iterator[sqlite3.Row]:
+        """Отдает сообщения по одному, читая курсор без fetchall."""
+
+        self.flush_if_idle()  # Дописываем очередь, только если запись не занята
+        with self._reader() as connection:  # Читаем через пул, не дожидаясь блокировки записи
+            base_query = f"SELECT {MESSAGE_COLUMNS} FROM events WHERE event_type = ?"  # Базовый запрос выборки только нужных колонок
             params: List[object] = ["message"]  # Начальные параметры для запроса
             if peer_id is not None:  # Если задан фильтр по чату
                 base_query += " AND peer_id = ?"  # Добавляем условие по чату
@@ -402,35 +864,44 @@ class EventLogger:
                 params.append(int(from_id))  # Подставляем значение from_id
             base_query += " ORDER BY id DESC LIMIT ? OFFSET ?"  # Добавляем сортировку и пагинацию
             params.extend([int(limit), max(0, int(offset))])  # Добавляем лимит и смещение с защитой от отрицательных значений
-            cursor.execute(base_query, tuple(params))  # Выполняем сформированный запрос
-            rows = cursor.fetchall()  # Читаем все строки
-        return [dict(row) for row in rows]  # Преобразуем в словари
+            for row in connection.execute(base_query, tuple(params)):  # Идем по курсору, строки читаются из SQLite по мере отдачи
+                yield row  # Отдаем sqlite3.Row как есть: доступ по имени колонки без копии в словарь
+
+    def fetch_raw_payload(self, record_id: int):
+        self.flush_if_idle()  # Дописываем очередь, только если запись не занята
+        with self._reader() as connection:  # Читаем через пул, не дожидаясь блокировки записи
+            row = connection.execute("SELECT payload FROM events WHERE id = ?", (int(record_id),)).fetchone()  # Берем сырой payload одной записи
+        return unpack_json(row["payload"]) if row else None  # Возвращаем JSON без разбора, сжатый распаковываем
 
     def list_peers(self) -> List[Dict[str, object]]:
-        with self._lock:  # Начинаем безопасное чтение
-            cursor = self._connection.cursor()  # Берем курсор
-            cursor.execute("SELECT DISTINCT peer_id, peer_title, peer_avatar FROM events WHERE peer_id IS NOT NULL ORDER BY peer_id")  # Запрос уникальных чатов с названиями и аватарами
-            rows = cursor.fetchall()  # Читаем строки
-        return [  # Возвращаем список словарей с ID и названием
-            {"id": row["peer_id"], "title": row["peer_title"], "avatar": row["peer_avatar"]}  # Словарь с ID, названием и аватаром
-            for row in rows  # Перебираем строки результата
-            if row["peer_id"] is not None  # Фильтруем пустые значения
-        ]
+        with self._peers_lock:  # Читаем и при необходимости пересобираем набор чатов
+            if self._peer_keys is None:  # Набор еще не загружен или сброшен после удаления
+                self.flush()  # Ждем запись очереди: пока набор не загружен, log_many не запоминает новые чаты, и без этого они потерялись бы до следующего сброса
+                with self._reader() as connection:  # Читаем через пул уже записанные строки
+                    rows = connection.execute(PEERS_SELECT_SQL).fetchall()  # Один DISTINCT по таблице, дальше набор пополняет log_many
+                self._peer_keys = {(row["peer_id"], row["peer_title"], row["peer_avatar"]) for row in rows if row["peer_id"] is not None}  # Запоминаем тройки чатов
+                self._peers_list = None  # Список соберем ниже
+            if self._peers_list is None:  # Набор менялся с прошлой сборки
+                self._peers_list = [  # Собираем список словарей с ID, названием и аватаром
+                    {"id": peer_id, "title": title, "avatar": avatar}  # Словарь с ID, названием и аватаром
+                    for peer_id, title, avatar in sorted(self._peer_keys, key=lambda key: key[0])  # Порядок по peer_id, как в запросе
+                ]
+            peers = self._peers_list  # Берем ссылку на готовый список под блокировкой
+        return [dict(peer) for peer in peers]  # Возвращаем копии, чтобы вызывающий код не испортил кэш
 
     def count_messages_by_peer(self) -> Dict[int, int]:
-        with self._lock:  # Начинаем потокобезопасное чтение
-            cursor = self._connection.cursor()  # Берем курсор для запроса
-            cursor.execute(  # Выполняем агрегатный запрос по количеству сообщений
+        self.flush_if_idle()  # Дописываем очередь, только если запись не занята
+        with self._reader() as connection:  # Читаем снимок WAL через пул, не дожидаясь блокировки записи
+            rows = connection.execute(  # Выполняем агрегатный запрос по количеству сообщений
                 "SELECT peer_id, COUNT(*) AS cnt FROM events WHERE event_type = ? AND peer_id IS NOT NULL GROUP BY peer_id",
                 ("message",),
-            )
-            rows = cursor.fetchall()  # Читаем результаты
+            ).fetchall()  # Читаем результаты
         return {int(row["peer_id"]): int(row["cnt"]) for row in rows if row["peer_id"] is not None}  # Возвращаем словарь peer_id->количество
 
     def summarize_peer(self, peer_id: int) -> Optional[Dict[str, object]]:
-        with self._lock:  # Начинаем потокобезопасное чтение
-            cursor = self._connection.cursor()  # Берем курсор
-            cursor.execute(  # Считаем основную статистику по чату
+        self.flush_if_idle()  # Дописываем очередь, только если запись не занята
+        with self._reader() as connection:  # Читаем снимок WAL через пул, не дожидаясь блокировки записи
+            summary_row = connection.execute(  # Считаем основную статистику по чату
                 """
                 SELECT
                     peer_id,
@@ -443,9 +914,8 @@ class EventLogger:
                 WHERE event_type = 'message' AND peer_id = ?
                 """,
                 (int(peer_id),),
-            )
-            summary_row = cursor.fetchone()  # Читаем результат агрегации
-            cursor.execute(  # Подтягиваем последнюю строку с ненулевым названием для корректной подписи
+            ).fetchone()  # Читаем результат агрегации
+            title_row = connection.execute(  # Подтягиваем последнюю строку с ненулевым названием для корректной подписи
                 """
                 SELECT peer_title, peer_avatar
                 FROM events
@@ -454,8 +924,7 @@ class EventLogger:
                 LIMIT 1
                 """,
                 (int(peer_id),),
-            )
-            title_row = cursor.fetchone()  # Читаем строку с названием
+            ).fetchone()  # Читаем строку с названием
         if not summary_row or summary_row["total_messages"] == 0:  # Проверяем, есть ли сообщения у чата
             return None  # Возвращаем пустой результат при отсутствии данных
         return {  # Собираем словарь сводки по чату
@@ -468,9 +937,9 @@ class EventLogger:
         }
 
     def summarize_user(self, user_id: int) -> Optional[Dict[str, object]]:
-        with self._lock:  # Начинаем потокобезопасное чтение
-            cursor = self._connection.cursor()  # Берем курсор
-            cursor.execute(  # Считаем основную статистику по пользователю
+        self.flush_if_idle()  # Дописываем очередь, только если запись не занята
+        with self._reader() as connection:  # Читаем снимок WAL через пул, не дожидаясь блокировки записи
+            summary_row = connection.execute(  # Считаем основную статистику по пользователю
                 """
                 SELECT
                     from_id,
@@ -483,9 +952,8 @@ class EventLogger:
                 WHERE event_type = 'message' AND from_id = ?
                 """,
                 (int(user_id),),
-            )
-            summary_row = cursor.fetchone()  # Читаем результат агрегации
-            cursor.execute(  # Ищем последнюю запись с заполненным именем, чтобы показать его в карточке
+            ).fetchone()  # Читаем результат агрегации
+            name_row = connection.execute(  # Ищем последнюю запись с заполненным именем, чтобы показать его в карточке
                 """
                 SELECT from_name, from_avatar
                 FROM events
@@ -494,8 +962,7 @@ class EventLogger:
                 LIMIT 1
                 """,
                 (int(user_id),),
-            )
-            name_row = cursor.fetchone()  # Читаем строку с именем
+            ).fetchone()  # Читаем строку с именем
         if not summary_row or summary_row["total_messages"] == 0:  # Проверяем наличие сообщений пользователя
             return None  # Возвращаем пустой результат при отсутствии данных
         return {  # Собираем словарь сводки по пользователю
@@ -509,19 +976,8 @@ class EventLogger:
 
     def fetch_messages_by_user(
         self, user_id: int, limit: int = 50, peer_id: Optional[int] = None, offset: int = 0
-    ) -> List[Dict]:
-        with self._lock:  # Начинаем безопасное чтение
-            cursor = self._connection.cursor()  # Берем курсор
-            params: List[object] = ["message", int(user_id)]  # Готовим параметры запроса
-            base_query = "SELECT * FROM events WHERE event_type = ? AND from_id = ?"  # Базовый запрос по отправителю
-            if peer_id is not None:  # Если нужно ограничить конкретным чатом
-                base_query += " AND peer_id = ?"  # Добавляем фильтр по чату
-                params.append(int(peer_id))  # Подставляем значение peer_id
-            base_query += " ORDER BY id DESC LIMIT ? OFFSET ?"  # Добавляем сортировку и пагинацию
-            params.extend([int(limit), max(0, int(offset))])  # Добавляем лимит и смещение с защитой от отрицательных значений
-            cursor.execute(base_query, tuple(params))  # Выполняем запрос
-            rows = cursor.fetchall()  # Читаем строки
-        return [dict(row) for row in rows]  # Возвращаем список словарей
+    ) -> List[sqlite3.Row]:
+        return self.fetch_messages(peer_id=peer_id, limit=limit, offset=offset, from_id=user_id)  # Та же выборка, что и лента, с фильтром по отправителю
 
     def count_messages(self, range_minutes: Optional[int] = None) -> int:
         now = datetime.now().astimezone()  # Берем текущее локальное время
@@ -531,10 +987,9 @@ class EventLogger:
             since = (now - timedelta(minutes=range_minutes)).isoformat()  # Вычисляем начальную точку диапазона
             base_query += " AND created_at >= ?"  # Добавляем условие по времени
             params.append(since)  # Добавляем значение в параметры
-        with self._lock:  # Начинаем потокобезопасное чтение
-            cursor = self._connection.cursor()  # Получаем курсор для запроса
-            cursor.execute(base_query, params)  # Выполняем запрос с параметрами
-            row = cursor.fetchone()  # Читаем единственную строку результата
+        self.flush_if_idle()  # Дописываем очередь, только если запись не занята
+        with self._reader() as connection:  # Читаем снимок WAL через пул, не дожидаясь блокировки записи
+            row = connection.execute(base_query, params).fetchone()  # Читаем единственную строку результата
         return int(row["cnt"] if row else 0)  # Возвращаем количество или 0
 
     def fetch_timeline(self, range_minutes: int = 60, max_points: int = 120) -> List[Dict[str, object]]:
@@ -549,8 +1004,11 @@ class EventLogger:
             aligned_since -= timedelta(minutes=offset)  # Сдвигаем старт на границу корзины для ровной сетки
         bucket_count = ((safe_range + bucket_minutes - 1) // bucket_minutes) + 1  # Определяем количество корзин с запасом на текущий момент
         buckets: List[Dict[str, object]] = []  # Готовим список корзин для детерминированной оси времени
-        for idx in range(bucket_count):  # Перебираем индексы корзин
-            bucket_start = aligned_since + timedelta(minutes=bucket_minutes * idx)  # Считаем начало корзины по индексу
+        bucket_step = timedelta(minutes=bucket_minutes)  # Шаг сетки создаем один раз
+        bucket_start = aligned_since  # Начало первой корзины
+        for _ in range(bucket_count):  # Перебираем корзины сетки
+            if bucket_start > now:  # Корзины из будущего не показываем
+                break  # Остальные начинаются еще позже
             buckets.append(  # Добавляем корзину в список
                 {
                     "time": bucket_start.isoformat(),  # Сохраняем начало корзины для подписи оси
@@ -559,49 +1017,132 @@ class EventLogger:
                     "invites": 0,  # Резервируем поле приглашений для совместимости интерфейса
                 }
             )
-        with self._lock:  # Начинаем потокобезопасное чтение
-            cursor = self._connection.cursor()  # Получаем курсор
-            cursor.execute(  # Запрашиваем сообщения начиная с нижней границы
-                "SELECT created_at FROM events WHERE event_type = ? AND created_at >= ? ORDER BY created_at",
-                ("message", since_dt.isoformat()),
-            )
-            rows = cursor.fetchall()  # Читаем все строки
-        total_seconds_per_bucket = bucket_minutes * 60  # Вычисляем длительность корзины в секундах
-        for row in rows:  # Перебираем строки результата
-            created_raw = row.get("created_at") if isinstance(row, dict) else row[0] if row else None  # Достаем поле времени
-            try:  # Пытаемся преобразовать в datetime
-                created_at = datetime.fromisoformat(created_raw) if created_raw else None  # Парсим ISO-строку
-            except Exception:  # Если формат некорректный
-                continue  # Пропускаем запись
-            if not created_at:  # Проверяем, что дата есть
-                continue  # Пропускаем пустые
-            if created_at.tzinfo is None:  # Проверяем наличие таймзоны
-                created_at = created_at.replace(tzinfo=now.tzinfo)  # Добавляем локальную зону, чтобы не смещать время
-            delta_seconds = (created_at - aligned_since).total_seconds()  # Считаем смещение точки относительно первой корзины
-            bucket_index = int(delta_seconds // total_seconds_per_bucket) if delta_seconds >= 0 else None  # Определяем индекс корзины
-            if bucket_index is None or bucket_index >= len(buckets):  # Проверяем попадание в диапазон корзин
-                continue  # Пропускаем точки вне окна просмотра
-            buckets[bucket_index]["events"] += 1  # Увеличиваем количество событий
-            buckets[bucket_index]["messages"] += 1  # Увеличиваем количество сообщений
-        return [bucket for bucket in buckets if bucket["time"] <= now.isoformat()]  # Возвращаем корзины до текущего момента
-
-
-class ServiceEventLogger:  # Логгер сервисных событий с отдельной таблицей
+            bucket_start += bucket_step  # Следующая корзина сложением, без умножения timedelta на индекс
+        self.flush_if_idle()  # Дописываем очередь, только если запись не занята
+        aligned_unix = int(aligned_since.timestamp())  # Начало первой корзины в UNIX-времени
+        with self._reader() as connection:  # Читаем снимок WAL через пул, не дожидаясь блокировки записи
+            rows = connection.execute(  # Раскладываем сообщения по корзинам прямо в SQLite, без разбора строк времени в Python
+                TIMELINE_BUCKETS_SQL,
+                (aligned_unix, bucket_minutes * 60, "message", since_dt.isoformat(), aligned_unix),
+            ).fetchall()  # Одна строка на непустую корзину
+        for bucket_index, count in rows:  # Переносим счетчики в заранее построенную сетку
+            if bucket_index < len(buckets):  # Точки позже текущей корзины пропускаем
+                buckets[bucket_index]["events"] = count  # Количество событий в корзине
+                buckets[bucket_index]["messages"] = count  # Количество сообщений в корзине
+        return buckets  # Корзины до текущего момента
+
+
+class ServiceEventLogger(ReadPoolMixin):  # Логгер сервисных событий с отдельной таблицей
     """Хранит сервисные оповещения с типом и пояснением."""
 
-    def __init__(self, db_path: str):
+    def __init__(self, db_path: str, writer: Optional[EventLogger] = None):
         self.db_path = db_path  # Путь до файла базы
+        self._writer = writer  # Логгер событий, с которым делим соединение записи и поток сброса
+        self._pending: Deque[tuple] = deque()  # Сервисные события, ожидающие пакетной вставки
+        self._flush_wakeup = threading.Event()  # Сигнал досрочного сброса при накоплении большой пачки
+        self._stop_event = threading.Event()  # Флаг остановки фонового потока записи
+        self._closed = False  # Признак закрытого логгера
+        self._read_pool: List[sqlite3.Connection] = []  # Свободные соединения только для чтения
+        self._counts: Optional[Dict[str, int]] = None  # Количество событий по типам; None — нужно перечитать из базы
+        self._counts_version = 0  # Растет при каждой записи и очистке, чтобы загрузка счетчиков не затерла свежие данные
+        self._counts_writing = False  # Идет запись пачки: загруженные в это время счетчики не сохраняются
+        self._counts_lock = threading.Lock()  # Защищает счетчики, не трогая блокировку записи
+        if writer is not None:  # Таблицы лежат в одной базе с событиями
+            self._connection = writer._connection  # Пишем через единственное соединение записи
+            self._lock = writer._lock  # И под той же блокировкой, чтобы два писателя не ждали друг друга в SQLite
+            self._ensure_schema()  # Создаем схему при инициализации
+            writer.service_log = self  # Поток записи логгера событий сбрасывает и нашу очередь
+            self._flusher = None  # Собственный поток не нужен
+            return  # Остальная настройка соединения уже сделана логгером событий
         db_dir = os.path.dirname(self.db_path)  # Директория файла базы
         if db_dir:  # Если путь включает директорию
             os.makedirs(db_dir, exist_ok=True)  # Создаем директорию при необходимости
-        self._connection = sqlite3.connect(self.db_path, check_same_thread=False)  # Открываем соединение с разрешением мультипоточности
+        self._connection = sqlite3.connect(self.db_path, check_same_thread=False, timeout=5.0, isolation_level=None)  # Транзакции открываем явно, драйвер не вставляет неявный BEGIN
         self._connection.row_factory = sqlite3.Row  # Включаем доступ к колонкам по имени
+        self._connection.execute("PRAGMA journal_mode=WAL")  # WAL: запись сервисных событий не блокирует чтение дашборда
+        self._connection.execute("PRAGMA synchronous=NORMAL")  # В режиме WAL fsync нужен только на чекпоинтах
+        self._connection.execute("PRAGMA temp_store=MEMORY")  # Временные структуры сортировок держим в памяти
+        self._connection.execute("PRAGMA cache_size=-16000")  # Страничный кэш ~16 МБ: таблица сервисных событий небольшая
+        self._connection.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")  # Страницы читаем через mmap
         self._lock = threading.Lock()  # Создаем блокировку для потокобезопасных операций
         self._ensure_schema()  # Создаем схему при инициализации
+        self._flusher = threading.Thread(target=self._flush_loop, daemon=True)  # Фоновый поток пакетной записи событий
+        self._flusher.start()  # Запускаем поток записи
+        atexit.register(self.close)  # При выходе дописываем очередь, чтобы не потерять последние ошибки
+
+    def _flush_loop(self) -> None:
+        while not self._stop_event.is_set():  # Работаем до сигнала остановки
+            self._flush_wakeup.wait(EVENT_FLUSH_INTERVAL)  # Ждем таймаут или сигнал о заполненной пачке
+            self._flush_wakeup.clear()  # Сбрасываем сигнал перед записью
+            try:  # Пробуем записать накопленные строки
+                self.flush()  # Сбрасываем очередь одной транзакцией
+            except sqlite3.ProgrammingError:  # Соединение уже закрыто
+                break  # Завершаем поток, писать больше некуда
+            except Exception as exc:  # Любая другая ошибка записи
+                logger.exception("Не удалось записать пачку сервисных событий в базу: %s", exc)  # Логируем сбой и продолжаем работу
+
+    def flush(self) -> None:
+        """Записывает накопленные сервисные события одной транзакцией."""
+
+        if not self._pending:  # Если очередь пуста
+            return  # Не трогаем соединение
+        with self._lock:  # Берем блокировку записи
+            self._write_pending()  # Пишем пачку
+
+    def _wake_flusher(self) -> None:
+        (self._writer._flush_wakeup if self._writer is not None else self._flush_wakeup).set()  # Будим поток записи досрочно
+
+    def _write_pending(self) -> None:
+        """Пишет очередь одной транзакцией; вызывается под блокировкой записи."""
+
+        batch = []  # Готовим пачку строк
+        while self._pending:  # Забираем всё, что накопилось к этому моменту
+            batch.append(self._pending.popleft())  # Переносим строку из очереди в пачку
+        if not batch:  # Другой поток мог успеть забрать очередь
+            return  # Писать нечего
+        with self._counts_lock:  # До коммита запрещаем сохранять загруженные счетчики
+            self._counts_version += 1  # Загрузка, начатая до этой пачки, не сохранит свой результат
+            self._counts_writing = True  # Загрузка во время записи не знает, попала ли в нее пачка
+        committed = False  # Пачка еще не записана
+        try:  # Пишем пачку целиком
+            self._connection.execute("BEGIN IMMEDIATE")  # Сразу берем блокировку записи на всю пачку
+            self._connection.executemany(SERVICE_EVENT_INSERT_SQL, batch)  # Вставляем все строки одним вызовом
+            self._connection.commit()  # Фиксируем транзакцию одним коммитом
+            committed = True  # Пачка видна читателям
+        except Exception:  # При ошибке вставки
+            self._connection.rollback()  # Откатываем незавершенную транзакцию
+            raise  # Пробрасываем ошибку вызывающему коду
+        finally:  # Счетчики обновляем и при ошибке, чтобы снять отметку записи
+            with self._counts_lock:  # Обновляем счетчики под их собственной блокировкой
+                self._counts_version += 1  # Загрузка, начатая во время записи, не сохранит свой результат
+                self._counts_writing = False  # Запись закончена
+                if committed and self._counts is not None:  # Счетчики загружены до начала записи, пачки в них нет
+                    for row in batch:  # Учитываем записанные строки
+                        self._counts[row[1]] = self._counts.get(row[1], 0) + 1  # Тип события — вторая колонка строки
+
+    def close(self) -> None:
+        """Останавливает фоновую запись, сбрасывает очередь и закрывает соединение."""
+
+        if self._closed:  # Повторный вызов, например из atexit после явного закрытия
+            return  # Соединение уже закрыто
+        self._closed = True  # Запоминаем, что логгер закрыт
+        if self._writer is not None:  # Соединение принадлежит логгеру событий
+            self.flush()  # Дописываем остатки очереди, а закрытие оставляем владельцу
+            self._writer.service_log = None  # Отцепляемся от его потока записи
+            self._close_readers()  # Свои соединения чтения закрываем
+            return  # Закрывать чужое соединение нельзя
+        atexit.unregister(self.close)  # Снимаем обработчик выхода
+        self._stop_event.set()  # Просим поток записи завершиться
+        self._flush_wakeup.set()  # Будим поток, чтобы он не ждал таймаут
+        self._flusher.join(timeout=1)  # Ждем завершения потока
+        self.flush()  # Дописываем остатки очереди
+        self._close_readers()  # Закрываем соединения чтения
+        self._connection.close()  # Закрываем соединение с базой
 
     def _ensure_schema(self) -> None:
         with self._lock:  # Начинаем защищенный доступ
             cursor = self._connection.cursor()  # Берем курсор
+            cursor.execute("BEGIN")  # Таблицы, индекс и метаданные создаем одной транзакцией
             cursor.execute(  # Создаем таблицу сервисных событий при отсутствии
                 """
                 CREATE TABLE IF NOT EXISTS service_events (
@@ -614,8 +1155,7 @@ class ServiceEventLogger:  # Логгер сервисных событий с 
                 )
                 """
             )
-            self._connection.commit()  # Сохраняем изменения схемы
-
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_service_type_id ON service_events(event_type, id DESC)")  # Индекс для фильтра по типу и счетчика непрочитанных важных событий
             cursor.execute(  # Создаем таблицу для служебных метаданных, если её ещё нет
                 """
                 CREATE TABLE IF NOT EXISTS service_meta (
@@ -627,7 +1167,7 @@ class ServiceEventLogger:  # Логгер сервисных событий с 
             cursor.execute(  # Готовим дефолтную запись с последним просмотренным важным событием
                 "INSERT OR IGNORE INTO service_meta (key, value) VALUES ('last_seen_important_id', '0')"
             )
-            self._connection.commit()  # Сохраняем изменения для метаданных
+            self._connection.commit()  # Сохраняем схему и метаданные одним коммитом
 
     def _classify_event(self, status_code: int) -> str:
         if status_code >= 500:  # Ошибка сервера
@@ -637,23 +1177,16 @@ class ServiceEventLogger:  # Логгер сервисных событий с 
         return "info"  # По умолчанию информационный тип
 
     def log_event(self, status_code: int, description: str, message: str) -> None:
-        created_at = datetime.now().astimezone().isoformat()  # Фиксируем локальное время с таймзоной
+        created_at = now_local_timestamp()  # Локальное время с таймзоной из посекундного кэша
         event_type = self._classify_event(status_code)  # Определяем тип события по коду
-        with self._lock:  # Начинаем защищенную запись
-            cursor = self._connection.cursor()  # Берем курсор
-            cursor.execute(  # Вставляем новую строку в таблицу
-                """
-                INSERT INTO service_events (created_at, event_type, status_code, description, message)
-                VALUES (?, ?, ?, ?, ?)
-                """,
-                (created_at, event_type, status_code, description, message),
-            )
-            self._connection.commit()  # Сохраняем изменения
+        self._pending.append((created_at, event_type, status_code, description, message))  # Ставим строку в очередь, коммит сделает фоновый поток
+        if len(self._pending) >= EVENT_FLUSH_BATCH:  # Пачка набралась раньше таймаута
+            self._wake_flusher()  # Будим поток записи досрочно
 
     def fetch_events(self, event_type: Optional[str] = None, limit: int = 50, offset: int = 0) -> List[Dict]:
-        with self._lock:  # Начинаем защищенное чтение
-            cursor = self._connection.cursor()  # Берем курсор
-            base_query = "SELECT * FROM service_events"  # Базовый запрос
+        self.flush_if_idle()  # Дописываем очередь, только если запись не занята
+        with self._reader() as connection:  # Читаем снимок WAL через пул, не дожидаясь блокировки записи
+            base_query = "SELECT id, created_at, event_type, status_code, description, message FROM service_events"  # Базовый запрос с колонками, которые отдает API
             params: List[object] = []  # Список параметров
             if event_type == "important":  # Если нужно вернуть важные события
                 base_query += " WHERE event_type IN ('warning', 'error')"  # Добавляем фильтр по типу
@@ -662,88 +1195,98 @@ class ServiceEventLogger:  # Логгер сервисных событий с 
                 params.append(event_type)  # Добавляем значение условия
             base_query += " ORDER BY id DESC LIMIT ? OFFSET ?"  # Добавляем сортировку и пагинацию
             params.extend([limit, offset])  # Добавляем лимит и смещение
-            cursor.execute(base_query, params)  # Выполняем запрос
-            rows = cursor.fetchall()  # Получаем результаты
+            rows = connection.execute(base_query, params).fetchall()  # Получаем результаты
             return [dict(row) for row in rows]  # Возвращаем список словарей
 
     def count_events(self, event_type: Optional[str] = None) -> int:
-        with self._lock:  # Начинаем защищенный доступ
-            cursor = self._connection.cursor()  # Берем курсор
-            base_query = "SELECT COUNT(*) FROM service_events"  # Базовый запрос подсчета
-            params: List[object] = []  # Параметры запроса
-            if event_type == "important":  # Фильтр важных событий
-                base_query += " WHERE event_type IN ('warning', 'error')"  # Ограничиваем типы
-            elif event_type:  # Фильтр конкретного типа
-                base_query += " WHERE event_type = ?"  # Добавляем условие
-                params.append(event_type)  # Добавляем значение параметра
-            cursor.execute(base_query, params)  # Выполняем запрос
-            result = cursor.fetchone()  # Получаем строку с количеством
-            return int(result[0]) if result else 0  # Возвращаем число
+        self.flush_if_idle()  # Дописываем очередь, только если запись не занята
+        with self._counts_lock:  # Снимок счетчиков и их версии
+            counts = dict(self._counts) if self._counts is not None else None  # Копия, чтобы считать без блокировки
+            version = self._counts_version  # Версия до чтения из базы
+        if counts is None:  # Счетчики еще не загружены
+            with self._reader() as connection:  # Считаем через пул чтения, не дожидаясь пачек, обрезки и VACUUM
+                rows = connection.execute("SELECT event_type, COUNT(*) FROM service_events GROUP BY event_type").fetchall()  # Один проход по индексу типов
+            counts = {row[0]: int(row[1]) for row in rows}  # Счетчики по снимку базы
+            with self._counts_lock:  # Сохраняем результат, если за время чтения ничего не записали
+                if self._counts is None and self._counts_version == version and not self._counts_writing:  # Пачка, записанная во время чтения, могла попасть в снимок, а могла и нет
+                    self._counts = dict(counts)  # Дальше счетчики пополняет запись пачек
+        if event_type == "important":  # Фильтр важных событий
+            return counts.get("warning", 0) + counts.get("error", 0)  # Складываем предупреждения и ошибки
+        if event_type:  # Фильтр конкретного типа
+            return counts.get(event_type, 0)  # Количество событий выбранного типа
+        return sum(counts.values())  # Количество всех событий
 
     def count_unread_important(self) -> int:
-        with self._lock:  # Начинаем защищенный доступ
-            cursor = self._connection.cursor()  # Берем курсор
-            cursor.execute(  # Читаем последний просмотренный ID важных событий
+        self.flush_if_idle()  # Дописываем очередь, только если запись не занята
+        with self._reader() as connection:  # Читаем снимок WAL через пул, не дожидаясь блокировки записи
+            row = connection.execute(  # Читаем последний просмотренный ID важных событий
                 "SELECT value FROM service_meta WHERE key = 'last_seen_important_id'"
-            )
-            row = cursor.fetchone()  # Получаем строку результата
+            ).fetchone()  # Получаем строку результата
             last_seen_raw = row[0] if row else "0"  # Извлекаем сохраненное значение
             try:
                 last_seen = int(last_seen_raw)  # Пробуем привести к числу
             except (TypeError, ValueError):
                 last_seen = 0  # При неудаче используем ноль
-            cursor.execute(  # Считаем количество предупреждений и ошибок после последнего просмотра
+            result = connection.execute(  # Считаем количество предупреждений и ошибок после последнего просмотра
                 """
                 SELECT COUNT(*) FROM service_events
                 WHERE event_type IN ('warning', 'error') AND id > ?
                 """,
                 (last_seen,),
-            )
-            result = cursor.fetchone()  # Получаем строку результата
+            ).fetchone()  # Получаем строку результата
             return int(result[0]) if result else 0  # Возвращаем количество непрочитанных важных событий
 
     def mark_important_read(self) -> int:
-        with self._lock:  # Начинаем защищенный доступ
+        with self._lock:  # Это запись, блокировку берем один раз и на очередь, и на отметку
+            self._write_pending()  # Дописываем очередь, чтобы отметка покрыла и свежие события
             cursor = self._connection.cursor()  # Берем курсор
-            cursor.execute(  # Ищем максимальный ID среди важных событий
-                "SELECT COALESCE(MAX(id), 0) FROM service_events WHERE event_type IN ('warning', 'error')"
-            )
-            max_id_row = cursor.fetchone()  # Получаем строку результата
-            max_id = int(max_id_row[0]) if max_id_row else 0  # Безопасно приводим к числу
-            cursor.execute(  # Обновляем сохраненный последний просмотренный ID
-                """
-                INSERT INTO service_meta (key, value)
-                VALUES ('last_seen_important_id', ?)
-                ON CONFLICT(key) DO UPDATE SET value = excluded.value
-                """,
-                (str(max_id),),
-            )
-            self._connection.commit()  # Фиксируем изменения
+            cursor.execute("BEGIN IMMEDIATE")  # Чтение максимума и запись отметки идут одной транзакцией
+            try:  # Выполняем транзакцию целиком
+                cursor.execute(  # Ищем максимальный ID среди важных событий
+                    "SELECT COALESCE(MAX(id), 0) FROM service_events WHERE event_type IN ('warning', 'error')"
+                )
+                max_id_row = cursor.fetchone()  # Получаем строку результата
+                max_id = int(max_id_row[0]) if max_id_row else 0  # Безопасно приводим к числу
+                cursor.execute(  # Обновляем сохраненный последний просмотренный ID
+                    """
+                    INSERT INTO service_meta (key, value)
+                    VALUES ('last_seen_important_id', ?)
+                    ON CONFLICT(key) DO UPDATE SET value = excluded.value
+                    """,
+                    (str(max_id),),
+                )
+                self._connection.commit()  # Фиксируем изменения
+            except Exception:  # При ошибке записи
+                self._connection.rollback()  # Откатываем незавершенную транзакцию
+                raise  # Пробрасываем ошибку вызывающему коду
             return max_id  # Возвращаем установленный ID для возможного дальнейшего использования
 
     def clear_events(self) -> None:
         with self._lock:  # Начинаем защищенную операцию
+            self._write_pending()  # Дописываем очередь под той же блокировкой, чтобы очистка удалила и её
             cursor = self._connection.cursor()  # Берем курсор
-            cursor.execute("DELETE FROM service_events")  # Удаляем все строки
-            self._connection.commit()  # Сохраняем изменения
-            cursor.execute(  # Сбрасываем отметку прочитанного при полной очистке
-                """
-                INSERT INTO service_meta (key, value)
-                VALUES ('last_seen_important_id', '0')
-                ON CONFLICT(key) DO UPDATE SET value = excluded.value
-                """
-            )
-            self._connection.commit()  # Фиксируем сброс метаданных
+            cursor.execute("BEGIN IMMEDIATE")  # Удаление и сброс отметки идут одной транзакцией
+            try:  # Выполняем транзакцию целиком
+                cursor.execute("DELETE FROM service_events")  # Удаляем все строки
+                cursor.execute(  # Сбрасываем отметку прочитанного при полной очистке
+                    """
+                    INSERT INTO service_meta (key, value)
+                    VALUES ('last_seen_important_id', '0')
+                    ON CONFLICT(key) DO UPDATE SET value = excluded.value
+                    """
+                )
+                self._connection.commit()  # Фиксируем удаление и сброс метаданных
+            except Exception:  # При ошибке записи
+                self._connection.rollback()  # Откатываем незавершенную транзакцию
+                raise  # Пробрасываем ошибку вызывающему коду
+            with self._counts_lock:  # Сбрасываем счетчики под их блокировкой
+                self._counts = {}  # После очистки событий нет ни одного типа
+                self._counts_version += 1  # Загрузка, начатая до очистки, не сохранит старые числа
         self._vacuum()  # Запускаем VACUUM вне блокировки, чтобы уменьшить файл базы после очистки
 
     def _vacuum(self) -> None:
         with self._lock:  # Начинаем защищенную операцию
-            original_isolation = self._connection.isolation_level  # Запоминаем исходный режим автокоммита
-            self._connection.isolation_level = None  # Переключаем соединение в автокоммит для VACUUM
-            try:  # Оборачиваем в try/finally, чтобы гарантировать возврат настроек
-                self._connection.execute("VACUUM")  # Запускаем VACUUM для физического сжатия файла базы
-            finally:  # Независимо от результата
-                self._connection.isolation_level = original_isolation  # Возвращаем исходный режим автокоммита
+            self._connection.execute("VACUUM")  # Соединение без неявных транзакций, VACUUM выполняется сразу
 
 
 class BotMonitor:
@@ -756,9 +1299,9 @@ class BotMonitor:
         self.session = vk_api.VkApi(token=self.token)  # Сессия VK API для запросов
         self._stop_event = threading.Event()  # Флаг корректной остановки потока
         self.event_logger = event_logger  # Объект записи логов
-        self.user_cache: Dict[int, Dict[str, Optional[str]]] = {}  # Кэш профилей пользователей (имя и аватар)
-        self.group_cache: Dict[int, Dict[str, Optional[str]]] = {}  # Кэш профилей сообществ (имя и аватар)
-        self.peer_cache: Dict[int, Dict[str, Optional[str]]] = {}  # Кэш профилей чатов по peer_id
+        self.user_cache: "OrderedDict[int, Dict[str, Optional[str]]]" = OrderedDict()  # Кэш профилей пользователей (имя и аватар)
+        self.group_cache: "OrderedDict[int, Dict[str, Optional[str]]]" = OrderedDict()  # Кэш профилей сообществ (имя и аватар)
+        self.peer_cache: "OrderedDict[int, Dict[str, Optional[str]]]" = OrderedDict()  # Кэш профилей чатов по peer_id
         self.attachments_dir = ATTACHMENTS_ROOT  # Используем общую директорию для вложений
         self.attachments_dir.mkdir(parents=True, exist_ok=True)  # Создаем директории для вложений при инициализации
         self.sticker_cache_dir = self.attachments_dir / "stickers"  # Директория для кэша стикеров по их ID
@@ -981,7 +1524,7 @@ class BotMonitor:
         if url:  # Если ссылка найдена
             return f"{att_type or 'file'}:{url}"  # Формируем сигнатуру по типу и ссылке
         try:  # Пытаемся сформировать сигнатуру из JSON
-            return json.dumps(attachment, sort_keys=True, ensure_ascii=False)  # Возвращаем сериализованную сигнатуру
+            return orjson.dumps(attachment, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS).decode("utf-8")  # Возвращаем сериализованную сигнатуру
         except Exception:  # Ловим ошибки сериализации
             return None  # Возвращаем пустое значение при ошибке
 
@@ -1251,106 +1794,258 @@ class BotMonitor:
         listener_thread.start()  # Запускаем поток с лонгпуллом
         logger.info("Лонгпулл запущен в фоновом потоке")  # Пишем в лог успешный запуск
 
+    def _backoff(self, attempt: int) -> None:
+        delay = min(LONGPOLL_BACKOFF_MAX, 2 ** attempt) + random.uniform(0, 1)  # Экспоненциальная пауза с разбросом, чтобы не долбить VK
+        self._stop_event.wait(delay)  # Ждем, но просыпаемся сразу при остановке монитора
+
     def _listen(self) -> None:
-        longpoll = VkBotLongPoll(self.session, self.group_id)  # Создаем слушателя событий сообщества
+        longpoll = None  # Слушатель создается в цикле, чтобы сбой при старте тоже переживался
+        attempt = 0  # Номер подряд идущей неудачной попытки
         while not self._stop_event.is_set():  # Цикл до получения сигнала остановки
             try:
-                for event in longpoll.listen():  # Перебираем входящие события VK
-                    if self._handle_deletion_event(event):  # Проверяем, является ли событие удалением сообщения
-                        continue  # Переходим к следующему событию, чтобы не считать его новым сообщением
-                    if event.type == VkBotEventType.MESSAGE_NEW:  # Если это новое сообщение
-                        message = event.object.message  # Извлекаем тело сообщения
-                        message = self._hydrate_message_details(message)  # Догружаем полную версию сообщения через API
-                        sender_profile = self._resolve_sender_profile(message.get("from_id"))  # Получаем имя и аватар отправителя
-                        sender_name = sender_profile.get("name")  # Извлекаем имя из профиля
-                        sender_avatar = sender_profile.get("avatar")  # Извлекаем аватар из профиля
-                        peer_profile = self._resolve_peer_profile(message.get("peer_id"), sender_name)  # Получаем название и аватар чата
-                        peer_title = peer_profile.get("title")  # Извлекаем название чата
-                        peer_avatar = peer_profile.get("avatar")  # Извлекаем аватар чата
-                        reply_message = message.get("reply_message") if isinstance(message.get("reply_message"), dict) else None  # Получаем исходное сообщение, если это ответ
-                        reply_from_id = reply_message.get("from_id") if isinstance(reply_message, dict) else None  # Определяем автора исходного сообщения
-                        reply_profile = self._resolve_sender_profile(reply_from_id) if reply_from_id else {"name": None, "avatar": None}  # Запрашиваем профиль автора исходного сообщения
-                        if isinstance(reply_message, dict):  # Проверяем, что блок ответа корректный
-                            reply_message = dict(reply_message)  # Копируем блок, чтобы не трогать оригинал VK
-                            reply_message["from_name"] = reply_profile.get("name")  # Добавляем имя автора исходного сообщения
-                            reply_message["from_avatar"] = reply_profile.get("avatar")  # Добавляем аватар автора исходного сообщения
-                            message["reply_message"] = reply_message  # Обновляем исходный payload VK для дальнейшей записи
-                        message["attachments"] = self._save_attachments(message.get("attachments", []), message.get("peer_id"), message.get("id"))  # Сохраняем вложения на диск и добавляем локальные пути
-                        if isinstance(reply_message, dict):  # Проверяем, что есть вложения в исходном сообщении
-                            reply_message["attachments"] = self._save_attachments(reply_message.get("attachments", []), message.get("peer_id"), reply_message.get("id"))  # Сохраняем вложения исходного сообщения
-                        copy_history = self._normalize_copy_history(message.get("copy_history"), message.get("peer_id"), message.get("id"))  # Нормализуем репосты и вложения внутри них
-                        if copy_history:  # Если репосты есть
-                            message["copy_history"] = copy_history  # Сохраняем нормализованный список в payload
-                        payload = {  # Собираем полезные данные для метрик
-                            "id": message.get("id"),  # ID сообщения
-                            "from_id": message.get("from_id"),  # ID отправителя
-                            "from_name": sender_name,  # Имя отправителя
-                            "from_avatar": sender_avatar,  # Аватар отправителя
-                            "peer_id": message.get("peer_id"),  # Диалог или чат
-                            "peer_title": peer_title,  # Название чата
-                            "peer_avatar": peer_avatar,  # Аватар чата
-                            "text": message.get("text"),  # Текст сообщения
-                            "attachments": message.get("attachments", []),  # Список вложений
-                            "copy_history": copy_history,  # Репосты с вложениями
-                            "reply_message": reply_message,  # Ответ, если есть
-                        }  # Конец сборки payload
-                        self.state.mark_event(payload, "message")  # Фиксируем событие в состоянии
-                        self.event_logger.log_event(
-                            "message",  # Тип события
-                            message,  # Сырой payload события
-                            peer_title=peer_title,  # Название чата
-                            from_name=sender_name,  # Имя отправителя
-                            peer_avatar=peer_avatar,  # Аватар чата
-                            from_avatar=sender_avatar,  # Аватар отправителя
-                        )  # Записываем исходный payload с именами и аватарами в базу
-                        logger.info(
-                            "Сообщение: peer %s -> %s",  # Текст для лога
-                            message.get("peer_id"),  # ID диалога
-                            message.get("text"),  # Содержимое сообщения
-                        )
-                    elif event.type in (
-                        VkBotEventType.CHAT_INVITE_USER,  # Приглашение пользователя
-                        VkBotEventType.CHAT_KICK_USER,  # Удаление пользователя
-                    ):
-                        self.state.mark_event({}, "invite")  # Фиксируем событие участников
-                        logger.info("Событие участников: %s", event.type)  # Пишем тип события в лог
-                    else:  # Для всех остальных типов
-                        self.state.mark_event({}, "other")  # Фиксируем как прочее
-                        logger.info("Получено событие: %s", event.type)  # Логируем тип события
-            except Exception as exc:  # Перехватываем ошибки в лонгпулле
-                self.state.errors += 1  # Увеличиваем счетчик ошибок
+                if longpoll is None:  # Первый запуск или переподключение
+                    longpoll = VkBotLongPoll(self.session, self.group_id)  # Получаем сервер лонгпулла с новым ключом
+                events = longpoll.check()  # Один запрос лонгпулла возвращает сразу всю пачку накопившихся событий
+            except (requests.RequestException, vk_api.ApiHttpError) as exc:  # Сетевой сбой или ответ VK не в формате API
+                self.state.mark_reconnect()  # Отмечаем потерю связи отдельно от ошибок обработки
+                logger.warning("Лонгпулл потерял связь, переподключаемся: %s", exc)  # Стек сетевой ошибки не нужен
+                longpoll = None  # Следующая попытка запросит новый сервер лонгпулла
+                self._backoff(attempt)  # Ждем перед переподключением
+                attempt += 1  # Следующая пауза будет длиннее
+                continue  # Повторяем запрос
+            except Exception as exc:  # Ошибка VK API или программная ошибка
+                self.state.mark_error()  # Увеличиваем счетчик ошибок и версию состояния
                 logger.exception("Ошибка лонгпулла: %s", exc)  # Пишем стек ошибки
+                self._backoff(attempt)  # Не крутим цикл вхолостую на повторяющейся ошибке
+                attempt += 1  # Следующая пауза будет длиннее
+                continue  # Повторяем запрос
+            attempt = 0  # Запрос прошел, сбрасываем паузу
+            try:  # Сбой обработки пачки не должен останавливать поток лонгпулла
+                messages: List[MessagePreview] = []  # Сообщения пачки для истории последних сообщений
+                rows: List[tuple] = []  # Строки пачки для записи в базу
+                invites = 0  # Количество событий участников в пачке
+                others = 0  # Количество прочих событий в пачке
+                self._prefetch_batch([event.object.message for event in events if event.type == VkBotEventType.MESSAGE_NEW])  # Профили всей пачки грузим заранее по одному запросу на тип
+                for event in events:  # Перебираем события пачки
+                    try:
+                        if self._handle_deletion_event(event):  # Проверяем, является ли событие удалением сообщения
+                            continue  # Переходим к следующему событию, чтобы не считать его новым сообщением
+                        if event.type == VkBotEventType.MESSAGE_NEW:  # Если это новое сообщение
+                            payload, row = self._prepare_message(event.object.message)  # Сохраняем вложения и собираем данные сообщения
+                            messages.append(payload)  # Копим сообщение для состояния
+                            rows.append(row)  # Копим строку для базы
+                            logger.info(
+                                "Сообщение: peer %s -> %s",  # Текст для лога
+                                payload.peer_id,  # ID диалога
+                                payload.text,  # Содержимое сообщения
+                            )
+                        elif event.type in MEMBER_EVENT_TYPES:  # Приглашение или удаление пользователя
+                            invites += 1  # Копим событие участников
+                            logger.info("Событие участников: %s", event.type)  # Пишем тип события в лог
+                        else:  # Для всех остальных типов
+                            others += 1  # Копим прочее событие
+                            logger.info("Получено событие: %s", event.type)  # Логируем тип события
+                    except Exception as exc:  # Ошибка одного события не должна терять остальную пачку
+                        self.state.mark_error()  # Увеличиваем счетчик ошибок и версию состояния
+                        logger.exception("Ошибка обработки события лонгпулла: %s", exc)  # Пишем стек ошибки
+                self.event_logger.log_many(rows)  # Отдаем все строки пачки в очередь записи одним вызовом
+                self.state.mark_events(messages, invites, others)  # Обновляем счетчики состояния один раз на пачку
+            except Exception as exc:  # Ошибка подготовки пачки, записи или обновления состояния
+                self.state.mark_error()  # Увеличиваем счетчик ошибок и версию состояния
+                logger.exception("Ошибка обработки пачки лонгпулла: %s", exc)  # Пишем стек ошибки
+
+    def _prepare_message(self, message: Dict) -> tuple[MessagePreview, tuple]:
+        """Догружает сообщение, профили и вложения; возвращает данные для состояния и строку для базы."""
+
+        message = self._hydrate_message_details(message)  # Догружаем полную версию сообщения через API
+        self._prefetch_sender_and_chat(message.get("from_id"), message.get("peer_id"))  # Новая пара пользователь+беседа грузится одним вызовом execute
+        self._prefetch_profiles(self._collect_author_ids(message))  # Загружаем профили отправителя, автора ответа и репостов одним запросом
+        sender_profile = self._resolve_sender_profile(message.get("from_id"))  # Получаем имя и аватар отправителя
+        sender_name = sender_profile.get("name")  # Извлекаем имя из профиля
+        sender_avatar = sender_profile.get("avatar")  # Извлекаем аватар из профиля
+        peer_profile = self._resolve_peer_profile(message.get("peer_id"), sender_name)  # Получаем название и аватар чата
+        peer_title = peer_profile.get("title")  # Извлекаем название чата
+        peer_avatar = peer_profile.get("avatar")  # Извлекаем аватар чата
+        reply_message = message.get("reply_message") if isinstance(message.get("reply_message"), dict) else None  # Получаем исходное сообщение, если это ответ
+        reply_from_id = reply_message.get("from_id") if isinstance(reply_message, dict) else None  # Определяем автора исходного сообщения
+        reply_profile = self._resolve_sender_profile(reply_from_id) if reply_from_id else {"name": None, "avatar": None}  # Запрашиваем профиль автора исходного сообщения
+        if isinstance(reply_message, dict):  # Проверяем, что блок ответа корректный
+            reply_message = dict(reply_message)  # Копируем блок, чтобы не трогать оригинал VK
+            reply_message["from_name"] = reply_profile.get("name")  # Добавляем имя автора исходного сообщения
+            reply_message["from_avatar"] = reply_profile.get("avatar")  # Добавляем аватар автора исходного сообщения
+            message["reply_message"] = reply_message  # Обновляем исходный payload VK для дальнейшей записи
+        message["attachments"] = self._save_attachments(message.get("attachments", []), message.get("peer_id"), message.get("id"))  # Сохраняем вложения на диск и добавляем локальные пути
+        if isinstance(reply_message, dict):  # Проверяем, что есть вложения в исходном сообщении
+            reply_message["attachments"] = self._save_attachments(reply_message.get("attachments", []), message.get("peer_id"), reply_message.get("id"))  # Сохраняем вложения исходного сообщения
+        copy_history = self._normalize_copy_history(message.get("copy_history"), message.get("peer_id"), message.get("id"))  # Нормализуем репосты и вложения внутри них
+        if copy_history:  # Если репосты есть
+            message["copy_history"] = copy_history  # Сохраняем нормализованный список в payload
+        payload = MessagePreview(  # Собираем полезные данные для метрик в компактный объект со слотами
+            id=message.get("id"),  # ID сообщения
+            from_id=message.get("from_id"),  # ID отправителя
+            from_name=sender_name,  # Имя отправителя
+            from_avatar=sender_avatar,  # Аватар отправителя
+            peer_id=message.get("peer_id"),  # Диалог или чат
+            peer_title=peer_title,  # Название чата
+            peer_avatar=peer_avatar,  # Аватар чата
+            text=message.get("text"),  # Текст сообщения
+            attachments=message.get("attachments", []),  # Список вложений
+            copy_history=copy_history,  # Репосты с вложениями
+            reply_message=reply_message,  # Ответ, если есть
+        )  # Конец сборки payload
+        return payload, self.event_logger.build_message_row(
+            message,  # Сырой payload события
+            peer_title=peer_title,  # Название чата
+            from_name=sender_name,  # Имя отправителя
+            peer_avatar=peer_avatar,  # Аватар чата
+            from_avatar=sender_avatar,  # Аватар отправителя
+        )  # Строка с исходным payload, именами и аватарами для базы
+
+    def _remember(self, cache: "OrderedDict[int, Dict[str, Optional[str]]]", key: int, profile: Dict[str, Optional[str]]) -> None:
+        cache[key] = profile  # Сохраняем профиль
+        cache.move_to_end(key)  # Обновленный профиль считается самым свежим
+        if len(cache) > PROFILE_CACHE_LIMIT:  # Если кэш вырос сверх лимита
+            cache.popitem(last=False)  # Вытесняем самый старый профиль
+
+    def _collect_author_ids(self, message: Dict) -> List[int]:
+        author_ids: List[int] = []  # Авторы, чьи профили понадобятся при записи сообщения
+        pending: List[object] = [message]  # Сообщение и вложенные блоки для обхода
+        while pending:  # Обходим ответ и репосты без рекурсии
+            block = pending.pop()  # Берем очередной блок
+            if not isinstance(block, dict):  # Пропускаем некорректные данные
+                continue  # Переходим к следующему блоку
+            from_id = block.get("from_id")  # Автор блока
+            if isinstance(from_id, int) and from_id not in author_ids:  # Запоминаем каждого автора один раз
+                author_ids.append(from_id)  # Добавляем автора в список
+            pending.append(block.get("reply_message"))  # Исходное сообщение ответа
+            if isinstance(block.get("copy_history"), list):  # Репосты
+                pending.extend(block["copy_history"])  # Добавляем репосты в обход
+        return author_ids  # Возвращаем найденных авторов
+
+    def _prefetch_profiles(self, author_ids: List[int]) -> None:
+        """Загружает профили всех незнакомых авторов сообщения одним запросом на тип."""
+
+        user_ids = [author_id for author_id in author_ids if author_id > 0 and author_id not in self.user_cache]  # Пользователи без профиля в кэше
+        group_ids = [-author_id for author_id in author_ids if author_id < 0 and author_id not in self.group_cache]  # Сообщества без профиля в кэше
+        try:  # Запросы к VK могут упасть, тогда профили подтянутся по одному
+            if len(user_ids) > 1:  # Одного пользователя загрузит обычный путь
+                response = self.session.method("users.get", {"user_ids": ",".join(map(str, user_ids)), "fields": "photo_50"})  # Запрашиваем всех пользователей сразу
+                for user in response if isinstance(response, list) else []:  # Перебираем найденных пользователей
+                    if not isinstance(user.get("id"), int):  # Пропускаем записи без ID
+                        continue  # Такой профиль не к чему привязать
+                    self._remember(self.user_cache, user.get("id"), self._user_profile(user))  # Кэшируем профиль пользователя
+            if len(group_ids) > 1:  # Одно сообщество загрузит обычный путь
+                response = self.session.method("groups.getById", {"group_ids": ",".join(map(str, group_ids)), "fields": "photo_50"})  # Запрашиваем все сообщества сразу
+                groups = response.get("groups", []) if isinstance(response, dict) else response  # Новые версии API оборачивают список в groups
+                for group in groups if isinstance(groups, list) else []:  # Перебираем найденные сообщества
+                    self._remember(self.group_cache, -int(group.get("id", 0)), self._group_profile(group))  # Кэшируем профиль сообщества
+        except Exception as exc:  # Обрабатываем ошибки VK API
+            logger.debug("Не удалось пакетно получить профили %s: %s", author_ids, exc)  # Пишем отладочный лог
+
+    def _prefetch_batch(self, messages: List[Dict]) -> None:
+        """Загружает профили авторов и бесед всей пачки лонгпулла, чтобы сообщения не ходили в VK по одному."""
+
+        messages = [message for message in messages if isinstance(message, dict)]  # Некорректные сообщения пропускаем, их разберет обычный путь
+        if len(messages) < 2:  # Одно сообщение загрузит обычный путь
+            return  # Пакетная загрузка не нужна
+        author_ids: List[int] = []  # Авторы всех сообщений пачки без повторов
+        for message in messages:  # Перебираем сообщения пачки
+            for author_id in self._collect_author_ids(message):  # Отправитель, автор ответа и авторы репостов
+                if author_id not in author_ids:  # Каждого автора запрашиваем один раз
+                    author_ids.append(author_id)  # Добавляем автора в список
+        self._prefetch_profiles(author_ids)  # Пользователи и сообщества грузятся одним запросом на тип
+        senders: Dict[int, Optional[int]] = {}  # Первый отправитель каждой незнакомой беседы пачки
+        for message in messages:  # Перебираем сообщения пачки
+            peer_id = message.get("peer_id")  # Беседа сообщения
+            if isinstance(peer_id, int) and peer_id >= 2000000000 and peer_id not in self.peer_cache:  # Только незнакомые беседы
+                senders.setdefault(peer_id, message.get("from_id"))  # Его имя станет запасным названием, как в _resolve_peer_profile
+        peer_ids = sorted(senders)  # Незнакомые беседы пачки
+        if len(peer_ids) < 2:  # Одну беседу загрузит обычный путь
+            return  # Пакетный запрос не нужен
+        try:  # Пробуем загрузить все беседы одним запросом
+            response = self.session.method("messages.getConversationsById", {"peer_ids": ",".join(map(str, peer_ids))})  # Метод принимает список peer_ids
+        except Exception as exc:  # Обрабатываем ошибки VK API
+            logger.debug("Не удалось пакетно получить беседы %s: %s", peer_ids, exc)  # Пишем отладочный лог
+            return  # Беседы подтянутся по одной
+        for item in response.get("items", []) if isinstance(response, dict) else []:  # Перебираем найденные беседы
+            if not isinstance(item, dict):  # Пропускаем некорректные записи ответа
+                continue  # Такую беседу загрузит обычный путь
+            peer_id = item.get("peer", {}).get("id") if isinstance(item.get("peer"), dict) else None  # ID беседы из ответа
+            if peer_id in senders:  # Пропускаем беседы, которых не запрашивали
+                self._remember(self.peer_cache, peer_id, self._chat_profile(item, self._cached_name(senders[peer_id])))  # Кэшируем профиль беседы
+
+    def _prefetch_sender_and_chat(self, from_id: Optional[int], peer_id: Optional[int]) -> None:
+        """Для первой встречи пользователя в беседе загружает оба профиля одним вызовом execute."""
+
+        if not (isinstance(from_id, int) and from_id > 0 and isinstance(peer_id, int) and peer_id >= 2000000000):  # Нужна пара пользователь+беседа
+            return  # Остальные случаи закрывают обычные запросы
+        if from_id in self.user_cache or peer_id in self.peer_cache:  # Если хотя бы один профиль уже известен
+            return  # Второй загрузит обычный путь одним запросом
+        code = "return {u: API.users.get({user_ids: %d, fields: \"photo_50\"}), c: API.messages.getConversationsById({peer_ids: %d})};" % (from_id, peer_id)  # VKScript с двумя вызовами на стороне VK
+        try:  # Пробуем выполнить оба запроса за один сетевой вызов
+            response = self.session.method("execute", {"code": code})  # Выполняем скрипт
+        except Exception as exc:  # Обрабатываем ошибки VK API
+            logger.debug("Не удалось получить профили %s и %s через execute: %s", from_id, peer_id, exc)  # Пишем отладочный лог
+            return  # Профили подтянутся по одному
+        if not isinstance(response, dict):  # Проверяем формат ответа
+            return  # Неизвестный ответ не разбираем
+        users = response.get("u")  # Ответ users.get
+        if isinstance(users, list) and users and isinstance(users[0], dict):  # Если пользователь найден
+            self._remember(self.user_cache, from_id, self._user_profile(users[0]))  # Кэшируем профиль пользователя
+        conversations = response.get("c")  # Ответ messages.getConversationsById
+        items = conversations.get("items", []) if isinstance(conversations, dict) else []  # Список бесед
+        if items and isinstance(items[0], dict):  # Если беседа найдена
+            self._remember(self.peer_cache, peer_id, self._chat_profile(items[0], self._cached_name(from_id)))  # Кэшируем профиль беседы, без названия берем имя отправителя
+
+    def _cached_name(self, from_id: Optional[int]) -> Optional[str]:
+        """Возвращает имя автора из кэша профилей, не обращаясь к VK."""
+
+        profile = self.user_cache.get(from_id) or self.group_cache.get(from_id) or {}  # Профиль пользователя или сообщества
+        return profile.get("name")  # Имя, если профиль уже загружен
 
     def _resolve_sender_profile(self, from_id: Optional[int]) -> Dict[str, Optional[str]]:
         if not isinstance(from_id, int):  # Если ID некорректный
             return {"name": None, "avatar": None}  # Возвращаем пустой профиль
         if from_id in self.user_cache:  # Проверяем кэш пользователей
+            self.user_cache.move_to_end(from_id)  # Активный профиль вытесняется последним
             return self.user_cache[from_id]  # Отдаем сохраненный профиль пользователя
         if from_id in self.group_cache:  # Проверяем кэш сообществ
+            self.group_cache.move_to_end(from_id)  # Активный профиль вытесняется последним
             return self.group_cache[from_id]  # Отдаем сохраненный профиль сообщества
         try:  # Пробуем выполнить запрос
             if from_id > 0:  # Если это пользователь
                 response = self.session.method("users.get", {"user_ids": from_id, "fields": "photo_50"})  # Запрашиваем имя и аватар пользователя
                 if response:  # Если ответ не пустой
-                    user = response[0]  # Берем первую запись
-                    name = f"{user.get('first_name', '')} {user.get('last_name', '')}".strip()  # Формируем имя из имени и фамилии
-                    avatar = user.get("photo_50")  # Берем маленький аватар
-                    profile = {"name": name or None, "avatar": avatar}  # Собираем профиль пользователя
-                    self.user_cache[from_id] = profile  # Кэшируем профиль пользователя
+                    profile = self._user_profile(response[0])  # Собираем профиль пользователя из первой записи
+                    self._remember(self.user_cache, from_id, profile)  # Кэшируем профиль пользователя
                     return profile  # Возвращаем профиль
             else:  # Если это сообщество
                 response = self.session.method("groups.getById", {"group_id": abs(from_id), "fields": "photo_50"})  # Запрашиваем название и аватар сообщества
                 if response:  # Если ответ есть
-                    group = response[0]  # Берем первую запись
-                    name = group.get("name")  # Достаем имя сообщества
-                    avatar = group.get("photo_50")  # Достаем ссылку на аватар
-                    profile = {"name": name or None, "avatar": avatar}  # Собираем профиль сообщества
-                    self.group_cache[from_id] = profile  # Кэшируем профиль сообщества
+                    profile = self._group_profile(response[0])  # Собираем профиль сообщества из первой записи
+                    self._remember(self.group_cache, from_id, profile)  # Кэшируем профиль сообщества
                     return profile  # Возвращаем профиль
         except Exception as exc:  # Обрабатываем ошибки VK API
             logger.debug("Не удалось получить профиль отправителя %s: %s", from_id, exc)  # Пишем отладочный лог
         return {"name": None, "avatar": None}  # Возвращаем пустой профиль при неудаче
 
+    def _user_profile(self, user: Dict) -> Dict[str, Optional[str]]:
+        """Собирает профиль пользователя из записи users.get."""
+
+        name = f"{user.get('first_name', '')} {user.get('last_name', '')}".strip()  # Формируем имя из имени и фамилии
+        return {"name": name or None, "avatar": user.get("photo_50")}  # Имя и маленький аватар
+
+    def _group_profile(self, group: Dict) -> Dict[str, Optional[str]]:
+        """Собирает профиль сообщества из записи groups.getById."""
+
+        return {"name": group.get("name") or None, "avatar": group.get("photo_50")}  # Название и маленький аватар
+
+    def _chat_profile(self, item: Dict, fallback: Optional[str]) -> Dict[str, Optional[str]]:
+        """Собирает профиль беседы из записи messages.getConversationsById; без названия берет запасной текст."""
+
+        chat_settings = item.get("chat_settings") if isinstance(item.get("chat_settings"), dict) else {}  # Достаем настройки чата
+        return {"title": chat_settings.get("title") or fallback, "avatar": self._extract_chat_photo(chat_settings)}  # Название беседы и ее аватар
+
     def _extract_chat_photo(self, chat_settings: Dict) -> Optional[str]:
         if not isinstance(chat_settings, dict):  # Проверяем, что настройки переданы словарем
             return None  # Возвращаем пустое значение
@@ -1361,31 +2056,29 @@ class BotMonitor:
         if not isinstance(peer_id, int):  # Если peer_id не число
             return {"title": fallback, "avatar": None}  # Возвращаем запасной профиль
         if peer_id in self.peer_cache:  # Проверяем кэш чатов
+            self.peer_cache.move_to_end(peer_id)  # Активная беседа вытесняется последней
             return self.peer_cache[peer_id]  # Возвращаем сохраненный профиль беседы
         try:  # Пробуем запросить данные чата
             if peer_id >= 2000000000:  # Если это беседа
                 response = self.session.method("messages.getConversationsById", {"peer_ids": peer_id})  # Запрашиваем данные беседы
                 items = response.get("items", []) if isinstance(response, dict) else []  # Получаем список бесед из ответа
                 if items:  # Если список не пуст
-                    chat_settings = items[0].get("chat_settings", {})  # Достаем настройки чата
-                    title = chat_settings.get("title") or fallback  # Берем название беседы или запасной текст
-                    avatar = self._extract_chat_photo(chat_settings)  # Пытаемся вытащить аватар беседы
-                    profile = {"title": title, "avatar": avatar}  # Собираем профиль беседы
-                    self.peer_cache[peer_id] = profile  # Кэшируем профиль беседы
+                    profile = self._chat_profile(items[0], fallback)  # Собираем профиль беседы, без названия берем запасной текст
+                    self._remember(self.peer_cache, peer_id, profile)  # Кэшируем профиль беседы
                     return profile  # Возвращаем профиль
             elif peer_id > 0:  # Если это личный диалог с пользователем
                 sender_profile = self._resolve_sender_profile(peer_id)  # Получаем профиль пользователя
                 title = sender_profile.get("name") or fallback  # Берем имя пользователя или запасной текст
                 avatar = sender_profile.get("avatar")  # Берем аватар пользователя
                 profile = {"title": title, "avatar": avatar}  # Собираем профиль диалога
-                self.peer_cache[peer_id] = profile  # Кэшируем профиль диалога
+                self._remember(self.peer_cache, peer_id, profile)  # Кэшируем профиль диалога
                 return profile  # Возвращаем профиль
             else:  # Если peer_id отрицательный (сообщество)
                 group_profile = self._resolve_sender_profile(peer_id)  # Получаем профиль сообщества
                 title = group_profile.get("name") or fallback  # Берем название или запасной текст
                 avatar = group_profile.get("avatar")  # Берем аватар сообщества
                 profile = {"title": title, "avatar": avatar}  # Собираем профиль сообщества
-                self.peer_cache[peer_id] = profile  # Кэшируем профиль сообщества
+                self._remember(self.peer_cache, peer_id, profile)  # Кэшируем профиль сообщества
                 return profile  # Возвращаем профиль
         except Exception as exc:  # Обрабатываем ошибки запроса
             logger.debug("Не удалось получить профиль чата %s: %s", peer_id, exc)  # Пишем отладку
@@ -1464,17 +2157,21 @@ def build_demo_payload(state: BotState, event_logger: EventLogger) -> Dict[str,
             },  # Блок ответа на первое сообщение
         },  # Сообщение 2
     ]  # Конец списка демо-сообщений
-    for message in demo_messages:  # Перебираем демо-сообщения
-        state.mark_event(message, "message")  # Обновляем метрики для демо
-        event_logger.log_event(  # Записываем демо в базу с именами и аватарами
-            "message",  # Тип события
-            message,  # Payload сообщения
-            peer_title=message.get("peer_title"),  # Название чата
-            from_name=message.get("from_name"),  # Имя автора
-            peer_avatar=message.get("peer_avatar"),  # Аватар чата
-            from_avatar=message.get("from_avatar"),  # Аватар автора
-        )
-    state.mark_event({}, "invite")  # Добавляем демо-событие приглашения
+    event_logger.log_many(  # Записываем все демо-сообщения одной пачкой с именами и аватарами
+        [
+            event_logger.build_event_row(
+                "message",  # Тип события
+                message,  # Payload сообщения
+                peer_title=message.get("peer_title"),  # Название чата
+                from_name=message.get("from_name"),  # Имя автора
+                peer_avatar=message.get("peer_avatar"),  # Аватар чата
+                from_avatar=message.get("from_avatar"),  # Аватар автора
+            )
+            for message in demo_messages  # Перебираем демо-сообщения
+        ]
+    )
+    event_logger.flush()  # Сбрасываем пачку одной транзакцией, чтобы демо-данные сразу были в базе
+    state.mark_events([MessagePreview.from_message(message) for message in demo_messages], invites=1)  # Обновляем метрики для демо вместе с демо-приглашением
     group_info = {
         "name": "Демо-сообщество",  # Название сообщества
         "description": "Образец данных без подключения к VK",  # Описание сообщества
@@ -1498,9 +2195,22 @@ def build_dashboard_app(
     service_events: ServiceEventLogger,
 ) -> Flask:
     app = Flask(__name__, template_folder="templates", static_folder="static")  # Создаем Flask-приложение
+    app.json = OrjsonProvider(app)  # jsonify и |tojson в шаблонах сериализуют через orjson
+    stats_cache: Dict[int, list] = {}  # Кэш статистики: диапазон -> [версия состояния, момент сборки, словарь, готовый JSON, ETag]
+    overview_cache: list = [0.0, b"", ""]  # Кэш обзора: момент сборки, готовый JSON и ETag
+    storage_cache: list = [0.0, b"", ""]  # Кэш описания хранилища: момент сборки, готовый JSON и ETag
+    logs_cache: Dict[tuple, tuple] = {}  # Кэш первых страниц логов: (peer_id, from_id, limit) -> (версия данных, момент сборки, JSON)
+    conversations_cache: list = [-1, [], None]  # Кэш списка диалогов: версия данных, готовый список и его JSON для шаблона
+    group_info_json = embed_json(app.json.dumps(group_info))  # Профиль сообщества не меняется, сериализуем его для шаблона один раз
 
     def detect_peer_type(peer_id: Optional[int]) -> str:
-        return "chat" if isinstance(peer_id, int) and peer_id >= 2000000000 else "user" if isinstance(peer_id, int) and peer_id > 0 else "group" if isinstance(peer_id, int) and peer_id < 0 else "unknown"  # Определяем тип чата по peer_id
+        if not isinstance(peer_id, int):  # Тип проверяем один раз
+            return "unknown"  # Без числового ID тип неизвестен
+        if peer_id >= 2000000000:  # Беседы начинаются с 2e9
+            return "chat"  # Беседа
+        if peer_id > 0:  # Положительный ID — пользователь
+            return "user"  # Личный диалог
+        return "group" if peer_id < 0 else "unknown"  # Отрицательный ID — сообщество, ноль не встречается
 
     def merge_conversations(seed_conversations: List[Dict], peer_rows: List[Dict]) -> List[Dict]:
         combined: Dict[int, Dict] = {}  # Словарь для объединения по peer_id
@@ -1515,32 +2225,53 @@ def build_dashboard_app(
             peer_id = peer_row.get("id")  # Получаем ID чата
             if peer_id is None:  # Если ID отсутствует
                 continue  # Пропускаем
-            entry = combined.get(peer_id, {"peer": {"id": peer_id}})  # Берем существующий или создаем новый объект
+            title = peer_row.get("title")  # Название чата из базы
+            avatar = peer_row.get("avatar")  # Аватар чата из базы
+            entry = combined.get(peer_id)  # Диалог из стартового списка, если он там есть
+            if entry is None:  # Чат известен только по логам
+                entry = combined[peer_id] = {"peer": {"id": peer_id}}  # Создаем новый объект сразу в словаре
             entry_peer = entry.setdefault("peer", {"id": peer_id})  # Обеспечиваем наличие блока peer
             entry_peer.setdefault("id", peer_id)  # Дублируем ID, если не было
             entry_peer.setdefault("type", detect_peer_type(peer_id))  # Устанавливаем тип чата
-            if peer_row.get("avatar"):  # Если в базе есть аватар чата
-                entry_peer.setdefault("avatar", peer_row.get("avatar"))  # Сохраняем аватар в блоке peer
-            if peer_row.get("title"):  # Если известно название
-                chat_settings = entry.setdefault("chat_settings", {})  # Берем блок настроек беседы
-                chat_settings.setdefault("title", peer_row.get("title"))  # Устанавливаем название, не затирая существующее
-            if peer_row.get("avatar") and isinstance(entry, dict):  # Если есть аватар из базы
-                chat_settings = entry.setdefault("chat_settings", {})  # Берем блок настроек беседы
+            if not (title or avatar):  # Дополнять настройки беседы нечем
+                continue  # Переходим к следующему чату
+            chat_settings = entry.setdefault("chat_settings", {})  # Берем блок настроек беседы один раз
+            if title:  # Если известно название
+                chat_settings.setdefault("title", title)  # Устанавливаем название, не затирая существующее
+            if avatar:  # Если в базе есть аватар чата
+                entry_peer.setdefault("avatar", avatar)  # Сохраняем аватар в блоке peer
                 photo_block = chat_settings.setdefault("photo", {}) if isinstance(chat_settings, dict) else {}  # Готовим блок фото
-                photo_block.setdefault("photo_50", peer_row.get("avatar"))  # Сохраняем ссылку на аватар беседы
-            combined[peer_id] = entry  # Обновляем словарь
+                photo_block.setdefault("photo_50", avatar)  # Сохраняем ссылку на аватар беседы
         return list(combined.values())  # Возвращаем объединенный список
 
-    def assemble_conversations() -> List[Dict]:
-        peers_from_logs = event_logger.list_peers()  # Получаем чаты из базы
+    def assemble_conversations(peers_from_logs: Optional[List[Dict[str, object]]] = None) -> List[Dict]:
+        event_logger.flush_if_idle()  # Дописываем очередь, если запись свободна, чтобы версия данных учла свежие события
+        version, cached, _ = conversations_cache  # Читаем кэш одним снимком
+        if version == event_logger.data_version:  # С прошлой сборки база не менялась
+            return cached  # Отдаем готовый список без запросов и слияния
+        version = event_logger.data_version  # Запоминаем версию до чтения: запись во время сборки заставит пересобрать список
+        if peers_from_logs is None:  # Вызывающий код не передал список чатов
+            peers_from_logs = event_logger.list_peers()  # Получаем чаты из базы
         messages_counts = event_logger.count_messages_by_peer()  # Получаем количество сообщений по каждому peer_id
         merged = merge_conversations(conversations, peers_from_logs)  # Объединяем стартовые диалоги с теми, что накопились в логах
         for conv in merged:  # Перебираем объединенные диалоги
             peer = conv.get("peer", {}) if isinstance(conv, dict) else {}  # Достаем блок peer из диалога
             peer_id = peer.get("id")  # Определяем peer_id текущего диалога
             conv["messages_count"] = messages_counts.get(peer_id, 0)  # Добавляем поле с количеством сообщений
+        conversations_cache[:] = [version, merged, None]  # Запоминаем список вместе с версией данных, JSON соберется по запросу
         return merged  # Возвращаем список диалогов с подсчитанными сообщениями
 
+    def conversations_json(peers_from_logs: Optional[List[Dict[str, object]]] = None) -> Markup:
+        """Отдает список диалогов для шаблона, сериализуя его один раз на версию данных."""
+
+        merged = assemble_conversations(peers_from_logs)  # Берем список из кэша или пересобираем его
+        _, cached, encoded = conversations_cache  # Снимок кэша после возможной пересборки
+        if cached is not merged or encoded is None:  # JSON еще не собирали для этого списка
+            encoded = embed_json(app.json.dumps(merged))  # Сериализуем и экранируем список для <script>
+            if cached is merged:  # Кэш не успели пересобрать другим запросом
+                conversations_cache[2] = encoded  # Запоминаем JSON рядом со списком
+        return encoded  # Возвращаем готовую строку для шаблона
+
     def resolve_range_minutes(raw_value: Optional[str]) -> int:
         try:  # Пытаемся привести значение к числу
             parsed = int(raw_value) if raw_value is not None else DEFAULT_TIMELINE_MINUTES  # Преобразуем строку или берем дефолт
@@ -1548,19 +2279,43 @@ def build_dashboard_app(
             return DEFAULT_TIMELINE_MINUTES  # Возвращаем значение по умолчанию
         return parsed if parsed > 0 else DEFAULT_TIMELINE_MINUTES  # Возвращаем только положительные значения
 
-    def assemble_stats(range_minutes: Optional[int] = None) -> Dict[str, object]:
+    def stats_entry(range_minutes: Optional[int] = None) -> list:
         selected_range = range_minutes if isinstance(range_minutes, int) and range_minutes > 0 else DEFAULT_TIMELINE_MINUTES  # Нормализуем выбранный диапазон
+        version = state.version  # Без новых событий и ошибок статистика не меняется
+        cached = stats_cache.get(selected_range)  # Ищем готовую статистику для диапазона
+        if cached and cached[0] == version and time.monotonic() - cached[1] < STATS_CACHE_TTL:  # TTL нужен, потому что окно графика сдвигается со временем
+            return cached  # Отдаем ту же запись без запросов к базе
         messages_count = event_logger.count_messages(selected_range)  # Считаем сообщения за выбранный диапазон
-        last_messages = [decorate_message_preview(msg) for msg in state.last_messages]  # Нормализуем вложения последних сообщений
-        return {  # Собираем словарь статистики
+        last_messages = [decorate_message_preview(msg) for msg in list(state.last_messages)]  # Снимаем копию очереди и нормализуем вложения последних сообщений
+        stats = {  # Собираем словарь статистики
             "events": messages_count,  # Количество событий за диапазон берем из количества сообщений
             "messages": messages_count,  # Количество сообщений за диапазон
             "invites": state.invites,  # Количество приглашений/удалений за текущую сессию
             "errors": state.errors,  # Количество ошибок лонгпулла за текущую сессию
+            "reconnects": state.reconnects,  # Количество переподключений лонгпулла за текущую сессию
             "last_messages": last_messages,  # История последних сообщений из оперативной памяти с кликабельными вложениями
             "timeline": event_logger.fetch_timeline(selected_range),  # Точки графика из базы по диапазону
             "range_minutes": selected_range,  # Возвращаем выбранный диапазон минут
         }
+        if len(stats_cache) >= 16 and selected_range not in stats_cache:  # Диапазон приходит из запроса, не даем кэшу расти без границ
+            stats_cache.clear()  # Сбрасываем редкие диапазоны
+        entry = [version, time.monotonic(), stats, None, None]  # JSON и ETag соберем лениво при первом запросе API
+        stats_cache[selected_range] = entry  # Запоминаем статистику вместе с версией состояния и моментом сборки
+        return entry  # Возвращаем запись кэша
+
+    def assemble_stats_json(range_minutes: Optional[int] = None) -> tuple:
+        entry = stats_entry(range_minutes)  # Берем актуальную запись кэша
+        if entry[3] is None:  # Если JSON для этой версии еще не собирали
+            body = json_bytes(entry[2])  # Сериализуем один раз на версию состояния
+            entry[4] = hashlib.blake2b(body, digest_size=8).hexdigest()  # ETag считаем один раз вместе с JSON
+            entry[3] = body  # Сохраняем байты последними, чтобы другой поток не увидел JSON без ETag
+        return entry[3], entry[4]  # Отдаем готовые байты и их ETag
+
+    def conditional_json(body: bytes, etag: str) -> Response:
+        response = json_response(body=body)  # Ответ с готовым JSON
+        response.set_etag(etag)  # Браузер запомнит ETag и пришлет его в If-None-Match
+        response.cache_control.no_cache = True  # Ответ можно хранить, но перед использованием нужно сверить ETag
+        return response.make_conditional(request)  # При совпадении ETag отдаем 304 без тела
 
     def assemble_storage() -> Dict[str, object]:
         db_storage = event_logger.describe_storage()  # Читаем информацию о файле базы
@@ -1596,6 +2351,7 @@ def build_dashboard_app(
             "sticker_cache_size_bytes": sticker_cache_size,  # Суммарный размер кэша стикеров
         }
 
+    @functools.lru_cache(maxsize=4096)  # Соседние строки ленты часто приходятся на одну секунду, разбор повторяется
     def localize_iso(timestamp: Optional[str]) -> Optional[str]:
         try:  # Пытаемся преобразовать ISO-строку
             parsed = datetime.fromisoformat(timestamp) if timestamp else None  # Парсим дату с таймзоной
@@ -1751,7 +2507,7 @@ def build_dashboard_app(
                     if url:  # Проверяем, что ссылка существует
                         signature = f"{item.get('type') or 'file'}:{url}"  # Строим сигнатуру по типу и ссылке
                 if signature is None:  # Если других вариантов нет
-                    signature = json.dumps(item, sort_keys=True, ensure_ascii=False)  # Фолбэк: сериализуем вложение целиком
+                    signature = orjson.dumps(item, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS).decode("utf-8")  # Фолбэк: сериализуем вложение целиком
             except Exception:  # Ловим любые ошибки при расчёте сигнатуры
                 signature = None  # Сбрасываем сигнатуру при сбое
             if signature and signature in seen_signatures:  # Проверяем, не встречалось ли вложение раньше
@@ -1812,13 +2568,13 @@ def build_dashboard_app(
             prepared.append(serialized)  # Добавляем репост в итоговый список
         return prepared  # Возвращаем сериализованные репосты
 
-    def decorate_message_preview(message: Dict) -> Dict:  # Добавляет публичные ссылки во вложения последних сообщений
-        if not isinstance(message, dict):  # Проверяем формат сообщения
+    def decorate_message_preview(preview: MessagePreview) -> Dict:  # Добавляет публичные ссылки во вложения последних сообщений
+        if not isinstance(preview, MessagePreview):  # Проверяем формат сообщения
             return {}  # Возвращаем пустой словарь при ошибке
-        prepared = dict(message)  # Копируем сообщение, чтобы не менять оригинал
-        prepared["attachments"] = enrich_attachments_list(message.get("attachments", []))  # Нормализуем вложения сообщения
-        prepared["copy_history"] = serialize_copy_history(message.get("copy_history")) if message.get("copy_history") else []  # Нормализуем репосты
-        reply_block = message.get("reply") or message.get("reply_message")  # Получаем блок ответа
+        prepared = preview.to_dict()  # Плоская копия полей, оригинал в состоянии не меняется
+        prepared["attachments"] = enrich_attachments_list(preview.attachments or [])  # Нормализуем вложения сообщения
+        prepared["copy_history"] = serialize_copy_history(preview.copy_history) if preview.copy_history else []  # Нормализуем репосты
+        reply_block = preview.reply_message  # Получаем блок ответа
         if isinstance(reply_block, dict):  # Проверяем наличие ответа
             reply_copy = dict(reply_block)  # Копируем блок
             reply_copy["attachments"] = enrich_attachments_list(reply_block.get("attachments", []))  # Нормализуем вложения ответа
@@ -1826,19 +2582,16 @@ def build_dashboard_app(
         return prepared  # Возвращаем подготовленное сообщение
 
     def serialize_service_event(row: Dict) -> Dict[str, object]:
-        return {
-            "id": row.get("id"),  # ID строки
-            "created_at": localize_iso(row.get("created_at")),  # Локальное время создания в ISO-формате
-            "event_type": row.get("event_type"),  # Тип события (info/warning/error)
-            "status_code": row.get("status_code"),  # Код статуса
-            "description": row.get("description"),  # Русское пояснение
-            "message": row.get("message"),  # Текстовое сообщение
-        }  # Словарь с сервисным событием
-
-    def serialize_log(row: Dict) -> Dict:
-        payload_text = row.get("payload") or "{}"  # Берем сырой payload или пустой JSON
+        return {**row, "created_at": localize_iso(row["created_at"])}  # Строка уже содержит id, тип, код, пояснение и сообщение; меняем только время на локальное
+
+    def serialize_log(row: sqlite3.Row) -> Dict:
+        (
+            record_id, created_at, event_type, peer_id, peer_title, peer_avatar, from_id, from_name, from_avatar, message_id,
+            reply_id, reply_text, reply_attachments_text, reply_from_id, reply_from_name, reply_from_avatar, is_bot, text, payload,
+        ) = row  # Разбираем строку по порядку MESSAGE_COLUMNS одной распаковкой вместо поиска каждой колонки по имени
+        payload_text = unpack_json(payload) or "{}"  # Берем сырой payload или пустой JSON, сжатый распаковываем
         try:  # Пытаемся распарсить payload
-            raw_payload = json.loads(payload_text)  # Преобразуем текст в словарь
+            raw_payload = orjson.loads(payload_text)  # Преобразуем текст в словарь
         except Exception:  # При ошибке парсинга
             raw_payload = {}  # Возвращаем пустой словарь, чтобы не ронять страницу
         reply_payload = raw_payload.get("reply_message") if isinstance(raw_payload, dict) else None  # Получаем блок ответа из payload
@@ -1854,18 +2607,18 @@ def build_dashboard_app(
             action_type = action_block.get("type") if isinstance(action_block, dict) else None  # Читаем тип действия из блока action
             if action_type in ("chat_message_delete", "message_delete"):  # Проверяем, относится ли действие к удалению сообщения
                 deleted_flag = True  # Фиксируем, что сообщение нужно считать удаленным
-        reply_attachments_raw = row.get("reply_message_attachments") or "[]"  # Берем текст вложений ответа или пустой список
+        reply_attachments_raw = reply_attachments_text or "[]"  # Берем текст вложений ответа или пустой список
         try:  # Пытаемся распарсить вложения ответа
-            reply_attachments = enrich_attachments_list(json.loads(reply_attachments_raw))  # Преобразуем вложения в структурированный список
+            reply_attachments = enrich_attachments_list(orjson.loads(reply_attachments_raw))  # Преобразуем вложения в структурированный список
         except Exception:  # При ошибке парсинга вложений
             reply_attachments = []  # Используем пустой список, чтобы не ронять страницу
         reply = {  # Готовим словарь ответа
-            "id": row.get("reply_message_id"),  # ID исходного сообщения
-            "text": row.get("reply_message_text"),  # Текст исходного сообщения
+            "id": reply_id,  # ID исходного сообщения
+            "text": reply_text,  # Текст исходного сообщения
             "attachments": reply_attachments,  # Вложения исходного сообщения с публичными ссылками
-            "from_id": row.get("reply_message_from_id"),  # Автор исходного сообщения
-            "from_name": row.get("reply_message_from_name"),  # Имя автора исходного сообщения
-            "from_avatar": row.get("reply_message_from_avatar"),  # Аватар автора исходного сообщения
+            "from_id": reply_from_id,  # Автор исходного сообщения
+            "from_name": reply_from_name,  # Имя автора исходного сообщения
+            "from_avatar": reply_from_avatar,  # Аватар автора исходного сообщения
         }  # Конец словаря ответа
         if isinstance(reply_payload, dict) and not (reply["id"] or reply["text"] or reply["from_id"]):  # Проверяем, нужно ли дополнить данными из payload
             reply["id"] = reply_payload.get("id")  # Подставляем ID исходного сообщения из payload
@@ -1874,45 +2627,66 @@ def build_dashboard_app(
             reply["from_id"] = reply_payload.get("from_id")  # Подставляем автора исходного сообщения
             reply["from_name"] = reply_payload.get("from_name")  # Подставляем имя автора исходного сообщения
             reply["from_avatar"] = reply_payload.get("from_avatar")  # Подставляем аватар автора исходного сообщения
-        attachments_raw = row.get("attachments") or "[]"  # Берем строку вложений или пустой список
-        try:  # Пытаемся распарсить вложения
-            attachments = enrich_attachments_list(json.loads(attachments_raw))  # Подготавливаем вложения с публичными ссылками
-        except Exception:  # При ошибке разбора вложений
-            attachments = []  # Используем пустой список, чтобы не ломать страницу профиля
+        attachments_list = raw_payload.get("attachments") if isinstance(raw_payload, dict) else None  # Вложения берем из уже разобранного payload
+        attachments = enrich_attachments_list(attachments_list if isinstance(attachments_list, list) else [])  # Подготавливаем вложения с публичными ссылками
 
         copy_history = serialize_copy_history(raw_payload.get("copy_history")) if isinstance(raw_payload, dict) else []  # Сериализуем репосты и вложения
         return {  # Формируем итоговый словарь лога
-            "id": row.get("id"),  # ID записи
-            "created_at": localize_iso(row.get("created_at")),  # Локальное время создания в ISO-формате
-            "event_type": row.get("event_type"),  # Тип события
-            "peer_id": row.get("peer_id"),  # ID чата
-            "peer_title": row.get("peer_title"),  # Название чата
-            "peer_avatar": row.get("peer_avatar"),  # Аватар чата
-            "from_id": row.get("from_id"),  # Автор
-            "from_name": row.get("from_name"),  # Имя автора
-            "from_avatar": row.get("from_avatar"),  # Аватар автора
-            "message_id": row.get("message_id"),  # ID сообщения VK
+            "id": record_id,  # ID записи
+            "created_at": localize_iso(created_at),  # Локальное время создания в ISO-формате
+            "event_type": event_type,  # Тип события
+            "peer_id": peer_id,  # ID чата
+            "peer_title": peer_title,  # Название чата
+            "peer_avatar": peer_avatar,  # Аватар чата
+            "from_id": from_id,  # Автор
+            "from_name": from_name,  # Имя автора
+            "from_avatar": from_avatar,  # Аватар автора
+            "message_id": message_id,  # ID сообщения VK
             "reply": reply,  # Структурированный блок ответа
-            "is_bot": row.get("is_bot", 0),  # Флаг, что автор — бот или сообщество
-            "text": row.get("text"),  # Текст
+            "is_bot": is_bot,  # Флаг, что автор — бот или сообщество
+            "text": text,  # Текст
             "attachments": attachments,  # Вложения с публичными ссылками
             "copy_history": copy_history,  # Репосты с вложениями
             "attachments_total": len(attachments) + count_copy_history_attachments(copy_history),  # Общее количество вложений в сообщении и репостах
-            "payload": raw_payload,  # Сырой payload
             "is_deleted": deleted_flag,  # Флаг, что сообщение удалено и должно подсвечиваться
         }  # Конец словаря лога
 
+    def logs_page_chunks(peer_id: Optional[int], from_id: Optional[int], limit: int, offset: int) -> Iterator[bytes]:
+        """Собирает JSON-документ страницы логов по частям; строки страницы читаются из базы заранее."""
+
+        rows = event_logger.fetch_messages(peer_id=peer_id, limit=limit, offset=offset, from_id=from_id)  # Читаем страницу целиком (не больше 500 строк) и сразу возвращаем соединение в пул
+        yield b'{"items":['  # Открываем документ и список сообщений
+        for index, row in enumerate(rows):  # Сериализуем строки: скачивание стикеров и медленный клиент не держат чтение WAL
+            yield (b"," if index else b"") + json_bytes(serialize_log(row))  # Отдаем очередное сообщение
+        yield b"]," + json_bytes({"peer_id": peer_id, "offset": offset, "from_id": from_id})[1:]  # Закрываем список и документ параметрами выборки
+
+    def first_logs_page_json(peer_id: Optional[int], from_id: Optional[int], limit: int) -> bytes:
+        """Отдает первую страницу логов из кэша по версии данных; её же встраивают страницы дашборда."""
+
+        event_logger.flush_if_idle()  # Дописываем очередь, если запись свободна, чтобы версия данных учла свежие события
+        version = event_logger.data_version  # Версия данных до чтения: если база изменится, кэш промахнется
+        key = (peer_id, from_id, limit)  # Ключ кэша по параметрам выборки
+        cached = logs_cache.get(key)  # Ищем готовый ответ
+        if cached and cached[0] == version and time.monotonic() - cached[1] < LOGS_CACHE_TTL:  # Данные не менялись, TTL дает повторить скачивание стикеров
+            return cached[2]  # Отдаем готовые байты
+        body = b"".join(logs_page_chunks(peer_id, from_id, limit, 0))  # Собираем документ целиком, чтобы положить в кэш
+        if len(logs_cache) >= 64 and key not in logs_cache:  # Параметры приходят из запроса, не даем кэшу расти без границ
+            logs_cache.clear()  # Сбрасываем редкие выборки
+        logs_cache[key] = (version, time.monotonic(), body)  # Запоминаем ответ вместе с версией данных
+        return body  # Возвращаем готовый документ
+
     @app.route("/")
     def index():
         log_service_event(200, "Отдаём главную страницу дашборда")  # Фиксируем успешную отдачу главной страницы
+        peers = event_logger.list_peers()  # Список чатов нужен и диалогам, и фильтру, читаем его один раз
         return render_template(
             "index.html",  # Шаблон дашборда
-            initial_group=group_info,  # Передаем словарь с данными сообщества без лишней сериализации
-            initial_conversations=assemble_conversations(),  # Список диалогов с учетом базы
-            initial_stats=assemble_stats(DEFAULT_TIMELINE_MINUTES),  # Начальные метрики состояния по умолчанию
-            initial_peers=event_logger.list_peers(),  # Доступные peer_id из базы
+            initial_group_json=group_info_json,  # Профиль сообщества, сериализованный при создании приложения
+            initial_conversations_json=conversations_json(peers),  # Список диалогов с учетом базы, сериализованный один раз на версию данных
+            initial_stats_json=embed_json(assemble_stats_json(DEFAULT_TIMELINE_MINUTES)[0].decode("utf-8")),  # Начальные метрики из того же кэша JSON, что и /api/stats
+            initial_peers=peers,  # Доступные peer_id из базы
             initial_storage=assemble_storage(),  # Описание файла базы для подсказки
-            initial_logs=[serialize_log(row) for row in event_logger.fetch_messages(limit=MESSAGES_PAGE_SIZE, offset=0)],  # Стартовый список логов для главной страницы
+            initial_logs_json=embed_json(first_logs_page_json(None, None, MESSAGES_PAGE_SIZE).decode("utf-8")),  # Стартовая страница логов из того же кэша, что и /api/logs
             page_size=MESSAGES_PAGE_SIZE,  # Размер страницы для бесконечной ленты сообщений
             demo_mode=demo_mode,  # Флаг демо для вывода на страницу
         )  # Возвращаем HTML страницу
@@ -1921,20 +2695,26 @@ def build_dashboard_app(
     def stats():
         range_raw = request.args.get("range") or request.args.get("minutes")  # Читаем желаемый диапазон из запроса
         selected_range = resolve_range_minutes(range_raw)  # Нормализуем диапазон
-        log_service_event(200, f"Отдаём JSON со статистикой за {selected_range} минут")  # Фиксируем успешную выдачу статистики
-        return jsonify(assemble_stats(selected_range))  # Возвращаем актуальную статистику в JSON
+        log_polled_event("stats", f"Отдаём JSON со статистикой за {selected_range} минут")  # Дашборд опрашивает статистику постоянно, пишем выборочно
+        return conditional_json(*assemble_stats_json(selected_range))  # Отдаем заранее сериализованную статистику или 304, если она не менялась
 
     @app.route("/api/overview")
     def overview():
-        log_service_event(200, "Отдаём обзор сообщества и диалогов")  # Фиксируем отдачу обзорных данных
-        return jsonify(
-            {
-                "group": group_info,  # Информация о сообществе
-                "conversations": assemble_conversations(),  # Список диалогов с учетом базы
-                "peers": event_logger.list_peers(),  # Список доступных чатов
-                "storage": assemble_storage(),  # Описание файла базы
-            }
-        )  # Возвращаем обзорную информацию
+        log_polled_event("overview", "Отдаём обзор сообщества и диалогов")  # Обзор опрашивается по таймеру, пишем выборочно
+        built_at, body, etag = overview_cache  # Читаем кэш одной тройкой
+        if not built_at or time.monotonic() - built_at >= OVERVIEW_CACHE_TTL:  # Кэш пуст или устарел
+            peers = event_logger.list_peers()  # Список чатов читаем один раз для обоих полей
+            body = json_bytes(  # Сериализуем обзор сразу в байты для ответа и хэша
+                {
+                    "group": group_info,  # Информация о сообществе
+                    "conversations": assemble_conversations(peers),  # Список диалогов с учетом базы
+                    "peers": peers,  # Список доступных чатов
+                    "storage": assemble_storage(),  # Описание файла базы
+                }
+            )
+            etag = hashlib.blake2b(body, digest_size=8).hexdigest()  # Хэш готового JSON для ETag
+            overview_cache[:] = [time.monotonic(), body, etag]  # Запоминаем результат целиком
+        return conditional_json(body, etag)  # Возвращаем обзорную информацию или 304
 
     @app.route("/chat/<int:peer_id>")
     def chat_page(peer_id: int):
@@ -1972,21 +2752,25 @@ def build_dashboard_app(
         limit_raw = request.args.get("limit")  # Читаем лимит из запроса
         offset_raw = request.args.get("offset")  # Читаем смещение из запроса
         from_id_raw = request.args.get("from_id")  # Читаем фильтр по отправителю
-        peer_id = int(peer_id_raw) if peer_id_raw else None  # Преобразуем в число при наличии
-        from_id = int(from_id_raw) if from_id_raw else None  # Преобразуем отправителя при наличии
-        limit = int(limit_raw) if limit_raw else MESSAGES_PAGE_SIZE  # Устанавливаем лимит выборки
-        limit = max(1, min(limit, 500))  # Ограничиваем диапазон лимита на одну подгрузку
-        offset = int(offset_raw) if offset_raw else 0  # Читаем смещение
-        offset = max(0, offset)  # Страхуем от отрицательного значения
-        messages = [
-            serialize_log(row)
-            for row in event_logger.fetch_messages(peer_id=peer_id, limit=limit, offset=offset, from_id=from_id)
-        ]  # Запрашиваем логи
+        peer_id = parse_optional_int(peer_id_raw)  # Преобразуем в число при наличии
+        from_id = parse_optional_int(from_id_raw)  # Преобразуем отправителя при наличии
+        limit = parse_bounded_int(limit_raw, MESSAGES_PAGE_SIZE, 1, 500)  # Лимит одной подгрузки в разумных рамках
+        offset = parse_bounded_int(offset_raw, 0, 0, 2**62)  # Смещение без отрицательных значений
         log_service_event(
             200,
             f"Отдаём JSON с логами peer_id={peer_id} from_id={from_id} лимитом {limit} смещением {offset}",
         )  # Логируем успешную отдачу логов
-        return jsonify({"items": messages, "peer_id": peer_id, "offset": offset, "from_id": from_id})  # Возвращаем JSON с логами
+        if offset == 0:  # Первую страницу дашборд опрашивает постоянно, её отдаем из кэша
+            return json_response(body=first_logs_page_json(peer_id, from_id, limit))  # Готовые байты без SQL и сериализации, пока база не менялась
+        return json_response(body=logs_page_chunks(peer_id, from_id, limit, offset))  # Дальние страницы отдаем потоком: строки уже прочитаны, по частям уходит только JSON
+
+    @app.route("/api/logs/<int:log_id>/raw")
+    def log_raw_payload(log_id: int):
+        payload_text = event_logger.fetch_raw_payload(log_id)  # Читаем сырой payload записи
+        if payload_text is None:  # Если записи нет
+            log_service_event(404, f"Запись лога сообщений id={log_id} не найдена для выдачи payload")  # Логируем отсутствие строки
+            return json_response({"status": "not_found", "id": log_id}), 404  # Возвращаем 404
+        return json_response(body=payload_text or "{}")  # Отдаем сохраненный JSON без разбора и повторной сериализации
 
     @app.route("/attachments/<path:subpath>")
     def serve_attachment(subpath: str):  # Отдаем сохраненное вложение из папки
@@ -2004,16 +2788,16 @@ def build_dashboard_app(
     def clear_logs():
         event_logger.clear_messages()  # Очищаем все записи событий в таблице
         log_service_event(201, "Логи сообщений очищены через API")  # Фиксируем факт очистки в сервисных событиях
-        return jsonify({"status": "cleared"})  # Возвращаем подтверждение клиенту
+        return json_response({"status": "cleared"})  # Возвращаем подтверждение клиенту
 
     @app.route("/api/logs/<int:log_id>", methods=["DELETE"])
     def delete_log(log_id: int):
         deleted = event_logger.delete_message(log_id)  # Пытаемся удалить строку по ID
         if not deleted:  # Проверяем, была ли найдена запись
             log_service_event(404, f"Запись лога сообщений id={log_id} не найдена для удаления")  # Логируем отсутствие строки
-            return jsonify({"status": "not_found", "id": log_id}), 404  # Возвращаем 404, если строка не найдена
+            return json_response({"status": "not_found", "id": log_id}), 404  # Возвращаем 404, если строка не найдена
         log_service_event(200, f"Запись лога сообщений id={log_id} удалена через API")  # Фиксируем успешное удаление
-        return jsonify({"status": "deleted", "id": log_id})  # Отдаем подтверждение успешного удаления
+        return json_response({"status": "deleted", "id": log_id})  # Отдаем подтверждение успешного удаления
 
     @app.route("/api/service-logs")
     def service_logs():
@@ -2021,10 +2805,8 @@ def build_dashboard_app(
         limit_raw = request.args.get("limit")  # Читаем желаемый лимит
         offset_raw = request.args.get("offset")  # Читаем смещение для пагинации
         mark_read_raw = request.args.get("mark_read")  # Читаем флаг сброса непрочитанного
-        limit = int(limit_raw) if limit_raw else 50  # Преобразуем лимит в число
-        limit = max(1, min(limit, 200))  # Ограничиваем лимит разумными рамками
-        offset = int(offset_raw) if offset_raw else 0  # Преобразуем смещение
-        offset = max(0, offset)  # Не даем отрицательных смещений
+        limit = parse_bounded_int(limit_raw, 50, 1, 200)  # Лимит в разумных рамках
+        offset = parse_bounded_int(offset_raw, 0, 0, 2**62)  # Смещение без отрицательных значений
         rows = service_events.fetch_events(event_type=event_type, limit=limit, offset=offset)  # Получаем строки из базы
         total = service_events.count_events(event_type=event_type)  # Считаем общее количество
         unread_important = service_events.count_unread_important()  # Считаем непрочитанные важные события
@@ -2032,8 +2814,8 @@ def build_dashboard_app(
         if mark_read_raw and str(mark_read_raw).lower() in {"1", "true", "yes"}:  # Проверяем, нужно ли отметить важные как прочитанные
             service_events.mark_important_read()  # Сбрасываем счётчик непрочитанных важных событий
             unread_important = 0  # Обновляем локальный счётчик после сброса
-        log_service_event(200, f"Отдаём сервисные логи type={event_type} лимит={limit} смещение={offset}")  # Фиксируем отдачу
-        return jsonify(  # Возвращаем JSON ответ
+        log_polled_event("service-logs", f"Отдаём сервисные логи type={event_type} лимит={limit} смещение={offset}")  # Панель сервисных логов опрашивается по таймеру
+        return json_response(  # Возвращаем JSON ответ
             {
                 "items": payload,  # Список событий
                 "total": total,  # Общее количество по текущему фильтру
@@ -2047,21 +2829,18 @@ def build_dashboard_app(
     def clear_service_logs():
         service_events.clear_events()  # Очищаем таблицу сервисных событий
         log_service_event(201, "Сервисные логи очищены через API")  # Фиксируем очистку
-        return jsonify({"status": "cleared"})  # Возвращаем подтверждение
+        return json_response({"status": "cleared"})  # Возвращаем подтверждение
 
     @app.route("/logs/full")
     def full_logs():
         peer_id_raw = request.args.get("peer_id")  # Читаем фильтр чата из адресной строки
-        peer_id = int(peer_id_raw) if peer_id_raw else None  # Преобразуем в число при наличии
-        logs_payload = [
-            serialize_log(row)
-            for row in event_logger.fetch_messages(peer_id=peer_id, limit=MESSAGES_PAGE_SIZE, offset=0)
-        ]  # Получаем стартовый список логов
+        peer_id = parse_optional_int(peer_id_raw)  # Преобразуем в число при наличии
+        logs_json = first_logs_page_json(peer_id, None, MESSAGES_PAGE_SIZE)  # Стартовая страница логов из кэша /api/logs
         service_logs_payload = [serialize_service_event(row) for row in service_events.fetch_events(limit=50)]  # Получаем стартовые сервисные логи
         log_service_event(200, f"Отдаём HTML со всеми логами peer_id={peer_id} без общего лимита")  # Фиксируем выдачу страницы логов
         return render_template(
             "logs.html",  # Шаблон страницы логов
-            initial_logs=logs_payload,  # Начальный список логов
+            initial_logs_json=embed_json(logs_json.decode("utf-8")),  # Начальная страница логов готовым JSON
             initial_peers=event_logger.list_peers(),  # Доступные чаты для фильтрации
             initial_peer_id=peer_id,  # Текущий выбранный чат
             initial_page_size=MESSAGES_PAGE_SIZE,  # Размер страницы для подгрузки
@@ -2070,19 +2849,27 @@ def build_dashboard_app(
 
     @app.route("/api/storage")
     def storage():
-        log_service_event(200, "Отдаём информацию о файле логов")  # Фиксируем успешную отдачу сведений о файле
-        return jsonify(assemble_storage())  # Возвращаем информацию о файле логов
+        log_polled_event("storage", "Отдаём информацию о файле логов")  # Сведения о файле опрашиваются по таймеру, пишем выборочно
+        built_at, body, etag = storage_cache  # Читаем кэш одной тройкой
+        if not built_at or time.monotonic() - built_at >= STORAGE_CACHE_TTL:  # Кэш пуст или устарел
+            body = json_bytes(assemble_storage())  # Обходим папку вложений не чаще раза в STORAGE_CACHE_TTL
+            etag = hashlib.blake2b(body, digest_size=8).hexdigest()  # Хэш готового JSON для ETag
+            storage_cache[:] = [time.monotonic(), body, etag]  # Запоминаем результат целиком
+        return conditional_json(body, etag)  # Возвращаем информацию о файле логов или 304
 
     return app  # Возвращаем готовое Flask-приложение
 
 
-def main() -> None:
+def build_from_env() -> Flask:
+    """Собирает дашборд и запускает лонгпулл по настройкам окружения; точка входа для WSGI-сервера."""
+
     global service_event_logger  # Сообщаем, что будем обновлять глобальный логгер сервисных событий
     settings = load_settings()  # Загружаем настройки окружения
-    service_event_logger = ServiceEventLogger(os.getenv("EVENT_DB", resolve_db_path()))  # Создаем логгер сервисных событий в базе
+    db_path = os.getenv("EVENT_DB", resolve_db_path())  # Путь к общей базе событий и сервисных событий
+    event_logger = EventLogger(db_path)  # Готовим логгер с путём из окружения или по умолчанию
+    service_event_logger = ServiceEventLogger(db_path, writer=event_logger)  # Сервисные события пишем через то же соединение и поток
     log_service_event(200, "Настройки окружения загружены")  # Фиксируем успешную загрузку настроек
     state = BotState()  # Создаем объект состояния
-    event_logger = EventLogger(os.getenv("EVENT_DB", resolve_db_path()))  # Готовим логгер с путём из окружения или по умолчанию
     demo_mode = settings.get("demo_mode", False)  # Проверяем, включен ли демо-режим
     if demo_mode:  # Если демо-режим включен
         payload = build_demo_payload(state, event_logger)  # Генерируем демо-данные и пишем их в базу
@@ -2094,25 +2881,59 @@ def main() -> None:
         logger.info("Используем ID сообщества: %s", settings["group_id"])  # Логируем ID сообщества
         log_service_event(200, f"Запускаем лонгпулл для сообщества {settings['group_id']}")  # Пишем сервисный лог о старте
         session = vk_api.VkApi(token=settings["token"])  # Создаем сессию VK API
-        try:  # Пробуем запросить профиль сообщества
-            group_info = fetch_group_profile(session, settings["group_id"])  # Получаем информацию о сообществе
-        except Exception as exc:  # Если запрос завершился ошибкой
-            logger.exception("Не удалось загрузить информацию о сообществе: %s", exc)  # Логируем подробности
-            log_service_event(500, "Ошибка загрузки информации о сообществе")  # Фиксируем ошибку получения профиля
-            group_info = {}  # Используем пустой словарь
-        try:  # Пробуем получить диалоги
-            conversations = fetch_recent_conversations(session)  # Запрашиваем список диалогов
-        except Exception as exc:  # Обрабатываем исключения VK API
-            logger.exception("Не удалось получить список диалогов: %s", exc)  # Логируем ошибку
-            log_service_event(500, "Ошибка загрузки списка диалогов")  # Записываем ошибку в сервисный лог
-            conversations = []  # Используем пустой список
-        monitor = BotMonitor(settings["token"], settings["group_id"], state, event_logger)  # Создаем монитор лонгпулла
-        monitor.start()  # Запускаем лонгпулл
-    app = build_dashboard_app(state, group_info, conversations, demo_mode, event_logger, service_event_logger)  # Создаем Flask-приложение
+        with ThreadPoolExecutor(max_workers=2) as executor:  # Профиль и диалоги независимы, запрашиваем их одновременно
+            group_future = executor.submit(fetch_group_profile, session, settings["group_id"])  # Запрос профиля сообщества
+            conversations_future = executor.submit(fetch_recent_conversations, session)  # Запрос списка диалогов
+            monitor = BotMonitor(settings["token"], settings["group_id"], state, event_logger)  # Создаем монитор лонгпулла
+            monitor.start()  # Лонгпулл не ждет стартовых запросов
+            try:  # Пробуем получить профиль сообщества
+                group_info = group_future.result()  # Получаем информацию о сообществе
+            except Exception as exc:  # Если запрос завершился ошибкой
+                logger.exception("Не удалось загрузить информацию о сообществе: %s", exc)  # Логируем подробности
+                log_service_event(500, "Ошибка загрузки информации о сообществе")  # Фиксируем ошибку получения профиля
+                group_info = {}  # Используем пустой словарь
+            try:  # Пробуем получить диалоги
+                conversations = conversations_future.result()  # Получаем список диалогов
+            except Exception as exc:  # Обрабатываем исключения VK API
+                logger.exception("Не удалось получить список диалогов: %s", exc)  # Логируем ошибку
+                log_service_event(500, "Ошибка загрузки списка диалогов")  # Записываем ошибку в сервисный лог
+                conversations = []  # Используем пустой список
+    return build_dashboard_app(state, group_info, conversations, demo_mode, event_logger, service_event_logger)  # Создаем Flask-приложение
+
+
+def serve_with_gunicorn(port: int) -> None:
+    """Запускает дашборд под gunicorn: один воркер с потоками, приложение собирается внутри воркера."""
+
+    class DashboardApplication(GunicornApplication):  # Встроенное приложение gunicorn без командной строки
+        def load_config(self) -> None:
+            settings = {"bind": f"0.0.0.0:{port}", "workers": 1, "worker_class": "gthread", "threads": 8}  # Один воркер, чтобы лонгпулл не дублировался, и потоки для запросов
+            for key, value in settings.items():  # Переносим настройки в конфиг gunicorn
+                self.cfg.set(key, value)  # Устанавливаем значение
+
+        def load(self) -> Flask:
+            app = build_from_env()  # Потоки лонгпулла и записи не переживают fork, поэтому собираем приложение в воркере
+            logger.info("Дашборд запущен под gunicorn на http://127.0.0.1:%s", port)  # Сообщаем адрес запуска
+            log_service_event(200, f"Дашборд поднят на порту {port} (gunicorn)")  # Фиксируем успешный старт веб-сервера
+            return app  # Отдаем WSGI-приложение воркеру
+
+    DashboardApplication().run()  # Запускаем мастер gunicorn, блокирует до остановки
+
+
+def main() -> None:
     port = int(os.getenv("PORT", "8000"))  # Определяем порт из окружения
+    if GunicornApplication is not None:  # На Linux и в Docker запускаем боевой сервер
+        load_settings()  # Проверяем настройки заранее, чтобы ошибка была видна до старта воркера
+        serve_with_gunicorn(port)  # Передаем управление gunicorn
+        return  # Сервер остановлен
+    app = build_from_env()  # Собираем приложение и запускаем лонгпулл
+    if waitress is not None:  # На Windows запускаем waitress вместо встроенного сервера
+        logger.info("Дашборд запущен под waitress на http://127.0.0.1:%s", port)  # Сообщаем адрес запуска
+        log_service_event(200, f"Дашборд поднят на порту {port} (waitress)")  # Фиксируем успешный старт веб-сервера
+        waitress.serve(app, host="0.0.0.0", port=port, threads=8)  # Пул из восьми потоков, как у gunicorn
+        return  # Сервер остановлен
     logger.info("Дашборд запущен на http://127.0.0.1:%s", port)  # Сообщаем адрес запуска
     log_service_event(200, f"Дашборд поднят на порту {port}")  # Фиксируем успешный старт веб-сервера
-    app.run(host="0.0.0.0", port=port)  # Запускаем сервер
+    app.run(host="0.0.0.0", port=port, threaded=True)  # Запускаем встроенный сервер для локального запуска
 
 
 if __name__ == "__main__":  # Точка входа
@@ -0,0 +1,93 @@
+import json  # Импортируем модуль для разбора JSON-ответов
+import os  # Импортируем os для удаления временного файла базы
+import tempfile  # Импортируем tempfile для создания временной базы
+import unittest  # Импортируем unittest для написания тестов
+from unittest.mock import patch  # Импортируем patch, чтобы стикеры не качались из сети
+
+import requests  # Импортируем requests для имитации сетевой ошибки
+
+from app import DEFAULT_TIMELINE_MINUTES, BotState, EventLogger, ServiceEventLogger, build_dashboard_app, build_demo_payload  # Импортируем логгеры и сборку дашборда
+
+
+class DashboardRoutesTest(unittest.TestCase):  # Проверяем JSON-маршруты дашборда в демо-режиме
+    def setUp(self) -> None:  # Подготовка перед тестом
+        self.temp_db = tempfile.NamedTemporaryFile(delete=False)  # Создаем временный файл базы
+        self.temp_db.close()  # Закрываем файл, чтобы SQLite мог использовать его
+        self.logger = EventLogger(self.temp_db.name)  # Логгер событий
+        self.service = ServiceEventLogger(self.temp_db.name, writer=self.logger)  # Сервисные события пишем через то же соединение
+        self.state = BotState()  # Состояние бота
+        payload = build_demo_payload(self.state, self.logger)  # Демо-данные, как при DEMO_MODE=1
+        app = build_dashboard_app(self.state, payload["group_info"], payload["conversations"], True, self.logger, self.service)  # Собираем дашборд
+        self.client = app.test_client()  # Тестовый клиент Flask
+        sticker_patch = patch("app.requests.get", side_effect=requests.ConnectionError("нет сети"))  # Стикер демо-сообщения не качаем
+        sticker_patch.start()  # Включаем подмену
+        self.addCleanup(sticker_patch.stop)  # Выключаем подмену после теста
+
+    def tearDown(self) -> None:  # Очистка после теста
+        self.logger.close()  # Закрываем логгер вместе с сервисным
+        os.unlink(self.temp_db.name)  # Удаляем временный файл базы
+
+    def log_message(self, message_id: int, text: str) -> None:  # Пишет новое сообщение в базу
+        self.logger.log_message({"id": message_id, "peer_id": 1, "from_id": 111, "text": text, "date": 1700000000})  # Ставим строку в очередь
+        self.logger.flush()  # Сразу записываем её
+
+    def test_json_endpoints_return_304_on_matching_etag(self):  # Совпавший ETag дает 304 без тела
+        for url in ("/api/stats", "/api/overview", "/api/storage"):  # Маршруты с условными ответами
+            first = self.client.get(url)  # Первый запрос
+            self.assertEqual((first.status_code, first.mimetype), (200, "application/json"))  # Обычный JSON-ответ
+            etag = first.headers["ETag"]  # ETag ответа
+            second = self.client.get(url, headers={"If-None-Match": etag})  # Повторный запрос с ETag
+            self.assertEqual((second.status_code, second.data), (304, b""))  # Тело не отправлено
+            other = self.client.get(url, headers={"If-None-Match": '"other"'})  # Чужой ETag
+            self.assertEqual(other.status_code, 200)  # Отдаем полный ответ
+
+    def test_stats_etag_changes_after_new_events(self):  # ETag статистики меняется вместе с состоянием
+        etag = self.client.get("/api/stats").headers["ETag"]  # ETag до событий
+        self.state.mark_events([], invites=1)  # Новое событие участников попадает в статистику
+        response = self.client.get("/api/stats", headers={"If-None-Match": etag})  # Старый ETag
+        self.assertEqual(response.status_code, 200)  # Статистика пересобрана
+        self.assertNotEqual(response.headers["ETag"], etag)  # ETag новый
+
+    def test_first_logs_page_cached_until_write(self):  # Первая страница логов берется из кэша, пока база не меняется
+        first = self.client.get("/api/logs")  # Первая страница
+        self.assertEqual([item["message_id"] for item in first.json["items"]], [2, 1])  # Демо-сообщения, новые первыми
+        self.assertEqual(self.client.get("/api/logs").data, first.data)  # Повтор отдает те же байты
+        self.log_message(3, "новое")  # Запись в базу
+        self.assertEqual([item["message_id"] for item in self.client.get("/api/logs").json["items"]], [3, 2, 1])  # Кэш сброшен записью
+
+    def test_logs_stream_page_with_offset(self):  # Дальняя страница отдается потоком
+        response = self.client.get("/api/logs?offset=1&limit=1")  # Вторая страница по одному сообщению
+        self.assertEqual(response.mimetype, "application/json")  # Тот же тип ответа
+        document = json.loads(response.data)  # Собранный из частей документ разбирается целиком
+        self.assertEqual([item["message_id"] for item in document["items"]], [1])  # Пропущено одно сообщение
+        self.assertEqual((document["offset"], document["peer_id"], document["from_id"]), (1, None, None))  # Параметры выборки
+
+    def test_raw_payload_and_missing_record(self):  # Сырой payload записи и 404 для неизвестного ID
+        record = self.client.get("/api/logs").json["items"][0]  # Последняя запись
+        raw = self.client.get(f"/api/logs/{record['id']}/raw")  # Запрашиваем её payload
+        self.assertEqual((raw.status_code, raw.mimetype), (200, "application/json"))  # JSON-ответ
+        self.assertEqual(raw.json["text"], "Еще одно демо")  # Сохраненный payload сообщения
+        missing = self.client.get("/api/logs/999999/raw")  # Неизвестная запись
+        self.assertEqual(missing.status_code, 404)  # Запись не найдена
+        self.assertEqual(missing.json, {"status": "not_found", "id": 999999})  # Тело ошибки
+
+    def test_bad_query_params_fall_back_to_defaults(self):  # Некорректные параметры не роняют API
+        logs = self.client.get("/api/logs?peer_id=abc&from_id=&limit=много&offset=-5")  # Мусор в параметрах
+        self.assertEqual(logs.status_code, 200)  # Ответ без ошибки
+        self.assertEqual((len(logs.json["items"]), logs.json["offset"], logs.json["peer_id"]), (2, 0, None))  # Фильтров нет, смещение нулевое
+        self.assertEqual(len(self.client.get("/api/logs?limit=0").json["items"]), 1)  # Лимит зажат снизу единицей
+        stats = self.client.get("/api/stats?range=abc")  # Некорректный диапазон
+        self.assertEqual(stats.json["range_minutes"], DEFAULT_TIMELINE_MINUTES)  # Берется диапазон по умолчанию
+        service = self.client.get("/api/service-logs?limit=-1&offset=x")  # Некорректная пагинация сервисных логов
+        self.assertEqual((service.json["limit"], service.json["offset"]), (1, 0))  # Значения зажаты в границы
+
+    def test_pages_embed_escaped_json(self):  # Встроенный в страницы JSON экранирован как |tojson
+        self.log_message(3, "</script><b>")  # Сообщение, ломающее <script> без экранирования
+        for url in ("/", "/logs/full"):  # Страницы со встроенными логами
+            page = self.client.get(url).get_data(as_text=True)  # HTML страницы
+            self.assertNotIn("</script><b>", page)  # Текст не закрывает скрипт
+            self.assertIn("\\u003c/script\\u003e\\u003cb\\u003e", page)  # Угловые скобки экранированы
+
+
+if __name__ == "__main__":  # Точка входа для запуска файла напрямую
+    unittest.main()  # Запускаем тестовый раннер
@@ -1,10 +1,16 @@
 import json  # Импортируем модуль для работы с JSON
 import os  # Импортируем os для удаления временного файла
+import sqlite3  # Импортируем sqlite3 для записи строк в обход логгера
 import tempfile  # Импортируем tempfile для создания временных файлов
+import threading  # Импортируем threading для удержания блокировки записи из другого потока
 import unittest  # Импортируем unittest для написания тестов
 from pathlib import Path  # Импортируем Path для работы с путями вложений
+from types import SimpleNamespace  # Импортируем SimpleNamespace для имитации событий лонгпулла
+from unittest.mock import MagicMock, patch  # Импортируем MagicMock и patch для подмены сессии VK и лонгпулла
 
-from app import BotMonitor, BotState, EventLogger  # Импортируем классы приложения для тестов
+import requests  # Импортируем requests для имитации сетевых ошибок
+
+from app import EVENTS_SCHEMA_VERSION, BotMonitor, BotState, EventLogger, ServiceEventLogger, VkBotEventType, unpack_json, zstandard  # Импортируем классы приложения, типы событий VK и распаковку JSON для тестов
 
 
 class EventLoggerAttachmentsTest(unittest.TestCase):  # Определяем тестовый класс для вложений
@@ -14,7 +20,7 @@ class EventLoggerAttachmentsTest(unittest.TestCase):  # Определяем т
         self.logger = EventLogger(self.temp_db.name)  # Создаем экземпляр логгера с временной базой
 
     def tearDown(self) -> None:  # Очистка после каждого теста
-        self.logger._connection.close()  # Закрываем соединение с базой
+        self.logger.close()  # Останавливаем фоновую запись и закрываем все соединения с базой
         os.unlink(self.temp_db.name)  # Удаляем временный файл базы
 
     def test_multiple_attachments_preserved(self):  # Тестируем, что сохраняется несколько вложений
@@ -30,10 +36,19 @@ class EventLoggerAttachmentsTest(unittest.TestCase):  # Определяем т
         self.logger.log_event("message", payload)  # Сохраняем событие с вложениями
         rows = self.logger.fetch_messages(limit=10)  # Загружаем строки из базы
         self.assertEqual(len(rows), 1)  # Проверяем, что записана одна строка
-        stored = json.loads(rows[0]["attachments"])  # Десериализуем вложения из базы
+        stored = json.loads(rows[0]["payload"])["attachments"]  # Вложения хранятся внутри payload
         self.assertEqual(len(stored), 2)  # Проверяем, что сохранились оба вложения
         self.assertEqual(stored[1]["url"], "http://example.com/2.jpg")  # Проверяем целостность второго вложения
 
+    @unittest.skipIf(zstandard is None, "модуль zstandard не установлен")  # Сжатие доступно только с модулем
+    def test_large_payload_stored_compressed(self):  # Проверяем, что большой payload сжимается и читается обратно
+        payload = {"peer_id": 1, "from_id": 123, "id": 100, "text": "длинный текст " * 100, "attachments": [{"type": "photo", "url": "http://example.com/1.jpg"}] * 20}  # Большое сообщение
+        self.logger.log_event("message", payload)  # Сохраняем событие
+        row = self.logger.fetch_messages(limit=1)[0]  # Читаем строку из базы
+        self.assertIsInstance(row["payload"], bytes)  # payload лежит сжатым BLOB
+        self.assertEqual(json.loads(unpack_json(row["payload"]))["attachments"], payload["attachments"])  # Вложения распаковываются без потерь
+        self.assertEqual(json.loads(self.logger.fetch_raw_payload(row["id"])), payload)  # Сырой payload отдается распакованным
+
     def test_serialize_log_keeps_many_attachments(self):  # Проверяем, что сериализация сохраняет все вложения
         payload = {  # Формируем тестовый payload с большим количеством вложений
             "peer_id": 5,  # ID чата для теста
@@ -46,7 +61,7 @@ class EventLoggerAttachmentsTest(unittest.TestCase):  # Определяем т
         }  # Завершили payload
         self.logger.log_event("message", payload)  # Сохраняем событие в базу
         row = self.logger.fetch_messages(limit=1)[0]  # Забираем свежую запись из базы
-        stored_attachments = json.loads(row["attachments"])  # Десериализуем вложения из базы
+        stored_attachments = json.loads(row["payload"])["attachments"]  # Вложения хранятся внутри payload
         self.assertEqual(len(stored_attachments), 9)  # Убеждаемся, что все девять вложений присутствуют
         self.assertTrue(all(att.get("url") for att in stored_attachments))  # Проверяем, что у каждого есть ссылка
 
@@ -73,6 +88,219 @@ class EventLoggerAttachmentsTest(unittest.TestCase):  # Определяем т
         self.assertEqual(len(nested_attachments), 1)  # Убеждаемся, что вложение репоста присутствует
 
 
+class EventLoggerBatchingTest(unittest.TestCase):  # Проверяем пакетную запись событий
+    def setUp(self) -> None:  # Подготовка перед тестом
+        self.temp_db = tempfile.NamedTemporaryFile(delete=False)  # Создаем временный файл базы
+        self.temp_db.close()  # Закрываем файл, чтобы SQLite мог использовать его
+        self.logger = EventLogger(self.temp_db.name)  # Создаем логгер событий
+
+    def tearDown(self) -> None:  # Очистка после теста
+        self.logger.close()  # Останавливаем фоновую запись и закрываем соединение
+        os.unlink(self.temp_db.name)  # Удаляем временный файл базы
+
+    def test_pending_events_flushed_in_one_batch(self):  # Проверяем, что очередь сбрасывается одной пачкой
+        self.logger._stop_event.set()  # Останавливаем фоновый поток, чтобы управлять сбросом вручную
+        self.logger._flush_wakeup.set()  # Будим поток, чтобы он завершился
+        self.logger._flusher.join(timeout=1)  # Ждем завершения потока
+        for idx in range(5):  # Пишем несколько событий подряд
+            self.logger.log_event("message", {"peer_id": 1, "from_id": 10, "id": idx})  # Кладем событие в очередь
+        self.assertEqual(len(self.logger._pending), 5)  # Убеждаемся, что события ждут в очереди
+        rows = self.logger.fetch_messages(limit=10)  # Чтение должно само дописать очередь
+        self.assertEqual(len(rows), 5)  # Проверяем, что все события попали в базу
+        self.assertEqual(len(self.logger._pending), 0)  # Очередь после сброса пуста
+
+    def test_close_flushes_queue_and_is_idempotent(self):  # Проверяем, что закрытие дописывает очередь и безопасно повторяется
+        self.logger._stop_event.set()  # Останавливаем фоновый поток, чтобы событие осталось в очереди
+        self.logger._flush_wakeup.set()  # Будим поток, чтобы он завершился
+        self.logger._flusher.join(timeout=1)  # Ждем завершения потока
+        self.logger.log_event("message", {"peer_id": 1, "from_id": 10, "id": 1})  # Кладем событие в очередь
+        self.logger.close()  # Закрываем логгер, как это сделает atexit
+        self.logger.close()  # Повторное закрытие не должно падать
+        self.logger = EventLogger(self.temp_db.name)  # Открываем базу заново
+        self.assertEqual(len(self.logger.fetch_messages(limit=10)), 1)  # Событие из очереди сохранилось
+
+    def test_peers_list_tracks_new_and_deleted_chats(self):  # Проверяем, что список чатов пополняется без перечитывания и сбрасывается при удалении
+        self.logger.log_event("message", {"peer_id": 2, "from_id": 10, "id": 1}, peer_title="Второй")  # Первый чат
+        self.assertEqual([peer["id"] for peer in self.logger.list_peers()], [2])  # Набор загружен из базы
+        self.logger.log_event("message", {"peer_id": 1, "from_id": 10, "id": 2}, peer_title="Первый")  # Новый чат приходит после загрузки
+        self.assertEqual([peer["title"] for peer in self.logger.list_peers()], ["Первый", "Второй"])  # Новый чат виден сразу и список отсортирован
+        record_id = self.logger.fetch_messages(peer_id=1, limit=1)[0]["id"]  # ID записи первого чата
+        self.logger.delete_message(record_id)  # Удаляем единственную запись чата
+        self.assertEqual([peer["id"] for peer in self.logger.list_peers()], [2])  # После удаления список перечитан из базы
+
+    def test_prune_keeps_only_newest_rows(self):  # Проверяем, что обрезка оставляет последние строки
+        self.logger.keep_rows = 3  # Храним три последних события
+        for idx in range(5):  # Пишем пять событий
+            self.logger.log_event("message", {"peer_id": 1, "from_id": 10, "id": idx})  # Кладем событие в очередь
+        self.assertEqual(self.logger.prune(), 2)  # Удалены два самых старых события
+        self.assertEqual([row["message_id"] for row in self.logger.fetch_messages(limit=10)], [4, 3, 2])  # Остались самые новые
+
+    def test_fast_message_path_matches_generic_row(self):  # Проверяем, что быстрый путь пишет ту же строку, что и общий
+        self.logger._stop_event.set()  # Останавливаем фоновый поток, чтобы сравнить строки в очереди
+        self.logger._flush_wakeup.set()  # Будим поток, чтобы он завершился
+        self.logger._flusher.join(timeout=1)  # Ждем завершения потока
+        messages = [  # Обычное сообщение и ответ с вложениями
+            {"id": 1, "date": 1700000000, "peer_id": 2000000001, "from_id": 5, "text": "привет", "attachments": []},  # Сообщение без ответа
+            {"id": 2, "date": 1700000001, "peer_id": 5, "from_id": -7, "text": "ответ", "attachments": [{"type": "photo"}], "reply_message": {"id": 1, "from_id": 5, "text": "привет", "attachments": [{"type": "doc"}], "from_name": "Иван"}},  # Ответ бота
+        ]
+        for message in messages:  # Пишем каждое сообщение двумя путями
+            self.logger.log_event("message", message, peer_title="Чат", from_name="Автор")  # Общий путь
+            self.logger.log_message(message, peer_title="Чат", from_name="Автор")  # Быстрый путь
+            generic_row, fast_row = self.logger._pending.popleft(), self.logger._pending.popleft()  # Забираем обе строки из очереди
+            self.assertEqual(fast_row, generic_row)  # Строки должны совпасть колонка в колонку
+
+    def test_reply_columns_backfilled_from_payload(self):  # Проверяем перенос полей ответа из payload старых строк
+        self.logger.close()  # Закрываем логгер, чтобы записать строки в обход него
+        with sqlite3.connect(self.temp_db.name) as connection:  # Пишем строки так, как их оставила старая версия
+            payload = json.dumps({"reply_message": {"id": 7, "text": "исходное", "from_id": 5, "attachments": [{"type": "doc"}]}})  # Ответ лежит только в payload
+            connection.execute("INSERT INTO events (created_at, event_type, payload) VALUES ('2024-01-01T00:00:00', 'message', ?)", (payload,))  # Строка без колонок ответа
+            connection.execute("INSERT INTO events (created_at, event_type, payload) VALUES ('2024-01-01T00:00:01', 'message', '{битый')")  # Некорректный JSON не должен ронять миграцию
+            connection.execute("PRAGMA user_version=0")  # Старые базы не знают о версии схемы
+        self.logger = EventLogger(self.temp_db.name)  # Повторное открытие запускает миграцию
+        broken, migrated = self.logger.fetch_messages(limit=10)  # Лента идет от новых строк к старым
+        self.assertEqual((migrated["reply_message_id"], migrated["reply_message_text"], migrated["reply_message_from_id"]), (7, "исходное", 5))  # Поля ответа перенесены
+        self.assertEqual(json.loads(migrated["reply_message_attachments"]), [{"type": "doc"}])  # Вложения ответа перенесены JSON-списком
+        self.assertIsNone(broken["reply_message_id"])  # Строка с битым payload осталась как была
+        self.assertEqual(self.logger._connection.execute("PRAGMA user_version").fetchone()[0], EVENTS_SCHEMA_VERSION)  # Следующий старт пропустит миграцию
+
+    def test_reads_do_not_wait_for_write_lock(self):  # Проверяем, что чтение идет мимо блокировки записи
+        self.logger._stop_event.set()  # Останавливаем фоновый поток, чтобы второе событие точно осталось в очереди
+        self.logger._flush_wakeup.set()  # Будим поток, чтобы он завершился
+        self.logger._flusher.join(timeout=1)  # Ждем завершения потока
+        self.logger.log_event("message", {"peer_id": 3, "from_id": 10, "id": 1})  # Пишем событие
+        self.logger.flush()  # Сразу сбрасываем его в базу
+        self.logger.list_peers()  # Загружаем набор чатов, дальше его пополняет log_many
+        self.logger.log_event("message", {"peer_id": 3, "from_id": 10, "id": 2})  # Второе событие остается в очереди
+        locked, release = threading.Event(), threading.Event()  # Сигналы для потока, держащего запись
+
+        def hold_write_lock() -> None:  # Держим блокировку записи из другого потока, как длинная транзакция
+            with self.logger._lock:  # Берем блокировку записи
+                locked.set()  # Сообщаем, что блокировка взята
+                release.wait(5)  # Держим её, пока тест не отпустит
+
+        result: dict = {}  # Сюда поток чтения кладет результат
+
+        def read() -> None:  # Чтение в отдельном потоке, чтобы зависание не повесило тесты
+            result["rows"] = self.logger.fetch_messages(peer_id=3)  # Читаем ленту чата через пул соединений
+            result["peers"] = self.logger.list_peers()  # Читаем список чатов через пул соединений
+
+        holder = threading.Thread(target=hold_write_lock, daemon=True)  # Поток записи
+        holder.start()  # Захватываем блокировку
+        self.assertTrue(locked.wait(1))  # Блокировка взята до чтения
+        reader = threading.Thread(target=read, daemon=True)  # Поток чтения
+        reader.start()  # Читаем при занятой записи
+        reader.join(0.5)  # Чтение должно уложиться в долю секунды
+        finished = not reader.is_alive()  # Запоминаем, успело ли чтение
+        release.set()  # Отпускаем запись
+        holder.join(1)  # Ждем поток записи
+        self.assertTrue(finished)  # Чтение не ждало блокировку записи
+        self.assertEqual([row["message_id"] for row in result["rows"]], [1])  # Видно уже записанное, очередь допишет поток сброса
+        self.assertEqual([peer["id"] for peer in result["peers"]], [3])  # Чат попал в список
+        self.logger.flush()  # После освобождения записи очередь дописывается
+        self.assertEqual(len(self.logger.fetch_messages(peer_id=3)), 2)  # Отложенное событие не потерялось
+
+    def test_unloaded_peers_include_chat_queued_while_write_locked(self):  # Загрузка набора чатов при занятой записи не теряет чат из очереди
+        self.logger._stop_event.set()  # Останавливаем фоновый поток, чтобы событие осталось в очереди
+        self.logger._flush_wakeup.set()  # Будим поток, чтобы он завершился
+        self.logger._flusher.join(timeout=1)  # Ждем завершения потока
+        self.assertIsNone(self.logger._peer_keys)  # Набор чатов еще не загружен
+        self.logger.log_event("message", {"peer_id": 5, "from_id": 10, "id": 1})  # Новый чат ждет в очереди
+        locked, release = threading.Event(), threading.Event()  # Сигналы для потока, держащего запись
+
+        def hold_write_lock() -> None:  # Держим блокировку записи из другого потока
+            with self.logger._lock:  # Берем блокировку записи
+                locked.set()  # Сообщаем, что блокировка взята
+                release.wait(5)  # Держим её, пока тест не отпустит
+
+        result: dict = {}  # Сюда поток чтения кладет результат
+
+        def read() -> None:  # Загрузка набора чатов в отдельном потоке
+            result["peers"] = self.logger.list_peers()  # Читаем список чатов
+
+        holder = threading.Thread(target=hold_write_lock, daemon=True)  # Поток записи
+        holder.start()  # Захватываем блокировку
+        self.assertTrue(locked.wait(1))  # Блокировка взята до чтения
+        reader = threading.Thread(target=read, daemon=True)  # Поток чтения
+        reader.start()  # Загружаем набор при занятой записи
+        reader.join(0.2)  # Даем загрузке дойти до базы, пока запись занята
+        release.set()  # Отпускаем запись
+        holder.join(1)  # Ждем поток записи
+        reader.join(5)  # Ждем загрузку набора
+        self.assertEqual([peer["id"] for peer in result["peers"]], [5])  # Чат из очереди попал в список
+        self.assertEqual([peer["id"] for peer in self.logger.list_peers()], [5])  # И остался в загруженном наборе
+
+
+class ServiceEventLoggerBatchingTest(unittest.TestCase):  # Проверяем пакетную запись сервисных событий
+    def setUp(self) -> None:  # Подготовка перед тестом
+        self.temp_db = tempfile.NamedTemporaryFile(delete=False)  # Создаем временный файл базы
+        self.temp_db.close()  # Закрываем файл, чтобы SQLite мог использовать его
+        self.logger = ServiceEventLogger(self.temp_db.name)  # Создаем логгер сервисных событий
+
+    def tearDown(self) -> None:  # Очистка после теста
+        self.logger.close()  # Останавливаем фоновую запись и закрываем соединение
+        os.unlink(self.temp_db.name)  # Удаляем временный файл базы
+
+    def test_queued_events_visible_to_reads_and_kept_on_close(self):  # Очередь видна чтению и дописывается при закрытии
+        self.logger._stop_event.set()  # Останавливаем фоновый поток, чтобы события остались в очереди
+        self.logger._flush_wakeup.set()  # Будим поток, чтобы он завершился
+        self.logger._flusher.join(timeout=1)  # Ждем завершения потока
+        self.logger.log_event(500, "Ошибка сервера", "первая")  # Кладем событие в очередь
+        self.logger.log_event(404, "Не найдено", "вторая")  # Кладем второе событие
+        self.assertEqual(len(self.logger._pending), 2)  # Оба события ждут пакетной вставки
+        self.assertEqual(self.logger.count_unread_important(), 2)  # Чтение само дописывает очередь
+        self.logger.log_event(200, "OK", "третья")  # Событие, которое допишет только закрытие
+        self.logger.close()  # Закрываем логгер, как это сделает atexit
+        self.logger = ServiceEventLogger(self.temp_db.name)  # Открываем базу заново
+        self.assertEqual([row["message"] for row in self.logger.fetch_events()], ["третья", "вторая", "первая"])  # Все события сохранились по порядку
+
+    def test_counts_follow_writes_and_clear(self):  # Счетчики по типам пополняются записью и сбрасываются очисткой
+        self.logger.log_event(500, "Ошибка сервера", "ошибка")  # Ошибка
+        self.assertEqual(self.logger.count_events("important"), 1)  # Счетчики загружены из базы
+        self.logger.log_event(404, "Не найдено", "предупреждение")  # Предупреждение после загрузки
+        self.logger.log_event(200, "OK", "инфо")  # Информационное событие
+        self.assertEqual((self.logger.count_events(), self.logger.count_events("important"), self.logger.count_events("info")), (3, 2, 1))  # Новые события учтены без перечитывания
+        self.logger.clear_events()  # Очищаем журнал
+        self.assertEqual(self.logger.count_events(), 0)  # Счетчики сброшены
+
+    def test_counts_loaded_right_after_commit_not_doubled(self):  # Загрузка счетчиков сразу после коммита пачки не учитывает её дважды
+        self.logger._stop_event.set()  # Останавливаем фоновый поток, пачку запишем сами
+        self.logger._flush_wakeup.set()  # Будим поток, чтобы он завершился
+        self.logger._flusher.join(timeout=1)  # Ждем завершения потока
+        logger = self.logger  # Короткая ссылка для прокси
+        seen: list = []  # Сюда прокси кладет результат чтения
+
+        class CountAfterCommit:  # Соединение, которое читает счетчики между коммитом и обновлением кэша
+            def __init__(self, connection):  # Оборачиваем настоящее соединение
+                self.connection = connection  # Сохраняем его
+
+            def __getattr__(self, name):  # Остальные вызовы отдаем соединению
+                return getattr(self.connection, name)  # Делегируем
+
+            def commit(self):  # Коммит пачки
+                self.connection.commit()  # Фиксируем транзакцию
+                seen.append(logger.count_events())  # Читаем счетчики, пока пачка еще не учтена в кэше
+
+        self.logger.log_event(500, "Ошибка сервера", "ошибка")  # Кладем событие в очередь
+        connection = self.logger._connection  # Настоящее соединение записи
+        self.logger._connection = CountAfterCommit(connection)  # Подменяем его прокси
+        try:  # Пишем пачку через прокси
+            with self.logger._lock:  # Запись идет под блокировкой, как в потоке сброса
+                self.logger._write_pending()  # Пишем очередь
+        finally:  # Возвращаем соединение для закрытия
+            self.logger._connection = connection  # Настоящее соединение
+        self.assertEqual(seen, [1])  # Чтение увидело записанную строку
+        self.assertEqual(self.logger.count_events(), 1)  # Строка учтена один раз
+
+    def test_shared_writer_uses_event_logger_connection(self):  # Сервисный логгер может писать через соединение логгера событий
+        events = EventLogger(self.temp_db.name)  # Логгер событий владеет единственным соединением записи
+        shared = ServiceEventLogger(self.temp_db.name, writer=events)  # Сервисный логгер поверх него
+        self.assertIs(shared._connection, events._connection)  # Соединение общее
+        shared.log_event(500, "Ошибка сервера", "общая")  # Кладем событие в очередь
+        events.close()  # Закрытие владельца дописывает и сервисную очередь
+        self.assertTrue(shared._closed)  # Сервисный логгер закрыт вместе с владельцем
+        self.assertEqual(self.logger.count_events("error"), 1)  # Событие видно через отдельное соединение
+
+
 class DummySession:  # Определяем поддельную сессию VK для теста гидрации
     def method(self, name: str, params: dict):  # Метод имитирует вызовы VK API
         return {  # Возвращаем фиксированный ответ с полным набором вложений
@@ -106,7 +334,7 @@ class BotMonitorHydrationTest(unittest.TestCase):  # Тестовый класс
         self.monitor.session = DummySession()  # Подменяем сессию VK на поддельную
 
     def tearDown(self) -> None:  # Очистка после теста
-        self.logger._connection.close()  # Закрываем соединение с базой
+        self.logger.close()  # Останавливаем фоновую запись и закрываем все соединения с базой
         os.unlink(self.temp_db.name)  # Удаляем временный файл базы
 
     def test_hydrate_message_loads_all_attachments(self):  # Проверяем, что догрузка заменяет усеченные вложения
@@ -132,7 +360,7 @@ class BotMonitorAttachmentDedupTest(unittest.TestCase):  # Тестируем у
         self.monitor.attachments_dir.mkdir(parents=True, exist_ok=True)  # Убеждаемся, что папка существует
 
     def tearDown(self) -> None:  # Очистка после теста
-        self.logger._connection.close()  # Закрываем соединение с базой
+        self.logger.close()  # Останавливаем фоновую запись и закрываем все соединения с базой
         os.unlink(self.temp_db.name)  # Удаляем временный файл базы
         self.temp_dir.cleanup()  # Удаляем временную директорию вложений
 
@@ -194,7 +422,7 @@ class BotMonitorConversationHydrationTest(unittest.TestCase):  # Тестиру
         self.monitor.session = DummySessionConversation()  # Подменяем сессию на поддельную
 
     def tearDown(self) -> None:  # Очистка после теста
-        self.logger._connection.close()  # Закрываем соединение с базой
+        self.logger.close()  # Останавливаем фоновую запись и закрываем все соединения с базой
         os.unlink(self.temp_db.name)  # Удаляем временный файл базы
 
     def test_conversation_hydration_restores_all_photos(self):  # Проверяем, что догрузка по conversation_message_id возвращает все вложения
@@ -210,5 +438,144 @@ class BotMonitorConversationHydrationTest(unittest.TestCase):  # Тестиру
         self.assertEqual(attachments[2].get("url"), "http://example.com/full3.jpg")  # Проверяем, что третье вложение доступно
 
 
+class BotMonitorProfilesTest(unittest.TestCase):  # Проверяем пакетную загрузку профилей авторов
+    def setUp(self) -> None:  # Подготовка перед тестом
+        self.temp_db = tempfile.NamedTemporaryFile(delete=False)  # Создаем временный файл базы
+        self.temp_db.close()  # Закрываем файл, чтобы SQLite мог использовать его
+        self.logger = EventLogger(self.temp_db.name)  # Создаем логгер событий
+        self.monitor = BotMonitor("token", 1, BotState(), self.logger)  # Создаем монитор
+        self.monitor.session = MagicMock()  # Подменяем сессию VK, чтобы не ходить в сеть
+
+    def tearDown(self) -> None:  # Очистка после теста
+        self.logger.close()  # Останавливаем фоновую запись и закрываем все соединения с базой
+        os.unlink(self.temp_db.name)  # Удаляем временный файл базы
+
+    def test_authors_loaded_with_single_users_get(self):  # Отправитель, автор ответа и автор репоста грузятся одним вызовом
+        self.monitor.session.method.return_value = [  # Ответ users.get сразу на троих
+            {"id": 1, "first_name": "Анна", "last_name": "А", "photo_50": "a.jpg"},  # Отправитель
+            {"id": 2, "first_name": "Борис", "last_name": "Б", "photo_50": "b.jpg"},  # Автор ответа
+            {"id": 3, "first_name": "Вера", "last_name": "В", "photo_50": "c.jpg"},  # Автор репоста
+        ]
+        message = {"from_id": 1, "reply_message": {"from_id": 2}, "copy_history": [{"from_id": 3}]}  # Сообщение с ответом и репостом
+        self.monitor._prefetch_profiles(self.monitor._collect_author_ids(message))  # Загружаем профили пачкой
+        self.assertEqual(self.monitor.session.method.call_count, 1)  # К VK ушел один запрос
+        self.assertEqual(self.monitor._resolve_sender_profile(2)["name"], "Борис Б")  # Профиль берется из кэша
+        self.assertEqual(self.monitor.session.method.call_count, 1)  # Повторных запросов нет
+
+    def test_new_user_in_new_chat_resolved_with_single_execute(self):  # Первая встреча пары пользователь+беседа стоит одного запроса
+        self.monitor.session.method.return_value = {  # Ответ execute с обоими профилями
+            "u": [{"id": 1, "first_name": "Анна", "last_name": "А", "photo_50": "a.jpg"}],  # Профиль пользователя
+            "c": {"items": [{"chat_settings": {"title": "Беседа", "photo": {"photo_50": "chat.jpg"}}}]},  # Профиль беседы
+        }
+        self.monitor._prefetch_sender_and_chat(1, 2000000001)  # Загружаем оба профиля
+        self.assertEqual(self.monitor.session.method.call_args[0][0], "execute")  # Использован метод execute
+        self.assertEqual(self.monitor._resolve_sender_profile(1)["name"], "Анна А")  # Профиль пользователя в кэше
+        self.assertEqual(self.monitor._resolve_peer_profile(2000000001, None), {"title": "Беседа", "avatar": "chat.jpg"})  # Профиль беседы в кэше
+        self.assertEqual(self.monitor.session.method.call_count, 1)  # Других запросов не было
+
+    def test_batch_profiles_loaded_once_per_type(self):  # Профили всей пачки лонгпулла грузятся одним запросом на тип
+        def answer(method, params):  # Поддельные ответы VK по имени метода
+            if method == "users.get":  # Все авторы пачки
+                return [{"id": user_id, "first_name": f"Имя{user_id}", "last_name": ""} for user_id in map(int, params["user_ids"].split(","))]  # Профили запрошенных пользователей
+            return {"items": [{"peer": {"id": peer_id}, "chat_settings": {"title": f"Беседа {peer_id}"}} for peer_id in map(int, params["peer_ids"].split(","))]}  # Профили запрошенных бесед
+
+        self.monitor.session.method.side_effect = answer  # Подменяем ответы VK
+        messages = [{"from_id": 5, "peer_id": 2000000001}, {"from_id": 6, "peer_id": 2000000002, "reply_message": {"from_id": 7}}]  # Два сообщения из разных бесед
+        self.monitor._prefetch_batch(messages)  # Загружаем профили пачки
+        self.assertEqual([call[0][0] for call in self.monitor.session.method.call_args_list], ["users.get", "messages.getConversationsById"])  # По одному запросу на тип
+        for message in messages:  # Обычный путь сообщения
+            self.monitor._prefetch_sender_and_chat(message["from_id"], message["peer_id"])  # Профили уже в кэше
+        self.assertEqual(self.monitor._resolve_peer_profile(2000000002, None)["title"], "Беседа 2000000002")  # Беседа взята из кэша
+        self.assertEqual(self.monitor._resolve_sender_profile(7)["name"], "Имя7")  # Автор ответа взят из кэша
+        self.assertEqual(self.monitor.session.method.call_count, 2)  # Новых запросов не было
+
+    def test_batch_untitled_chat_named_after_sender(self):  # Беседа без названия из пачки получает имя отправителя, как на обычном пути
+        def answer(method, params):  # Поддельные ответы VK по имени метода
+            if method == "users.get":  # Все авторы пачки
+                return [{"id": user_id, "first_name": f"Имя{user_id}", "last_name": ""} for user_id in map(int, params["user_ids"].split(","))]  # Профили запрошенных пользователей
+            return {"items": [{"peer": {"id": 2000000001}, "chat_settings": {}}, {"peer": {"id": 2000000002}, "chat_settings": {"title": "Беседа"}}]}  # Первая беседа без названия
+
+        self.monitor.session.method.side_effect = answer  # Подменяем ответы VK
+        self.monitor._prefetch_batch([{"from_id": 5, "peer_id": 2000000001}, {"from_id": 6, "peer_id": 2000000002}])  # Загружаем профили пачки
+        self.assertEqual(self.monitor._resolve_peer_profile(2000000001, "Имя5")["title"], "Имя5")  # Название взято из имени отправителя
+        self.assertEqual(self.monitor.session.method.call_count, 2)  # Беседа закэширована, повторного запроса нет
+
+    def test_profile_cache_evicts_least_recently_used(self):  # Кэш профилей вытесняет давно не встречавшихся
+        with patch("app.PROFILE_CACHE_LIMIT", 2):  # Маленький лимит для теста
+            self.monitor._remember(self.monitor.user_cache, 1, {"name": "Анна", "avatar": None})  # Первый профиль
+            self.monitor._remember(self.monitor.user_cache, 2, {"name": "Борис", "avatar": None})  # Второй профиль
+            self.monitor._resolve_sender_profile(1)  # Первый пользователь снова пишет
+            self.monitor._remember(self.monitor.user_cache, 3, {"name": "Вера", "avatar": None})  # Третий профиль вытесняет одного
+        self.assertEqual(list(self.monitor.user_cache), [1, 3])  # Вытеснен Борис, а не активная Анна
+
+    def test_longpoll_batch_updates_state_once(self):  # Пачка событий одного ответа лонгпулла учитывается одним обновлением
+        monitor = self.monitor  # Короткая ссылка на монитор
+        monitor._hydrate_message_details = lambda message: dict(message)  # Не ходим в API за полной версией сообщения
+        monitor.session.method.return_value = []  # Профили не находятся
+        batch = [  # Два сообщения и прочее событие в одной пачке
+            SimpleNamespace(type=VkBotEventType.MESSAGE_NEW, object=SimpleNamespace(message={"id": 1, "date": 1700000000, "peer_id": 2000000001, "from_id": 5, "text": "раз"})),  # Первое сообщение
+            SimpleNamespace(type=VkBotEventType.MESSAGE_NEW, object=SimpleNamespace(message={"id": 2, "date": 1700000001, "peer_id": 2000000001, "from_id": 6, "text": "два"})),  # Второе сообщение
+            SimpleNamespace(type=VkBotEventType.GROUP_JOIN, object=SimpleNamespace()),  # Прочее событие
+        ]
+
+        class FakeLongPoll:  # Лонгпулл, который отдает одну пачку и останавливает монитор
+            def __init__(self, session, group_id):  # Повторяем сигнатуру VkBotLongPoll
+                pass  # Параметры не нужны
+
+            def check(self):  # Один запрос к серверу
+                monitor.stop()  # Следующего запроса не будет
+                return batch  # Отдаем всю пачку
+
+        with patch("app.VkBotLongPoll", FakeLongPoll):  # Подменяем лонгпулл
+            monitor._listen()  # Обрабатываем одну пачку
+        self.assertEqual(monitor.state.total_events, 3)  # Учтены все события пачки
+        self.assertEqual(monitor.state.new_messages, 2)  # Учтены оба сообщения
+        self.assertEqual(monitor.state.errors, 0)  # Прочее событие не считается ошибкой
+        self.assertEqual(monitor.state.version, 1)  # Состояние обновлено один раз
+        self.assertEqual([row["text"] for row in self.logger.fetch_messages()], ["два", "раз"])  # Оба сообщения записаны в базу
+
+    def test_longpoll_survives_batch_processing_error(self):  # Сбой обработки пачки не останавливает поток лонгпулла
+        monitor = self.monitor  # Короткая ссылка на монитор
+        monitor._prefetch_batch = MagicMock(side_effect=RuntimeError("сбой"))  # Подготовка пачки падает
+        batch = [SimpleNamespace(type=VkBotEventType.GROUP_JOIN, object=SimpleNamespace())]  # Любая пачка
+        calls = []  # Запросы к серверу лонгпулла
+
+        class FakeLongPoll:  # Лонгпулл, который отдает две пачки и останавливает монитор
+            def __init__(self, session, group_id):  # Повторяем сигнатуру VkBotLongPoll
+                pass  # Параметры не нужны
+
+            def check(self):  # Один запрос к серверу
+                calls.append(1)  # Считаем запросы
+                if len(calls) == 2:  # Вторая пачка последняя
+                    monitor.stop()  # Следующего запроса не будет
+                return batch  # Отдаем пачку
+
+        with patch("app.VkBotLongPoll", FakeLongPoll):  # Подменяем лонгпулл
+            monitor._listen()  # Обрабатываем пачки
+        self.assertEqual(len(calls), 2)  # После сбоя поток запросил следующую пачку
+        self.assertEqual(monitor.state.errors, 2)  # Каждый сбой учтен как ошибка
+
+    def test_network_error_reconnects_longpoll(self):  # Сетевой сбой пересоздает лонгпулл и не считается ошибкой обработки
+        monitor = self.monitor  # Короткая ссылка на монитор
+        monitor._backoff = lambda attempt: None  # Не ждем паузу в тесте
+        created = []  # Сколько раз создавался лонгпулл
+
+        class FlakyLongPoll:  # Лонгпулл, первый экземпляр которого теряет связь
+            def __init__(self, session, group_id):  # Повторяем сигнатуру VkBotLongPoll
+                created.append(self)  # Запоминаем создание
+
+            def check(self):  # Один запрос к серверу
+                if len(created) == 1:  # Первый экземпляр
+                    raise requests.ConnectionError("нет сети")  # Имитируем обрыв соединения
+                monitor.stop()  # После переподключения завершаем цикл
+                return []  # Пустая пачка
+
+        with patch("app.VkBotLongPoll", FlakyLongPoll):  # Подменяем лонгпулл
+            monitor._listen()  # Запускаем цикл до остановки
+        self.assertEqual(len(created), 2)  # Лонгпулл пересоздан после сбоя
+        self.assertEqual(monitor.state.reconnects, 1)  # Переподключение учтено
+        self.assertEqual(monitor.state.errors, 0)  # Ошибкой обработки сбой сети не считается
+
+
 if __name__ == "__main__":  # Точка входа для запуска файла напрямую
     unittest.main()  # Запускаем тестовый раннер
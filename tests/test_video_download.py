@@ -21,7 +21,7 @@ class BotMonitorVideoDownloadTest(unittest.TestCase):  # Определяем н
         self.monitor.session = MagicMock()  # Подменяем сессию VK API на заглушку, чтобы не ходить в сеть
 
     def tearDown(self) -> None:  # Очищаем временные ресурсы после каждого теста
-        self.logger._connection.close()  # Закрываем соединение с временной базой
+        self.logger.close()  # Останавливаем фоновую запись и закрываем все соединения с временной базой
         os.unlink(self.temp_db.name)  # Удаляем файл базы
         self.temp_dir.cleanup()  # Удаляем временную директорию вложений
 